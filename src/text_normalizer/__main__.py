@@ -1,13 +1,11 @@
-import json
 import sys
 from functools import partial
-from itertools import chain
 
 from . import stemming
 from . import tokenization
 from . import config
 from .api.cli.args import parse_normalization_args
-from .normalization import analyze, compose_pipeline
+from .normalization import analyze
 
 if __name__ == "__main__":
     args = parse_normalization_args()
@@ -17,20 +15,22 @@ if __name__ == "__main__":
     config.init_cache()
 
     pl_args = [el for el in stemming.Pipeline if getattr(args, el.value)]
-    pipeline = partial(stemming.pipeline, pipe=compose_pipeline(*pl_args))
-    converter = stemming.to_tuple if args.fmt == 'tuple' else stemming.to_dict
+    # граммемы, не входящие в результат, разбираются только по требованию этапов пайплайна
+    pipeline = partial(stemming.pipeline_plan(*pl_args), lazy='grammem' not in args.fields)
+    serializer = stemming.StemSerializer(args.fmt, args.fields)
+    output = sys.stdout.buffer
 
-    with stemming.jstem_ctx() as stemmer:
-        mapped_pipeline = lambda analysis_result: map(converter, pipeline(analysis_result))
+    with stemming.jstem_shared_ctx() as stemmer:
         analysis = partial(analyze, stemmer=stemmer)
 
         if sys.stdin.isatty():
-            sys.stdout.write(json.dumps(list(mapped_pipeline(analysis(args.sentence))), ensure_ascii=False))
-            sys.stdout.write("\n")
+            output.write(serializer.array(pipeline(analysis(args.sentence))))
+            output.write(b"\n")
         else:
-            for result in chain(*map(lambda s: mapped_pipeline(analysis(s)), sys.stdin)):
-                sys.stdout.write(json.dumps(result, ensure_ascii=False))
-                sys.stdout.write('\n')
+            for sentence in sys.stdin:
+                output.write(serializer.lines(pipeline(analysis(sentence))))
+
+        output.flush()
 
     tokenization.cache_clear()
     stemming.cache_clear()
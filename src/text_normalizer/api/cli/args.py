@@ -1,12 +1,14 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
 from collections import namedtuple
+from typing import Tuple
 
-from text_normalizer.stemming import Pipeline
+from text_normalizer.stemming import Pipeline, STEM_FIELDS
 
 __all__ = ['parse_normalization_args']
 
 
-NormalizationArgs = namedtuple('NormalizationArgs', ['sentence', 'fmt', *[p.value for p in Pipeline]])
+NormalizationArgs = namedtuple('NormalizationArgs', ['sentence', 'fmt', *[p.value for p in Pipeline], 'fields'])
+NormalizationArgs.__new__.__defaults__ = (STEM_FIELDS,)
 
 PIPELINE_ARGS = {
     Pipeline.WORD2NUM: 'Конвертация имен числительных в числа и цифры',
@@ -18,6 +20,16 @@ PIPELINE_ARGS = {
 }
 
 
+def _fields(value: str) -> Tuple[str, ...]:
+    fields = tuple(f.strip() for f in value.split(',') if f.strip())
+    unknown = set(fields).difference(STEM_FIELDS)
+
+    if not fields or unknown:
+        raise ArgumentTypeError(f'Поля результата должны быть из списка: {",".join(STEM_FIELDS)}')
+
+    return fields
+
+
 def parse_normalization_args(args=None) -> NormalizationArgs:
     """Парсинг аргументов из командной строки"""
     parser = ArgumentParser()
@@ -29,6 +41,8 @@ def parse_normalization_args(args=None) -> NormalizationArgs:
 
     parser.add_argument('--all', action='store_true', help='Применить все опции пайплайна')
     parser.add_argument('--fmt', type=str, default='tuple', choices=['dict', 'tuple'], help='Форматирование результата')
+    parser.add_argument('--fields', type=_fields, default=STEM_FIELDS,
+                        help=f'Поля результата через запятую (по-умолчанию: {",".join(STEM_FIELDS)})')
     parser.add_argument('sentence', type=str, default='', nargs='?', help='Строка для нормализации')
 
     ns = parser.parse_args(args)
@@ -39,4 +53,4 @@ def parse_normalization_args(args=None) -> NormalizationArgs:
     all_pipeline = False if any(pipeline_args) else ns.all
     pipeline_args = [True] * len(Pipeline) if all_pipeline else pipeline_args
 
-    return NormalizationArgs(ns.sentence, ns.fmt, *pipeline_args)
+    return NormalizationArgs(ns.sentence, ns.fmt, *pipeline_args, ns.fields)
@@ -1,5 +1,6 @@
 """Модуль для работы с сервером нормализации"""
 
+import json
 import logging
 from contextlib import contextmanager
 from functools import lru_cache
@@ -56,6 +57,9 @@ class TextNormalizerProxy:
                 # ждем данные от нормализатора с таймаутом или отпускаем блок
                 if self._conn.poll(timeout=self._timeout):
                     result = self._conn.recv()
+                    # сервер, запущенный с `RTN_JSON`, передает результат в виде JSON: картежи становятся списками
+                    if isinstance(result, bytes):
+                        result = json.loads(result)
                     if result:
                         return result
 
@@ -7,7 +7,7 @@ from functools import partial
 from multiprocessing import Pool, cpu_count
 from multiprocessing.connection import Connection, Listener
 from time import process_time, time
-from typing import Callable, Iterator
+from typing import Callable, Iterator, Optional
 
 import text_normalizer as tn
 from text_normalizer import stemming, tokenization, normalization, config, settings
@@ -19,23 +19,47 @@ _PORT = int(os.environ.get('RTN_PORT', 3000))
 _WORKERS = int(os.environ.get('RTN_WORKERS', cpu_count()))
 _RTN_CONNECTION_LIFE_TIME = int(os.environ.get('RTN_CONNECTION_LIFE_TIME', 300))  # seconds
 _PROFILER = int(os.environ.get('CP_ENABLED', 0))
+# передача результата клиенту в виде JSON (см. `StemSerializer`) вместо списка картежей или словарей
+_JSON = int(os.environ.get('RTN_JSON', 0))
 RTN_SERVER_LOGGER_NAME = 'rtn_server'
 
 logger = logging.getLogger(RTN_SERVER_LOGGER_NAME)
 perflog = logging.getLogger('perflog')
 
+# фабрика прогретых стеммеров процесса воркера (см. `_init_worker`)
+_stemmers = None
 
-def receive(conn: Connection, _pipeline: Callable[[Iterator[dict]], Iterator]):
+
+def _init_worker():
+    """Запуск фабрики прогретых стеммеров при старте процесса воркера"""
+    global _stemmers
+
+    _stemmers = stemming.WarmStemmerFactory(factory=stemming.jstem_shared_factory())
+    _stemmers.start()
+
+
+def receive(
+        conn: Connection,
+        _pipeline: Callable[[Iterator[dict]], Iterator],
+        serializer: Optional[stemming.StemSerializer] = None):
     """
     Процедура получения строки через сетевое соединение и обратной передачи данных нормализации
+
+    :param conn:       сетевое соединение
+    :param _pipeline:  функция обработки результата морфологического анализа строки
+    :param serializer: сериализатор результата пайплайна. Если передан, клиенту отправляется JSON-массив,
+                       иначе - список результатов пайплайна
     """
     sentence = ''
     stemming.init_cache()
     tokenization.init_cache()
     config.init_cache()
 
+    # новое соединение получает уже запущенный стеммер, если процесс воркера запущен через `run`
+    stemmer_ctx = stemming.jstem_shared_ctx() if _stemmers is None else stemming.warm_jstem_ctx(_stemmers)
+
     try:
-        with stemming.jstem_ctx() as stemmer:
+        with stemmer_ctx as stemmer:
             while True:
                 if conn.poll(timeout=_RTN_CONNECTION_LIFE_TIME):
                     sentence = conn.recv()
@@ -48,7 +72,14 @@ def receive(conn: Connection, _pipeline: Callable[[Iterator[dict]], Iterator]):
                     start = process_time()
                     try:
                         analisys = normalization.analyze(sentence, stemmer)
-                        result = list(_pipeline(analisys))
+                        if serializer is None:
+                            result = list(_pipeline(analisys))
+                        else:
+                            result = bytes(serializer.array(_pipeline(analisys)))
+                    except stemming.MystemTimeoutError as e:
+                        logger.error(f'Normalization timed out: {e} (timeouts: {stemmer.timeouts}, '
+                                     f'restarts: {stemmer.restarts}) \n {sentence}')
+                        result = []
                     except Exception as e:
                         logger.error(f'Normalization failed with error: {e} \n {sentence}')
                         result = []
@@ -80,13 +111,13 @@ def receive(conn: Connection, _pipeline: Callable[[Iterator[dict]], Iterator]):
         logger.debug('Connection closed')
 
 
-def run(_pipeline: Callable[[Iterator[dict]], Iterator]):
-    with Pool(processes=_WORKERS) as pool:
+def run(_pipeline: Callable[[Iterator[dict]], Iterator], serializer: Optional[stemming.StemSerializer] = None):
+    with Pool(processes=_WORKERS, initializer=_init_worker) as pool:
         with Listener(('', _PORT), family='AF_INET', backlog=10) as listener:
             while True:
                 conn = listener.accept()
                 logger.info(f'New connection from: {listener.last_accepted}')
-                pool.apply_async(func=receive, args=(conn, _pipeline))
+                pool.apply_async(func=receive, args=(conn, _pipeline, serializer))
 
 
 if __name__ == '__main__':
@@ -113,18 +144,24 @@ if __name__ == '__main__':
     # составляем список названий функций пайплайна из аргументов полученных из cli
     pl_args = [el for el in stemming.Pipeline if getattr(args, el.value)]
     # составляем пайплайн их названий списка функций
-    pipeline = partial(stemming.pipeline, pipe=normalization.compose_pipeline(*pl_args))
-    converter = stemming.to_tuple if args.fmt == 'tuple' else stemming.to_dict
+    # граммемы, не входящие в результат, разбираются только по требованию этапов пайплайна
+    pipeline = partial(stemming.pipeline_plan(*pl_args), lazy='grammem' not in args.fields)
+    converter = stemming.stem_converter(args.fmt, args.fields)
+    # результат сериализуется в JSON в процессе воркера, если это задано при запуске (см. `RTN_JSON`)
+    serializer = stemming.StemSerializer(args.fmt, args.fields) if _JSON else None
 
     logger.debug(f'RTN pipeline options: {[arg.value for arg in pl_args]}')
-    logger.debug(f'RTN output converter: {converter}')
+    logger.debug(f'RTN output format: {args.fmt}, fields: {args.fields}, json: {bool(_JSON)}')
 
     # NB! Лямбда-функцию нельзя использовать в качестве аргумента для передачи в процесс
+    def _stems_pipeline(analysis):
+        yield from pipeline(analysis)
+
     def _mapped_pipeline(analysis):
         yield from map(converter, pipeline(analysis))
 
     try:
-        run(_mapped_pipeline)
+        run(_stems_pipeline if _JSON else _mapped_pipeline, serializer)
     except KeyboardInterrupt:
         pass
     except Exception as e:
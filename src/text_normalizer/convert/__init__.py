@@ -1 +1,2 @@
-from ._convert import *
\ No newline at end of file
+from ._convert import *
+from ._numeral import *
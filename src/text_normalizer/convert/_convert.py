@@ -2,11 +2,11 @@
 
 from functools import lru_cache
 
-from ..config import RegexConfigType, PipelineConfigType, load_conf, load_regex_conf
+from ._numeral import DIGITS, text2int_many, _numerics
+from ..config import RegexConfigType, load_regex_conf
 
 __all__ = [
     'MONTHS_SET',
-    'DIGITS',
     'text2int',
     'is_ordfold',
     'ord_unfold',
@@ -20,9 +20,6 @@ MONTHS = (
     "январь", "февраль", "март", "апрель", "май", "июнь", "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь")
 MONTHS_SHORT = ('янв', "фев", "мар", "апр", "май", "июнь", "июль", "авг", "сент", "окт", "ноя", "дек")
 MONTHS_SET = {*MONTHS, *MONTHS_SHORT}
-DIGITS = {"ноль", "единица", "двойка", "тройка", "четверка", "пятерка", "шестерка", "семерка", "восьмерка", "девятка"}
-
-_numerics = {**load_conf(PipelineConfigType.NUMERICS), **load_conf(PipelineConfigType.ORDINALS)}
 _ordfold_regx = load_regex_conf(RegexConfigType.ORDFOLD)
 
 
@@ -50,46 +47,7 @@ def text2int(*tokens: str) -> int:
     100242582
     """
 
-    _mapping = _numerics
-
-    if not tokens:
-        return 0
-
-    if len(tokens) == 1:
-        token = tokens[0]
-
-        if token not in _mapping:
-            raise ValueError(f"Unknown token '{token}'")
-
-        return _mapping[token][0]
-
-    top_level = total = level = value = 0
-
-    for token in tokens:
-
-        if token not in _mapping:
-            raise ValueError(f"Unknown token '{token}'")
-
-        number, _level, is_mult = _mapping[token]
-
-        if is_mult and not value and _level == 1:
-            is_mult = False
-
-        if is_mult:
-            if top_level and top_level <= _level:
-                raise ValueError("Invalid token order")
-
-            top_level = _level
-            total += number * value if value else number
-            level = value = 0
-        else:
-            if level and level <= _level:
-                raise ValueError("Invalid token order")
-
-            level = _level
-            value += number
-
-    return total + value
+    return text2int_many((tokens,))[0]
 
 
 def is_ordfold(text: str) -> bool:
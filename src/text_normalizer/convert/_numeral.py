@@ -0,0 +1,209 @@
+"""Модуль для сборки чисел из последовательностей русских числительных"""
+
+from typing import Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+from ..config import PipelineConfigType, load_conf
+
+__all__ = [
+    'DIGITS',
+    'Numeral',
+    'NUMERALS',
+    'NumeralAutomaton',
+    'compile_numerals',
+    'text2int_many',
+]
+
+DIGITS = {"ноль", "единица", "двойка", "тройка", "четверка", "пятерка", "шестерка", "семерка", "восьмерка", "девятка"}
+
+# числа, которые находятся на одном уровне с цифрами и требуют исключительного определения
+_AMBIGUOUS_LEVEL_NUMS = frozenset(range(11, 20))
+
+# количественные числительные (часть речи таких лемм - `POS.NUM`, см. `stems_gen`)
+_cardinals = load_conf(PipelineConfigType.NUMERICS)
+_numerics = {**_cardinals, **load_conf(PipelineConfigType.ORDINALS)}
+
+Number = Union[int, float]
+
+
+class Numeral(NamedTuple):
+    """Числительное словарей `numerics.json` и `ordinals.json`"""
+    value: Number       # значение
+    level: int          # уровень (разряд) числительного
+    is_mult: bool       # множитель (e.g. тысяча, сотня)
+    digit: bool         # название цифры (e.g. восьмерка, см. `DIGITS`)
+    ambiguous: bool     # число 11-19, уровень которого совпадает с уровнем цифр
+
+
+def compile_numerals(mapping: Mapping[str, Sequence]) -> Dict[str, Numeral]:
+    """
+    Собрать таблицу числительных из словаря вида {числительное: [значение, уровень, множитель]}
+
+    :param mapping: словарь числительных (см. `numerics.json`)
+    """
+    return {
+        word: Numeral(value, level, bool(is_mult), word in DIGITS, value in _AMBIGUOUS_LEVEL_NUMS)
+        for word, (value, level, is_mult) in mapping.items()
+    }
+
+
+NUMERALS = compile_numerals(_numerics)
+
+# состояние сборки числа: (уровень последнего множителя, сумма, уровень последнего числительного, значение, ошибка)
+_EMPTY = (0, 0, 0, 0, False)
+
+
+def _compose(state: tuple, numeral: Numeral) -> tuple:
+    """Добавить числительное к собираемому числу (см. `text2int`)"""
+    top_level, total, level, value, invalid = state
+    number, _level, is_mult = numeral.value, numeral.level, numeral.is_mult
+
+    if is_mult and not value and _level == 1:
+        is_mult = False
+
+    if is_mult:
+        invalid = invalid or bool(top_level and top_level <= _level)
+        return _level, total + (number * value if value else number), 0, 0, invalid
+
+    invalid = invalid or bool(level and level <= _level)
+
+    return top_level, total, _level, value + number, invalid
+
+
+def text2int_many(token_lists: Iterable[Sequence[str]]) -> List[Number]:
+    """
+    Конвертирует несколько последовательностей числительных в числа (см. `text2int`)::
+
+        text2int_many([['сто', 'двадцать', 'три'], ['пять'], []])  # [123, 5, 0]
+
+    :param token_lists: последовательности числительных
+    :raises ValueError: Если переданы не верные аргументы или аргументы переданы в неверном для числительного порядке
+    """
+    numerals = NUMERALS
+    result = []
+    append = result.append
+
+    for tokens in token_lists:
+        state = _EMPTY
+
+        for token in tokens:
+            numeral = numerals.get(token)
+
+            if numeral is None:
+                raise ValueError(f"Unknown token '{token}'")
+
+            state = _compose(state, numeral)
+
+            if state[4]:
+                raise ValueError("Invalid token order")
+
+        top_level, total, level, value, invalid = state
+        append(total + value)
+
+    return result
+
+
+class NumeralAutomaton:
+    """
+    Автомат для выделения чисел из потока числительных (см. `pipe_word2num`).
+
+    Числительные передаются по одному (`feed`), а автомат возвращает числа, сборка которых закончилась.
+    Число собирается по мере поступления числительных, без повторного разбора накопленных числительных.
+    Автомат определяет границы чисел по уровням числительных ("двадцать пять" -> 25, "пять двадцать" -> 5, 20),
+    в том числе для чисел 11-19, и разворачивает повторения цифр ("четыре восьмерки" -> "8888")::
+
+        automaton = NumeralAutomaton()
+
+        for text, lemma in [('сто', 'сто'), ('двадцать', 'двадцать'), ('три', 'три'), ('тройки', 'тройка')]:
+            print(automaton.feed(text, lemma, NUMERALS[lemma]))  # (), (), (), (120, '333')
+
+        print(automaton.flush())  # ()
+
+    Перед передачей следующего предложения автомат следует вернуть в начальное состояние (`reset`).
+    """
+
+    __slots__ = ('convert', 'count', 'last_level', '_state', '_prev', '_last', '_lemmas')
+
+    def __init__(self, convert: Optional[Callable[..., Number]] = None):
+        """
+        :param convert: функция для конвертации последовательности числительных в число (см. `text2int`).
+                        По-умолчанию число собирается по таблице числительных
+        """
+        self.convert = convert
+        self.reset()
+
+    def reset(self):
+        """Вернуть автомат в начальное состояние"""
+        self.count = 0          # количество числительных собираемого числа
+        self.last_level = 1     # уровень последнего числительного
+        self._state = self._prev = _EMPTY
+        self._last = None       # последнее числительное собираемого числа
+        self._lemmas = []
+
+    def feed(self, text: str, lemma: str, numeral: Numeral) -> Tuple[Union[Number, str], ...]:
+        """
+        Передать автомату очередное числительное.
+
+        :param text:    текст токена
+        :param lemma:   лемма числительного
+        :param numeral: числительное леммы (см. `NUMERALS`)
+        :return:        собранные числа и строки повторений цифр в порядке следования
+        :raises ValueError: если собранное число содержит числительные в неверном порядке
+        """
+        result = ()
+
+        if self.count:
+            if text in DIGITS:
+                result = self.flush()
+
+            elif numeral.digit:
+                # повторение цифры: последнее числительное - количество повторений ("три тройки" -> "333")
+                last, last_lemma = self._last, self._lemmas.pop()
+                self._state = self._prev
+                self.count -= 1
+                result = self.flush()
+                convert = self.convert
+
+                if convert is None:
+                    return result + (f'{numeral.value}' * last.value,)
+
+                return result + (f'{convert(lemma)}' * convert(last_lemma),)
+
+            elif (numeral.level >= self.last_level
+                  or (self.last_level == 2 and numeral.ambiguous)) and not numeral.is_mult:
+                result = self.flush()
+
+        self._prev = self._state
+        self._state = _compose(self._state, numeral)
+        self._last = numeral
+        self._lemmas.append(lemma)
+        self.count += 1
+        self.last_level = numeral.level
+
+        return result
+
+    def flush(self) -> Tuple[Number, ...]:
+        """
+        Закончить сборку числа. Уровень последнего числительного сохраняется.
+
+        :return: собранное число или пустой картеж, если числительных не было
+        :raises ValueError: если собранное число содержит числительные в неверном порядке
+        """
+        if not self.count:
+            return ()
+
+        if self.convert is not None:
+            number = self.convert(*self._lemmas)
+        else:
+            top_level, total, level, value, invalid = self._state
+
+            if invalid:
+                raise ValueError("Invalid token order")
+
+            number = total + value
+
+        self.count = 0
+        self._state = self._prev = _EMPTY
+        self._last = None
+        self._lemmas.clear()
+
+        return number,
@@ -1,18 +1,37 @@
 import logging
-from functools import lru_cache, partial
-from typing import Iterator, Sequence, Callable
+import os
+from collections import deque
+from functools import partial
+from itertools import islice
+from typing import Iterator, Iterable, Sequence, Callable, Dict, List, Mapping, Tuple, Optional
 
 from . import stemming
-from .stemming import iStemTuple, JsonStemmer, PIPE_PREFIX, Pipeline
-from .tokenization import sent_tokenize, replace_bigrams, get_tokenizer
+from .stemming import (
+    iStemTuple, JsonStemmer, AsyncJsonStemmer, PipelinedJsonStemmer, Pipeline, STEM_FIELDS)
+from .tokenization import sent_tokenize, replace_synonyms, get_tokenizer, iTokenTuple, TokenType
 
-__all__ = ['analyze', 'compose_pipeline', 'cache_clear', 'init_cache', 'normalize']
+__all__ = [
+    'analyze',
+    'analyze_many',
+    'analyze_async',
+    'compose_pipeline',
+    'cache_clear',
+    'init_cache',
+    'normalize',
+    'normalize_many',
+    'normalize_bulk',
+    'normalize_async',
+    'normalize_pipelined',
+    'normalize_variants',
+]
 
 
 logger = logging.getLogger('rtn')
 
+# Передавать в анализатор только текстовые токены (см. `analyze`)
+MYSTEM_BYPASS = bool(int(os.environ.get('MYSTEM_BYPASS', 0)))
+
 
-@lru_cache(maxsize=len(Pipeline))
 def compose_pipeline(
         *pipelines: Sequence[Pipeline]) -> Sequence[Callable[[Iterator[iStemTuple]], Iterator[iStemTuple]]]:
     """
@@ -25,43 +44,117 @@ def compose_pipeline(
         processing_pipeline = partial(stemming.pipeline, pipe=pipes)
         ...
 
-    :param pipelines: одно или несколько наименований пайплайнов
+    Функции этапов выполняются в порядке передачи наименований, не зарегистрированные этапы пропускаются.
+    Для проверки ограничений порядка этапов используйте `stemming.pipeline_plan`.
+
+    :param pipelines: одно или несколько наименований этапов пайплайна (см. `stemming.register_stage`)
     """
-    from inspect import getmembers, isfunction
+    stages = []
 
-    d = dict(zip(
-        sorted(Pipeline, key=lambda p: p.value),  # getmembers возвращает функции сортированные по имени
-        map(lambda func: func[1],
-            filter(lambda func: func[0].startswith(PIPE_PREFIX, 0, len(PIPE_PREFIX) + 1),
-                   getmembers(stemming, isfunction)))
-        ))
+    for p in pipelines:
+        try:
+            stages.append(stemming.get_stage(p).func)
+        except KeyError:
+            pass
 
-    return [d[p] for p in pipelines if p in d]
+    return stages
 
 
-def analyze(sentence: str, stemmer: JsonStemmer, bigrams=True) -> Iterator[dict]:
+def analyze(
+        sentence: str, stemmer: JsonStemmer, bigrams=True, bypass=MYSTEM_BYPASS, stream=False) -> Iterator[dict]:
     """
     Морфологический анализ строки.
 
+    В режиме `bypass` в анализатор передаются только текстовые токены (`TokenType.TXT`). Цифры, пунктуация,
+    даты, время, адреса и т.п., для которых `mystem` все равно не возвращает разбора, добавляются в результат
+    на свои позиции с уже определенным типом. Режим сокращает объем запросов к `mystem` для строк,
+    состоящих в основном из цифр и пунктуации (например, диктовка номеров карт и сумм).
+
+    NB! В режиме `bypass` контекст для снятия омонимии не содержит пропущенных токенов, поэтому
+    разбор отдельных слов может отличаться от разбора всей строки.
+
+    В режиме `stream` результат анализа передается дальше по мере разбора ответа `mystem`
+    (см. `JsonStemmer.analyze_iter`). Режим не действует вместе с `bypass`.
+
     :param sentence: Строка для анализа
     :param stemmer:  Предложенный анализатор
     :param bigrams:  Заменять биграммы в предложении на основе правил приложения
+    :param bypass:   Передавать в анализатор только текстовые токены
+    :param stream:   Разбирать ответ анализатора по мере поступления
     :return:         Итератор словарей с данными морфологического анализа
     """
 
-    tokens = sent_tokenize(sentence, tokenizer=get_tokenizer())
+    if not bypass:
+        tokens = _tokenize(sentence, bigrams)
+        yield from stemmer.analyze_iter(tokens) if stream else stemmer.analyze(tokens)
+        return
 
-    if not bigrams:
-        tokens = replace_bigrams(tokens)
+    tokens, words = _split_tokens(sentence, bigrams)
+    result = _merge_analysis(tokens, stemmer.analyze(words) if words else [])
+
+    if result is None:
+        result = stemmer.analyze(t[0] for t in tokens)
+
+    yield from result
+
+
+def analyze_many(
+        sentences: Iterable[str], stemmer: JsonStemmer, bigrams=True, bypass=MYSTEM_BYPASS) -> List[List[dict]]:
+    """
+    Морфологический анализ нескольких строк за одно обращение к анализатору.
+
+    :param sentences: Строки для анализа
+    :param stemmer:   Предложенный анализатор
+    :param bigrams:   Заменять биграммы в предложении на основе правил приложения
+    :param bypass:    Передавать в анализатор только текстовые токены (см. `analyze`)
+    :return:          Список результатов морфологического анализа для каждой строки
+    """
+
+    if not bypass:
+        return stemmer.analyze_many([list(_tokenize(s, bigrams)) for s in sentences])
 
-    yield from stemmer.analyze(t[0] for t in tokens)
+    split = [_split_tokens(s, bigrams) for s in sentences]
+    result = []
+
+    for (tokens, _), analysis in zip(split, stemmer.analyze_many([words for _, words in split])):
+        merged = _merge_analysis(tokens, analysis)
+        result.append(stemmer.analyze(t[0] for t in tokens) if merged is None else merged)
+
+    return result
+
+
+async def analyze_async(
+        sentence: str, stemmer: AsyncJsonStemmer, bigrams=True, bypass=MYSTEM_BYPASS) -> List[dict]:
+    """
+    Асинхронный морфологический анализ строки.
+
+    :param sentence: Строка для анализа
+    :param stemmer:  Предложенный асинхронный анализатор
+    :param bigrams:  Заменять биграммы в предложении на основе правил приложения
+    :param bypass:   Передавать в анализатор только текстовые токены (см. `analyze`)
+    :return:         Список словарей с данными морфологического анализа
+    """
+
+    if not bypass:
+        return await stemmer.analyze(_tokenize(sentence, bigrams))
+
+    tokens, words = _split_tokens(sentence, bigrams)
+    result = _merge_analysis(tokens, await stemmer.analyze(words) if words else [])
+
+    if result is None:
+        result = await stemmer.analyze(t[0] for t in tokens)
+
+    return result
 
 
 def normalize(
         sentence: str,
         stemmer: JsonStemmer,
         pipeline: Sequence = Pipeline,
-        bigrams: bool = True) -> Iterator[iStemTuple]:
+        bigrams: bool = True,
+        bypass: bool = MYSTEM_BYPASS,
+        stream: bool = False,
+        fields: Sequence[str] = STEM_FIELDS) -> Iterator[iStemTuple]:
     """
     Анализ предложения на основе базового пайплайна::
         from text_normalizer.stemming import jstem_ctx
@@ -74,18 +167,265 @@ def normalize(
     :param stemmer:  предложенный морфологический анализатор
     :param pipeline: последовательность типов пайплайнов
     :param bigrams:  замена биграм
+    :param bypass:   передавать в анализатор только текстовые токены (см. `analyze`)
+    :param stream:   разбирать ответ анализатора по мере поступления (см. `analyze`)
+    :param fields:   поля результата (e.g. ('token',) или ('token', 'lemma')). Если граммемы не входят в результат,
+                     строки граммем разбираются только при обращении к ним этапов пайплайна
+    """
+    converter = stemming.stem_converter('tuple', fields)
+    plan = stemming.pipeline_plan(*pipeline)
+    # в режиме `stream` токены выдаются до получения всего ответа анализатора
+    processing_pipeline = partial(plan.stream if stream else plan, lazy='grammem' not in fields)
+    yield from map(converter, processing_pipeline(analyze(sentence, stemmer, bigrams, bypass, stream)))
+
+
+def normalize_variants(
+        sentence: str,
+        stemmer: JsonStemmer,
+        variants: Mapping[str, Sequence],
+        bigrams: bool = True,
+        bypass: bool = MYSTEM_BYPASS,
+        stream: bool = False) -> Dict[str, List[iStemTuple]]:
+    """
+    Анализ предложения на основе нескольких вариантов пайплайна за одно обращение к анализатору::
+
+        with jstem_ctx() as stemmer:
+            result = normalize_variants('сто рублей и пять копеек', stemmer, {
+                'full': Pipeline,
+                'no_stopwords': [Pipeline.WORD2NUM, Pipeline.MAKE_DATE],
+            })
+            print(result['full'], result['no_stopwords'])
+
+    Общие начальные этапы вариантов выполняются один раз (см. `stemming.pipeline_variants`).
+
+    :param sentence: строка для нормализации
+    :param stemmer:  предложенный морфологический анализатор
+    :param variants: варианты пайплайна {наименование варианта: последовательность типов пайплайнов}
+    :param bigrams:  замена биграм
+    :param bypass:   передавать в анализатор только текстовые токены (см. `analyze`)
+    :param stream:   разбирать ответ анализатора по мере поступления (см. `analyze`)
+    :return:         результаты нормализации вариантов в порядке передачи вариантов
+    """
+    processing_pipelines = stemming.pipeline_variants(variants)
+    result = processing_pipelines(analyze(sentence, stemmer, bigrams, bypass, stream))
+
+    return {name: list(map(stemming.to_tuple, stems)) for name, stems in result.items()}
+
+
+def normalize_many(
+        sentences: Iterable[str],
+        stemmer: JsonStemmer,
+        pipeline: Sequence = Pipeline,
+        bigrams: bool = True,
+        batch_size: int = 64,
+        bypass: bool = MYSTEM_BYPASS) -> Iterator[List[iStemTuple]]:
+    """
+    Пакетный анализ предложений на основе базового пайплайна.
+    Предложения анализируются пачками по `batch_size` штук за одно обращение к `mystem`::
+
+        with jstem_ctx() as stemmer:
+            for result in normalize_many(['мама мыла раму', 'папа красил окно'], stemmer):
+                print(result)
+
+    :param sentences:  строки для нормализации
+    :param stemmer:    предложенный морфологический анализатор
+    :param pipeline:   последовательность типов пайплайнов
+    :param bigrams:    замена биграм
+    :param batch_size: количество предложений в одном обращении к анализатору
+    :param bypass:     передавать в анализатор только текстовые токены (см. `analyze`)
+    :return:           итератор списков результатов нормализации для каждой строки в порядке передачи
+    """
+    processing_pipeline = stemming.pipeline_plan(*pipeline)
+    sentences = iter(sentences)
+
+    while True:
+        batch = list(islice(sentences, batch_size))
+
+        if not batch:
+            break
+
+        for analysis in analyze_many(batch, stemmer, bigrams, bypass):
+            yield list(map(stemming.to_tuple, processing_pipeline(analysis)))
+
+
+def normalize_bulk(
+        sentences: Iterable[str],
+        stemmer: JsonStemmer,
+        pipeline: Sequence = Pipeline,
+        bigrams: bool = True,
+        batch_size: int = 10000) -> Iterator[List[iStemTuple]]:
+    """
+    Пакетный анализ больших объемов текста на основе базового пайплайна.
+
+    Уникальные словоформы каждой пачки из `batch_size` предложений анализируются один раз,
+    в контекстно-независимом режиме (см. `stemming.analyze_unique`). Степень сокращения объема
+    анализа для каждой пачки выводится в лог. Если у всех этапов пайплайна есть функции для пачки предложений,
+    пачка обрабатывается поколоночно (см. `stemming.StemBatch`, `stemming.PipelinePlan.batch`)::
+
+        with jstem_ctx(disambiguation=False) as stemmer:
+            for result in normalize_bulk(open('corpus.txt'), stemmer):
+                print(result)
+
+    :param sentences:  строки для нормализации
+    :param stemmer:    морфологический анализатор без снятия омонимии
+    :param pipeline:   последовательность типов пайплайнов
+    :param bigrams:    замена биграм
+    :param batch_size: количество предложений в пачке
+    :return:           итератор списков результатов нормализации для каждой строки в порядке передачи
+    """
+    processing_pipeline = stemming.pipeline_plan(*pipeline)
+    sentences = iter(sentences)
+
+    while True:
+        batch = list(islice(sentences, batch_size))
+
+        if not batch:
+            break
+
+        result, info = stemming.analyze_unique([_tokenize(s, bigrams) for s in batch], stemmer)
+        logger.info(f'Bulk analysis: {info.tokens} tokens, {info.unique} unique, dedup ratio {info.ratio:.1f}')
+
+        if processing_pipeline.batch_pipe is None:
+            for analysis in result:
+                yield list(map(stemming.to_tuple, processing_pipeline(analysis)))
+        else:
+            yield from processing_pipeline.batch(stemming.stems_batch(result)).to_tuples()
+
+
+def normalize_pipelined(
+        sentences: Iterable[str],
+        stemmer: PipelinedJsonStemmer,
+        pipeline: Sequence = Pipeline,
+        bigrams: bool = True,
+        depth: int = 8,
+        bypass: bool = MYSTEM_BYPASS) -> Iterator[List[iStemTuple]]:
+    """
+    Конвейерный анализ предложений на основе базового пайплайна.
+
+    В `mystem` передается до `depth` предложений вперед, поэтому токенизация следующих предложений и обработка
+    результатов предыдущих выполняются, пока `mystem` анализирует текущее::
+
+        with jstem_ctx(PipelinedJsonStemmer) as stemmer:
+            for result in normalize_pipelined(sys.stdin, stemmer):
+                print(result)
+
+    :param sentences: строки для нормализации
+    :param stemmer:   конвейерный морфологический анализатор
+    :param pipeline:  последовательность типов пайплайнов
+    :param bigrams:   замена биграм
+    :param depth:     количество предложений, одновременно переданных в `mystem`
+    :param bypass:    передавать в анализатор только текстовые токены (см. `analyze`)
+    :return:          итератор списков результатов нормализации для каждой строки в порядке передачи
+    """
+    processing_pipeline = stemming.pipeline_plan(*pipeline)
+    in_flight = deque()
+
+    def result():
+        tokens, future = in_flight.popleft()
+        analysis = future.result()
+
+        if tokens is not None:
+            merged = _merge_analysis(tokens, analysis)
+            analysis = stemmer.analyze(t[0] for t in tokens) if merged is None else merged
+
+        return list(map(stemming.to_tuple, processing_pipeline(analysis)))
+
+    for sentence in sentences:
+        if bypass:
+            tokens, words = _split_tokens(sentence, bigrams)
+            in_flight.append((tokens, stemmer.submit(words)))
+        else:
+            in_flight.append((None, stemmer.submit(_tokenize(sentence, bigrams))))
+
+        if len(in_flight) >= depth:
+            yield result()
+
+    while in_flight:
+        yield result()
+
+
+async def normalize_async(
+        sentence: str,
+        stemmer: AsyncJsonStemmer,
+        pipeline: Sequence = Pipeline,
+        bigrams: bool = True,
+        bypass: bool = MYSTEM_BYPASS) -> List[iStemTuple]:
+    """
+    Асинхронный анализ предложения на основе базового пайплайна::
+        from text_normalizer.stemming import AsyncMystemPool
+
+        async with AsyncMystemPool(2) as stemmer:
+            result = await normalize_async('мама мыла раму', stemmer, [Pipeline.WORD2NUM])
+            print(result)
+
+    :param sentence: строка для нормализации
+    :param stemmer:  предложенный асинхронный морфологический анализатор
+    :param pipeline: последовательность типов пайплайнов
+    :param bigrams:  замена биграм
+    :param bypass:   передавать в анализатор только текстовые токены (см. `analyze`)
+    """
+    processing_pipeline = stemming.pipeline_plan(*pipeline)
+    analysis = await analyze_async(sentence, stemmer, bigrams, bypass)
+
+    return list(map(stemming.to_tuple, processing_pipeline(analysis)))
+
+
+def _tokenize(sentence: str, bigrams: bool) -> Iterator[str]:
+    return (t[0] for t in _typed_tokens(sentence, bigrams))
+
+
+def _typed_tokens(sentence: str, bigrams: bool) -> Iterator[iTokenTuple]:
+    tokens = sent_tokenize(sentence, tokenizer=get_tokenizer())
+
+    if not bigrams:
+        tokens = replace_synonyms(tokens)
+
+    return tokens
+
+
+def _split_tokens(sentence: str, bigrams: bool) -> Tuple[List[iTokenTuple], List[str]]:
+    """Токены строки и список текстовых токенов для передачи в анализатор"""
+    tokens = list(_typed_tokens(sentence, bigrams))
+
+    return tokens, [t[0] for t in tokens if t[1] == TokenType.TXT]
+
+
+def _merge_analysis(tokens: List[iTokenTuple], analysis: List[dict]) -> Optional[List[dict]]:
     """
-    processing_pipeline = partial(stemming.pipeline, pipe=compose_pipeline(*pipeline))
-    yield from map(stemming.to_tuple, processing_pipeline(analyze(sentence, stemmer, bigrams=bigrams)))
+    Вставить результат анализа текстовых токенов между пропущенными токенами.
+
+    Возвращает None, если результат не соответствует переданным текстовым токенам
+    (`mystem` изменил разбиение на токены). Такую строку следует анализировать целиком.
+    """
+    words = iter(analysis)
+    result = []
+    append = result.append
+
+    for token, _type in tokens:
+        if _type == TokenType.TXT:
+            d = next(words, None)
+
+            if d is None or d.get('text') != token:
+                break
+
+            append(d)
+        else:
+            # тип токена уже известен и не будет определяться повторно (см. `stems_gen`)
+            append({'analysis': [], 'text': token, 'type': _type})
+    else:
+        if next(words, None) is None:
+            return result
+
+    logger.warning('Mystem output does not match input tokens, bypass disabled')
+
+    return None
 
 
 def init_cache():
-    list(map(compose_pipeline, Pipeline))
-    compose_pipeline(*Pipeline)
-    compose_pipeline()
+    stemming.pipeline_plan(*Pipeline)
     logger.debug('Cache initiated')
 
 
 def cache_clear():
-    compose_pipeline.cache_clear()
+    stemming.plan_cache_clear()
     logger.debug('Cache cleared')
@@ -15,8 +15,18 @@ if not os.environ.get("MYSTEM_BIN", None):
             install(MYSTEM_DIR)
 
 
+from ._cache import *
 from ._mystem import *
 from ._processing import *
+from ._async import *
+from ._lexicon import *
+from ._bulk import *
+from ._warm import *
+from ._vocabulary import *
+from ._batch import *
+from ._serialize import *
+from ._fused import *
+from ._registry import *
 
 
 def init_cache():
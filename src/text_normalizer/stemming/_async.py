@@ -0,0 +1,277 @@
+"""Модуль для асинхронной работы с морфологическим анализатором MyStem"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Iterable, List, Callable
+
+from ._mystem import JsonStemmer, MystemTimeoutError, jstem_inst, MYSTEM_POOL_SIZE, MYSTEM_TIMEOUT
+
+__all__ = ['AsyncJsonStemmer', 'AsyncMystemPool', 'ajstem_inst']
+
+logger = logging.getLogger('rtn')
+
+# максимальная длина строки результата анализа, которую может прочитать стеммер
+_STREAM_LIMIT = 2 ** 24
+
+
+class AsyncJsonStemmer:
+    """
+    Асинхронная реализация морфологического анализатора для работы со списком токенов.
+
+    Процесс `mystem` запускается через `asyncio.create_subprocess_exec` и обрабатывает запросы в порядке
+    их поступления. Запросы нескольких корутин передаются в процесс не дожидаясь ответов на предыдущие,
+    а отдельная задача читает результаты и передает их ожидающим корутинам::
+
+        async with ajstem_inst() as stem:
+            results = await asyncio.gather(*(stem.analyze(tokens) for tokens in token_lists))
+
+    Если `mystem` не ответил на запрос за `timeout` секунд, процесс принудительно завершается, ожидающие
+    запросы завершаются ошибкой, а новый процесс запускается при следующем обращении к стеммеру.
+    """
+
+    def __init__(self, timeout: float = MYSTEM_TIMEOUT, **kwargs):
+        """
+        Параметры запуска `mystem` формируются так же, как для `JsonStemmer`
+
+        :param timeout: максимальное время ожидания ответа `mystem` на один запрос, секунды.
+                        0 или None - ожидать без ограничения
+        :param kwargs:  параметры `JsonStemmer`
+        """
+        stem = JsonStemmer(**kwargs)
+        self._cmd = [stem._mystem_bin, *stem._mystemargs]
+        self._proc = None
+        self._reader = None
+        self._pending = deque()
+        self._write_lock = None
+        self._restart_lock = None
+        self.timeout = timeout
+        self.timeouts = 0
+        self.restarts = 0
+
+    @property
+    def pending(self) -> int:
+        """Количество запросов, ожидающих результата анализа"""
+        return len(self._pending)
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    async def start(self):
+        logger.debug('Starting async Mystem...')
+        self._proc = await asyncio.create_subprocess_exec(
+            *self._cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=_STREAM_LIMIT
+        )
+        self._write_lock = asyncio.Lock()
+        self._restart_lock = self._restart_lock or asyncio.Lock()
+        self._reader = asyncio.get_event_loop().create_task(self._read())
+        logger.debug('Async MyStem Ready')
+
+    async def stop(self):
+        logger.debug('Stopping async MyStem...')
+
+        if self._proc is not None:
+            if self._proc.returncode is None:
+                self._proc.terminate()
+            await self._proc.wait()
+            await asyncio.wait([self._reader])
+
+        self._proc = None
+        self._reader = None
+        logger.debug('Async MyStem stopped')
+
+    async def restart(self):
+        """Остановить процесс `mystem` и запустить новый"""
+        logger.warning('Restarting async Mystem...')
+        await self.stop()
+        await self.start()
+        self.restarts += 1
+
+    async def analyze(self, tokens: Iterable[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов"""
+
+        tokens_json = json.dumps([{"analysis": [], "text": t} for t in tokens]).encode("utf-8")
+
+        if self._proc is None:
+            raise RuntimeError('Mystem is not running')
+
+        if not self.alive:
+            async with self._restart_lock:
+                # процесс мог быть перезапущен другой корутиной, пока эта ожидала блокировку
+                if not self.alive:
+                    await self.restart()
+
+        proc = self._proc
+        result = asyncio.get_event_loop().create_future()
+
+        async with self._write_lock:
+            # поток чтения мог завершиться, пока запрос ожидал блокировку: ответ на запрос не будет получен
+            if proc.returncode is not None:
+                raise RuntimeError('Mystem process exited')
+
+            # порядок в очереди ожидающих запросов должен совпадать с порядком записи в процесс
+            self._pending.append(result)
+            proc.stdin.write(tokens_json + b'\n')
+            await proc.stdin.drain()
+
+        if not self.timeout:
+            return await result
+
+        try:
+            return await asyncio.wait_for(result, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f'Async Mystem did not respond in {self.timeout}s')
+
+            if proc.returncode is None:
+                # поток чтения завершит ошибкой остальные запросы, переданные в этот процесс
+                proc.kill()
+                await proc.wait()
+
+            raise MystemTimeoutError(f'Mystem did not respond in {self.timeout}s') from None
+
+    async def _read(self):
+        proc, pending = self._proc, self._pending
+        stdout = proc.stdout
+        error = None
+
+        try:
+            while True:
+                line = await stdout.readline()
+
+                if not line:
+                    break
+
+                result = pending.popleft()
+
+                try:
+                    analysis = json.loads(line)
+                except ValueError:
+                    if not result.done():
+                        result.set_exception(RuntimeError(f'Mystem output could not be parsed: {line[:100]!r}'))
+                    raise
+
+                if not result.cancelled():
+                    result.set_result(analysis)
+        except Exception as e:
+            logger.exception('Async Mystem output could not be read')
+            error = e
+
+        if proc.returncode is None:
+            # без потока чтения процесс не может ответить на запросы: следующий запрос запустит новый процесс
+            proc.kill()
+            await proc.wait()
+
+        while pending:
+            result = pending.popleft()
+
+            if not result.done():
+                result.set_exception(RuntimeError(f'Mystem process exited: {error or "EOF"}'))
+
+    async def __aenter__(self) -> 'AsyncJsonStemmer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+
+class AsyncMystemPool:
+    """
+    Пул асинхронных стеммеров.
+
+    Каждый вызов `analyze` передается стеммеру с наименьшим количеством ожидающих запросов.
+    Завершившийся процесс `mystem` перезапускается при следующем обращении к нему::
+
+        async with AsyncMystemPool(4) as pool:
+            results = await asyncio.gather(*(pool.analyze(tokens) for tokens in token_lists))
+
+    Пул поддерживает интерфейс `AsyncJsonStemmer.analyze` и может быть передан везде, где ожидается стеммер.
+    """
+
+    def __init__(self, size: int = MYSTEM_POOL_SIZE, factory: Callable[[], AsyncJsonStemmer] = None):
+        """
+        :param size:    количество процессов `mystem` в пуле
+        :param factory: функция для создания нового асинхронного стеммера
+        """
+        if size < 1:
+            raise ValueError(f'Invalid pool size {size}')
+
+        self._size = size
+        self._factory = factory or ajstem_inst
+        self._stemmers = []     # type: List[AsyncJsonStemmer]
+        self._restart_lock = None
+        self.restarts = 0
+        self.timeouts = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    async def start(self):
+        if self._stemmers:
+            return
+
+        stemmers = [self._factory() for _ in range(self._size)]
+        await asyncio.gather(*(stem.start() for stem in stemmers))
+        self._stemmers = stemmers
+        self._restart_lock = asyncio.Lock()
+
+    async def stop(self):
+        stemmers, self._stemmers = self._stemmers, []
+        await asyncio.gather(*(stem.stop() for stem in stemmers))
+
+    async def analyze(self, tokens: Iterable[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов на наименее загруженном стеммере пула"""
+
+        if not self._stemmers:
+            await self.start()
+
+        stemmers = self._stemmers
+        idx = min(range(len(stemmers)), key=lambda i: stemmers[i].pending)
+        stem = stemmers[idx]
+
+        if not stem.alive:
+            stem = await self._restart(idx)
+
+        try:
+            return await stem.analyze(tokens)
+        except MystemTimeoutError:
+            self.timeouts += 1
+            raise
+
+    async def _restart(self, idx: int) -> AsyncJsonStemmer:
+        async with self._restart_lock:
+            stem = self._stemmers[idx]
+
+            # процесс мог быть перезапущен другой корутиной, пока эта ожидала блокировку
+            if not stem.alive:
+                logger.warning(f'Restarting async Mystem #{idx} of the pool')
+                await stem.stop()
+                stem = self._factory()
+                await stem.start()
+                self._stemmers[idx] = stem
+                self.restarts += 1
+
+            return stem
+
+    async def __aenter__(self) -> 'AsyncMystemPool':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+
+def ajstem_inst(**kwargs) -> AsyncJsonStemmer:
+    """
+    Получить экземпляр асинхронного json-стеммера
+
+    :param kwargs:  дополнительные параметры стеммера
+    """
+    return jstem_inst(AsyncJsonStemmer, **kwargs)
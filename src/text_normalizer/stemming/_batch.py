@@ -0,0 +1,326 @@
+"""Модуль для поколоночной обработки результатов морфологического анализа пачки предложений"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List, Dict, FrozenSet, Sequence, Set, Any
+
+from ._mystem import iStemTuple, FrozenGrammem, stems_gen, grammem_mask, mask_grammem, _POS_FIELD, _grammem_tuple
+from ._processing import pipe_makedate, pipe_merge_ccn, pipe_word2num
+from ._vocabulary import Vocabulary, get_vocabulary
+from ..convert import is_ordfold, ord_unfold
+from ..tokenization import TokenType, KILO_POSTFIX
+
+__all__ = [
+    'StemBatch',
+    'stems_batch',
+    'batch_stopwords',
+    'batch_kilo_postfix',
+    'batch_ord_unfold',
+    'batch_word2num',
+    'batch_makedate',
+    'batch_merge_ccn',
+]
+
+# тип токена по его значению
+_token_types = {t.value: t for t in TokenType}
+
+
+class StemBatch:
+    """
+    Поколоночное представление результатов морфологического анализа пачки предложений.
+
+    Строки токенов и лемм хранятся один раз в общем словаре процесса (см. `Vocabulary`), а данные токенов
+    всех предложений - в параллельных массивах (`array.array`):
+
+        tokens  - номер текста токена в словаре
+        types   - тип токена (`TokenType`)
+        lemmas  - номер леммы в словаре
+        numbers - признак числовой леммы (см. `pipe_word2num`): лемма хранится в словаре строкой
+        masks   - битовая маска граммем (см. `grammem_mask`), 0 - токен без граммем
+        quals   - признак словарного слова
+        offsets - позиция первого токена каждого предложения; последний элемент - количество токенов пачки
+
+    Этапы обработки пачки (`batch_stopwords`, `batch_kilo_postfix`, `batch_ord_unfold`) проверяют каждую строку
+    пачки один раз, а с токенами работают через номера строк и маски граммем, без создания картежа
+    для каждого токена на каждом этапе. Этапы `batch_word2num` и `batch_makedate` по номерам лемм находят
+    предложения с числительными и месяцами, а `batch_merge_ccn` - предложения не менее чем с 16 цифрами в числовых
+    токенах, и применяют этапы пайплайна только к ним::
+
+        batch = stems_batch(stemmer.analyze_many(token_lists))
+        batch = batch_ord_unfold(batch_kilo_postfix(batch_stopwords(batch)))
+
+        for stems in batch:
+            print(list(map(to_tuple, stems)))
+
+    Массивы колонок можно передать в NumPy без копирования (см. `to_numpy`).
+    """
+
+    _columns = ('tokens', 'types', 'lemmas', 'numbers', 'masks', 'quals', 'offsets')
+
+    def __init__(self, vocabulary: Vocabulary = None):
+        """
+        :param vocabulary: словарь строк. По-умолчанию - общий словарь процесса (см. `get_vocabulary`)
+        """
+        self.vocabulary = get_vocabulary() if vocabulary is None else vocabulary
+        self.tokens = array('q')
+        self.types = array('B')
+        self.lemmas = array('q')
+        self.numbers = array('B')
+        self.masks = array('q')
+        self.quals = array('B')
+        self.offsets = array('q', [0])
+
+    @property
+    def size(self) -> int:
+        """Количество токенов в пачке"""
+        return len(self.tokens)
+
+    @property
+    def words(self) -> List[str]:
+        """Строки словаря по номерам"""
+        return self.vocabulary.words
+
+    def word_id(self, word) -> int:
+        """Номер строки в словаре. Отсутствующая строка добавляется в словарь"""
+        return self.vocabulary.id(word)
+
+    def word_ids(self, words: Iterable) -> FrozenSet[int]:
+        """Номера строк словаря, которые входят в `words`"""
+        return self.vocabulary.ids(words)
+
+    def append(self, stems: Iterable[iStemTuple]):
+        """Добавить в пачку результат анализа предложения"""
+        # поиск номера строки без вызова метода словаря для уже известных строк ('' имеет номер 0)
+        get_id, word_id = self.vocabulary._ids.get, self.vocabulary.id
+        tokens, types, lemmas, numbers, masks, quals = (
+            self.tokens, self.types, self.lemmas, self.numbers, self.masks, self.quals)
+
+        for (text, type_), lemma, grammem, qual in stems:
+            tokens.append(get_id(text) or word_id(text))
+            types.append(type_)
+
+            # словарь содержит только строки, поэтому число хранится строкой с признаком числовой леммы
+            if type(lemma) is int:
+                lemma = f'{lemma}'
+                numbers.append(1)
+            else:
+                numbers.append(0)
+
+            lemmas.append(get_id(lemma) or word_id(lemma))
+            masks.append(grammem.mask if type(grammem) is FrozenGrammem else grammem_mask(grammem))
+            quals.append(qual)
+
+        self.offsets.append(len(tokens))
+
+    def stems(self, idx: int) -> Iterator[iStemTuple]:
+        """Получить результат анализа предложения пачки в виде картежей (см. `stems_gen`)"""
+        words, tokens, types, lemmas, numbers, masks, quals = (
+            self.words, self.tokens, self.types, self.lemmas, self.numbers, self.masks, self.quals)
+
+        grammems = {0: None}
+
+        for i in range(self.offsets[idx], self.offsets[idx + 1]):
+            mask = masks[i]
+            grammem = grammems.get(mask)
+
+            if grammem is None and mask:
+                grammem = grammems[mask] = mask_grammem(mask)
+
+            lemma = int(words[lemmas[i]]) if numbers[i] else words[lemmas[i]]
+
+            yield (words[tokens[i]], _token_types[types[i]]), lemma, grammem, bool(quals[i])
+
+    def to_tuples(self) -> Iterator[List[tuple]]:
+        """
+        Получить результаты анализа предложений пачки в виде картежей `to_tuple`.
+        Граммемы каждой маски конвертируются один раз для всей пачки
+        """
+        words, tokens, lemmas, masks, quals, offsets = (
+            self.words, self.tokens, self.lemmas, self.masks, self.quals, self.offsets)
+        grammems = {mask: _grammem_tuple((None, None, mask_grammem(mask))) for mask in set(masks)}
+
+        for start, end in zip(offsets, offsets[1:]):
+            yield [(f'{words[tokens[i]]}', f'{words[lemmas[i]]}', grammems[masks[i]], bool(quals[i]))
+                   for i in range(start, end)]
+
+    def select(self, rows: Sequence[int]) -> 'StemBatch':
+        """
+        Получить пачку из токенов с переданными номерами. Предложения, все токены которых не вошли
+        в `rows`, остаются в пачке пустыми.
+
+        :param rows: номера токенов в порядке возрастания
+        """
+        batch = self._derived()
+
+        if rows:
+            take = itemgetter(*rows) if len(rows) > 1 else lambda column: (column[rows[0]],)
+
+            for name in self._columns[:-1]:
+                getattr(batch, name).extend(take(getattr(self, name)))
+
+        batch.offsets = array('q', (bisect_left(rows, offset) for offset in self.offsets))
+
+        return batch
+
+    def copy(self) -> 'StemBatch':
+        """Копия пачки"""
+        batch = self._derived()
+
+        for name in self._columns:
+            setattr(batch, name, array(getattr(self, name).typecode, getattr(self, name)))
+
+        return batch
+
+    def _derived(self) -> 'StemBatch':
+        return StemBatch(self.vocabulary)
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Колонки пачки в виде массивов NumPy, использующих данные массивов пачки без копирования"""
+        import numpy
+
+        return {name: numpy.asarray(memoryview(getattr(self, name))) for name in self._columns}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[Iterator[iStemTuple]]:
+        return (self.stems(idx) for idx in range(len(self)))
+
+
+def stems_batch(analysis_results: Iterable[Iterable[dict]]) -> StemBatch:
+    """
+    Преобразует результаты морфологического разбора MyStem нескольких предложений в пачку (см. `StemBatch`)
+
+    :param analysis_results: результаты морфологического разбора предложений
+    """
+    batch = StemBatch()
+
+    for analysis_result in analysis_results:
+        batch.append(stems_gen(analysis_result))
+
+    return batch
+
+
+def batch_stopwords(batch: StemBatch) -> StemBatch:
+    """Фильтрация токенов со стоп-словами (см. `pipe_stopwords`)"""
+    stopword_ids = batch.vocabulary.stopword_ids
+
+    if stopword_ids.isdisjoint(batch.lemmas):
+        return batch
+
+    return batch.select([i for i, lemma in enumerate(batch.lemmas) if lemma not in stopword_ids])
+
+
+def batch_kilo_postfix(batch: StemBatch) -> StemBatch:
+    """Замена токенов с "тысячным" постфиксом на целое число (см. `pipe_kilo_postfix`)"""
+    words = batch.words
+    replace = {
+        word_id: words[word_id].strip(KILO_POSTFIX).ljust(4, '0')
+        for word_id in set(batch.tokens)
+        if words[word_id] and words[word_id][0] == words[word_id][-1] == KILO_POSTFIX
+    }
+
+    if not replace:
+        return batch
+
+    replace = {word_id: batch.word_id(word) for word_id, word in replace.items()}
+    batch = batch.copy()
+    tokens, types = batch.tokens, batch.types
+    txt, num = TokenType.TXT, TokenType.NUM
+
+    for i, token in enumerate(tokens):
+        if token in replace and types[i] == txt:
+            tokens[i] = replace[token]
+            types[i] = num
+
+    return batch
+
+
+def batch_ord_unfold(batch: StemBatch) -> StemBatch:
+    """Преобразует токены с краткой записью порядкового числительного в целое число (см. `pipe_ord_unfold`)"""
+    words = batch.words
+    replace = {word_id: ord_unfold(words[word_id]) for word_id in set(batch.tokens) if is_ordfold(words[word_id])}
+
+    if not replace:
+        return batch
+
+    replace = {word_id: batch.word_id(word) for word_id, word in replace.items()}
+    batch = batch.copy()
+    tokens, types, lemmas, masks = batch.tokens, batch.types, batch.lemmas, batch.masks
+    empty_lemma, txt = batch.word_id(''), TokenType.TXT
+
+    for i, token in enumerate(tokens):
+        # токен без части речи и леммы (см. `pipe_ord_unfold`)
+        if token in replace and types[i] == txt and lemmas[i] == empty_lemma and not masks[i] & _POS_FIELD:
+            tokens[i] = replace[token]
+
+    return batch
+
+
+def batch_word2num(batch: StemBatch) -> StemBatch:
+    """Замена числительных на числа в предложениях, содержащих леммы числительных (см. `pipe_word2num`)"""
+    numeral_ids, lemmas, offsets = batch.vocabulary.numeral_ids, batch.lemmas, batch.offsets
+    rows = {
+        idx for idx, (start, end) in enumerate(zip(offsets, offsets[1:]))
+        if not numeral_ids.isdisjoint(lemmas[start:end])
+    }
+
+    return _batch_pipe(batch, rows, pipe_word2num)
+
+
+def batch_makedate(batch: StemBatch) -> StemBatch:
+    """Сборка дат в предложениях, содержащих названия месяцев или токены с датой (см. `pipe_makedate`)"""
+    month_ids, lemmas, types, offsets = batch.vocabulary.month_ids, batch.lemmas, batch.types, batch.offsets
+    date = TokenType.DATE
+    rows = {
+        idx for idx, (start, end) in enumerate(zip(offsets, offsets[1:]))
+        if not month_ids.isdisjoint(lemmas[start:end]) or date in types[start:end]
+    }
+
+    return _batch_pipe(batch, rows, pipe_makedate)
+
+
+def batch_merge_ccn(batch: StemBatch) -> StemBatch:
+    """Сборка номеров карт в предложениях, содержащих не менее 16 цифр в числовых токенах (см. `pipe_merge_ccn`)"""
+    words, tokens, offsets = batch.words, batch.tokens, batch.offsets
+    # числовые токены ищутся в байтах колонки типов без цикла интерпретатора по остальным токенам
+    types, num = batch.types.tobytes(), TokenType.NUM
+    digits = {}
+    i = types.find(num)
+
+    while i != -1:
+        idx = bisect_right(offsets, i) - 1
+        digits[idx] = digits.get(idx, 0) + len(words[tokens[i]])
+        i = types.find(num, i + 1)
+
+    return _batch_pipe(batch, {idx for idx, count in digits.items() if count >= 16}, pipe_merge_ccn)
+
+
+def _batch_pipe(batch: StemBatch, rows: Set[int], pipe: Callable[[Iterator[iStemTuple]], Iterator[iStemTuple]]):
+    """Применить этап пайплайна к предложениям пачки с номерами `rows`, остальные предложения копируются"""
+    if not rows:
+        return batch
+
+    result = batch._derived()
+    columns = [(getattr(batch, name), getattr(result, name)) for name in batch._columns[:-1]]
+    offsets, result_offsets = batch.offsets, result.offsets
+    copied = 0  # номер первого еще не скопированного предложения
+
+    for idx in sorted(rows) + [len(batch)]:
+        # предложения между обрабатываемыми копируются одним срезом каждой колонки
+        if copied < idx:
+            start, end = offsets[copied], offsets[idx]
+            shift = len(result.tokens) - start
+
+            for column, result_column in columns:
+                result_column.extend(column[start:end])
+
+            result_offsets.extend(offset + shift for offset in offsets[copied + 1:idx + 1])
+
+        if idx < len(batch):
+            result.append(pipe(batch.stems(idx)))
+
+        copied = idx + 1
+
+    return result
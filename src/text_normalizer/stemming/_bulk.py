@@ -0,0 +1,73 @@
+"""Модуль для пакетного морфологического анализа больших объемов текста"""
+
+import logging
+from itertools import chain
+from typing import Iterable, List, NamedTuple, Tuple
+
+from ._mystem import iStemmer
+
+__all__ = ['DedupInfo', 'analyze_unique']
+
+logger = logging.getLogger('rtn')
+
+
+class DedupInfo(NamedTuple):
+    """Статистика анализа уникальных словоформ"""
+    tokens: int     # количество токенов во всех списках
+    unique: int     # количество уникальных словоформ, переданных в анализатор
+
+    @property
+    def ratio(self) -> float:
+        """Во сколько раз сократился объем данных, переданных в анализатор"""
+        return self.tokens / self.unique if self.unique else 1.
+
+
+def analyze_unique(
+        token_lists: Iterable[Iterable[str]],
+        stemmer: iStemmer,
+        chunk_size: int = 1000) -> Tuple[List[List[dict]], DedupInfo]:
+    """
+    Морфологический анализ пачки списков токенов, при котором каждая словоформа анализируется один раз.
+
+    Уникальные словоформы всех списков передаются в анализатор запросами по `chunk_size` штук, а результат
+    разбора словоформы подставляется во все списки, где она встречается. Результат разбора словоформы
+    не должен зависеть от соседних словоформ, поэтому анализатор должен работать в контекстно-независимом
+    режиме, без снятия омонимии::
+
+        with jstem_ctx(disambiguation=False) as stemmer:
+            result, info = analyze_unique(token_lists, stemmer)
+            print(f'dedup ratio: {info.ratio:.1f}')
+
+    NB! Результат анализатора со снятием омонимии зависит от соседних словоформ, поэтому с таким
+    анализатором каждый список токенов анализируется целиком, без сокращения объема анализа.
+
+    :param token_lists: последовательность списков токенов
+    :param stemmer:     морфологический анализатор
+    :param chunk_size:  количество словоформ в одном запросе к анализатору
+    :return:            результат разбора каждого списка токенов и статистика сокращения объема анализа
+    """
+    token_lists = [list(tokens) for tokens in token_lists]
+
+    if getattr(stemmer, '_disambiguation', False):
+        logger.warning('Stemmer with disambiguation is used for context-free analysis, token lists analyzed as is')
+        tokens = sum(map(len, token_lists))
+
+        return stemmer.analyze_many(token_lists), DedupInfo(tokens, tokens)
+
+    vocabulary = list(dict.fromkeys(chain.from_iterable(token_lists)))
+    analyzed = {}
+
+    for start in range(0, len(vocabulary), chunk_size):
+        chunk = vocabulary[start:start + chunk_size]
+        result = stemmer.analyze(chunk)
+
+        if len(result) == len(chunk) and all(d.get('text') == t for d, t in zip(result, chunk)):
+            analyzed.update(zip(chunk, ([d] for d in result)))
+        else:
+            # mystem изменил разбиение на токены: результат каждой словоформы получается отдельно
+            logger.warning('Mystem output does not match input tokens, vocabulary analyzed by word')
+            analyzed.update(zip(chunk, stemmer.analyze_many([t] for t in chunk)))
+
+    info = DedupInfo(sum(map(len, token_lists)), len(vocabulary))
+
+    return [[d for t in tokens for d in analyzed[t]] for tokens in token_lists], info
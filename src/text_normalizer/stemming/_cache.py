@@ -0,0 +1,292 @@
+"""Модуль для кэширования результатов морфологического анализа токенов"""
+
+import errno
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple, Optional, Iterable, Tuple
+
+__all__ = ['AnalysisCache', 'PersistentAnalysisCache', 'CacheInfo', 'MYSTEM_CACHE_SIZE', 'MYSTEM_CACHE_PATH']
+
+logger = logging.getLogger('rtn')
+
+MYSTEM_CACHE_SIZE = int(os.environ.get('MYSTEM_CACHE_SIZE', 2 ** 16))
+# путь к файлу общего кэша результатов анализа для воркеров RTN и CLI
+MYSTEM_CACHE_PATH = os.environ.get('MYSTEM_CACHE_PATH', '')
+MYSTEM_CACHE_READONLY = bool(int(os.environ.get('MYSTEM_CACHE_READONLY', 0)))
+MYSTEM_CACHE_CAPACITY = int(os.environ.get('MYSTEM_CACHE_CAPACITY', 2 ** 18))
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class AnalysisCache:
+    """
+    Ограниченный по размеру LRU-кэш результатов морфологического анализа.
+
+    Ключом служит токен в исходном написании, значением - словарь с результатом анализа `mystem`
+    в том виде, в котором его принимает `stems_gen`. Возвращаемые словари общие для всех обращений
+    к кэшу и не должны изменяться.
+
+    Объект можно использовать из нескольких потоков одновременно.
+    """
+
+    def __init__(self, maxsize: int = MYSTEM_CACHE_SIZE):
+        """:param maxsize: максимальное количество токенов в кэше"""
+        if maxsize < 1:
+            raise ValueError(f'Invalid cache size {maxsize}')
+
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            try:
+                analysis = self._data[token]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(token)
+            self.hits += 1
+
+            return analysis
+
+    def put(self, token: str, analysis: dict):
+        with self._lock:
+            self._put(token, analysis)
+
+    def update(self, items: Iterable[Tuple[str, dict]]):
+        with self._lock:
+            for token, analysis in items:
+                self._put(token, analysis)
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self._maxsize, len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _put(self, token: str, analysis: dict):
+        data = self._data
+        data[token] = analysis
+        data.move_to_end(token)
+
+        if len(data) > self._maxsize:
+            data.popitem(last=False)
+
+
+class PersistentAnalysisCache:
+    """
+    Файловый кэш результатов морфологического анализа, отображаемый в память (mmap).
+
+    Файл кэша может одновременно использоваться несколькими процессами (например, всеми воркерами RTN
+    и вызовами CLI): страницы файла разделяются через страничный кэш ОС и не копируются в память каждого
+    процесса. Кэш рассчитан на преимущественно чтение: новые результаты дописываются в конец файла под
+    файловой блокировкой, ранее записанные данные не изменяются и не вытесняются.
+
+    Структура файла:
+        - заголовок: сигнатура, версия, количество слотов, количество записей
+        - хэш-таблица с открытой адресацией: смещения записей в файле (0 - пустой слот)
+        - записи: длина ключа, длина значения, токен и результат анализа в json
+
+    Объект можно использовать из нескольких потоков одновременно.
+    """
+
+    _MAGIC = b'TNAC'
+    _VERSION = 1
+    _HEADER = struct.Struct('<4sIQQ')
+    _SLOT = struct.Struct('<Q')
+    _RECORD = struct.Struct('<HI')
+    _MAX_LOAD = .75
+
+    def __init__(self, path: str, readonly: bool = False, capacity: int = MYSTEM_CACHE_CAPACITY):
+        """
+        :param path:     путь к файлу кэша. Если файл не существует, он будет создан
+        :param readonly: открыть кэш только для чтения. Новые результаты анализа не будут сохраняться
+        :param capacity: количество слотов хэш-таблицы для нового файла кэша (округляется до степени двойки)
+        """
+        self.path = path
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            self._create(path, 1 << max(capacity - 1, 1).bit_length())
+
+        self._file = open(path, 'rb' if readonly else 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._capacity, _ = self._HEADER.unpack_from(self._mm, 0)
+
+        if magic != self._MAGIC or version != self._VERSION:
+            self.close()
+            raise ValueError(f'Invalid analysis cache file {path}')
+
+        self._mask = self._capacity - 1
+
+    def get(self, token: str) -> Optional[dict]:
+        key = token.encode('utf-8')
+
+        with self._lock:
+            _, offset = self._find(key)
+
+            if not offset:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            key_len, val_len = self._record(offset)
+            start = offset + self._RECORD.size + key_len
+
+            return json.loads(self._mm[start:start + val_len])
+
+    def put(self, token: str, analysis: dict):
+        self.update(((token, analysis),))
+
+    def update(self, items: Iterable[Tuple[str, dict]]):
+        if self.readonly:
+            return
+
+        with self._lock:
+            fd = self._file.fileno()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+            try:
+                count = self._count()
+
+                for token, analysis in items:
+                    if count >= self._capacity * self._MAX_LOAD:
+                        logger.warning(f'Analysis cache {self.path} is full')
+                        break
+
+                    key = token.encode('utf-8')
+
+                    if len(key) > 0xFFFF:
+                        continue
+
+                    slot, offset = self._find(key)
+
+                    if offset:
+                        continue
+
+                    value = json.dumps(analysis, ensure_ascii=False).encode('utf-8')
+                    offset = os.lseek(fd, 0, os.SEEK_END)
+                    # запись публикуется в хэш-таблице только после того, как данные полностью записаны в файл
+                    os.pwrite(fd, self._RECORD.pack(len(key), len(value)) + key + value, offset)
+                    os.pwrite(fd, self._SLOT.pack(offset), self._HEADER.size + slot * self._SLOT.size)
+                    count += 1
+
+                os.pwrite(fd, struct.pack('<Q', count), self._HEADER.size - 8)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, int(self._capacity * self._MAX_LOAD), self._count())
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._file.close()
+                self._mm = None
+
+    def __contains__(self, token: str) -> bool:
+        with self._lock:
+            return bool(self._find(token.encode('utf-8'))[1])
+
+    def __len__(self) -> int:
+        # файл может быть отображен заново другим потоком (см. `_remap`)
+        with self._lock:
+            return self._count()
+
+    def __del__(self):
+        if getattr(self, '_mm', None) is not None:
+            self.close()
+
+    def _count(self) -> int:
+        return self._HEADER.unpack_from(self._mm, 0)[3]
+
+    def _find(self, key: bytes) -> Tuple[int, int]:
+        """Найти слот хэш-таблицы для ключа. Возвращает номер слота и смещение записи (0 - если ключа нет)"""
+        mask, table_start, slot_size, record_size = self._mask, self._HEADER.size, self._SLOT.size, self._RECORD.size
+        unpack_slot = self._SLOT.unpack_from
+        slot = zlib.crc32(key) & mask
+
+        while True:
+            offset, = unpack_slot(self._mm, table_start + slot * slot_size)
+
+            if not offset:
+                return slot, 0
+
+            key_len, _ = self._record(offset)
+
+            if key_len == len(key):
+                start = offset + record_size
+
+                if self._mm[start:start + key_len] == key:
+                    return slot, offset
+
+            slot = (slot + 1) & mask
+
+    def _record(self, offset: int) -> Tuple[int, int]:
+        """Длина ключа и значения записи по смещению"""
+        record = self._RECORD
+
+        if offset + record.size > len(self._mm):
+            self._remap()
+
+        key_len, val_len = record.unpack_from(self._mm, offset)
+
+        if offset + record.size + key_len + val_len > len(self._mm):
+            self._remap()
+
+        return key_len, val_len
+
+    def _remap(self):
+        # файл был дополнен другим процессом после создания отображения
+        self._mm.close()
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def _create(cls, path: str, capacity: int):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cls._HEADER.pack(cls._MAGIC, cls._VERSION, capacity, 0))
+                f.truncate(cls._HEADER.size + capacity * cls._SLOT.size)
+            # файл публикуется атомарно: если другой процесс уже создал кэш, используется его файл
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
@@ -0,0 +1,323 @@
+"""
+Модуль для сборки этапов пайплайна в один проход по результатам морфологического анализа.
+
+Каждому этапу `pipe_*` соответствует фабрика, которая по функции передачи результата следующему этапу (`emit`)
+создает пару функций (`push`, `flush`): `push` принимает очередной токен и передает результаты дальше сразу,
+`flush` выдает содержимое буферов этапа в конце предложения и возвращает этап в начальное состояние
+(None - этап без состояния). Результат этапа совпадает с результатом соответствующей функции `pipe_*`.
+"""
+
+from collections import deque
+from itertools import takewhile
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple, Optional
+
+from ._mystem import iStemTuple, stems_gen, POS, grammem_mask, is_numeral
+from ._processing import (
+    pipe_word2num, pipe_makedate, pipe_ord_unfold, pipe_kilo_postfix, pipe_stopwords, pipe_merge_ccn,
+    _pipeline, _stopwords)
+from ..convert import MONTHS_SET, month2num, is_ordfold, ord_unfold, NUMERALS, NumeralAutomaton
+from ..tokenization import TokenType, KILO_POSTFIX
+
+__all__ = ['CompiledPipeline', 'compile_pipeline']
+
+_Emit = Callable[[iStemTuple], None]
+_Stage = Tuple[_Emit, Optional[Callable[[], None]]]
+
+_consume = deque(maxlen=0).extend
+
+
+def _word2num(emit: _Emit) -> _Stage:
+    """Этап `pipe_word2num`"""
+    automaton = NumeralAutomaton()
+    feed, flush_numbers, numeral_of = automaton.feed, automaton.flush, NUMERALS.get
+    grammem = qual = None
+    num_token_type = TokenType.NUM
+
+    def push(s):
+        nonlocal grammem, qual
+        token, lemma, grammem, qual = s
+        numeral = numeral_of(lemma)
+
+        if numeral is not None and grammem and is_numeral(grammem_mask(grammem)):
+            for num in feed(token[0], lemma, numeral):
+                emit(((f'{num}', num_token_type), num, grammem, qual))
+
+            return
+
+        if automaton.count:
+            for num in flush_numbers():
+                emit(((f'{num}', num_token_type), num, grammem, qual))
+
+        emit(s)
+
+    def flush():
+        # как и в `pipe_word2num`, граммемы и признак словарного слова берутся из последнего полученного токена
+        for num in flush_numbers():
+            emit(((f'{num}', num_token_type), num, grammem, qual))
+
+        automaton.reset()
+
+    return push, flush
+
+
+def _makedate(emit: _Emit) -> _Stage:
+    """Этап `pipe_makedate`"""
+    grammem = qual = None
+    _date_buffer = []
+    date_token_type, numtoken_type = TokenType.DATE, TokenType.NUM
+
+    def date_buffer():
+        if len(_date_buffer) == 3:
+            day, month, year = [_s[1] or _s[0][0] for _s in _date_buffer]
+            _month = month2num(month)
+
+            if _month:
+                _date_buffer.clear()
+                emit(((f'{day}.{f"{_month}".zfill(2)}.{year}', date_token_type), '', grammem, qual))
+                return
+
+        for _s in _date_buffer:
+            emit(_s)
+
+        _date_buffer.clear()
+
+    def push(s):
+        nonlocal grammem, qual
+        token, lemma, grammem, qual = s
+
+        if token[1] is date_token_type:
+            emit(((token[0], date_token_type), '', None, qual))
+            return
+
+        if token[1] is numtoken_type or lemma in MONTHS_SET:
+            _date_buffer.append(s)
+            return
+
+        if _date_buffer:
+            date_buffer()
+
+        emit(s)
+
+    def flush():
+        if _date_buffer:
+            date_buffer()
+
+    return push, flush
+
+
+def _ord_unfold(emit: _Emit) -> _Stage:
+    """Этап `pipe_ord_unfold`"""
+    txt = TokenType.TXT
+
+    def push(s):
+        token_val, t_type = s[0]
+
+        if t_type == txt and not s[1] and not (s[2] and s[2][POS]) and is_ordfold(token_val):
+            emit(((ord_unfold(token_val), t_type), s[1], s[2], s[3]))
+        else:
+            emit(s)
+
+    return push, None
+
+
+def _kilo_postfix(emit: _Emit) -> _Stage:
+    """Этап `pipe_kilo_postfix`"""
+    txt, num = TokenType.TXT, TokenType.NUM
+
+    def push(s):
+        token, type_ = s[0]
+
+        if type_ == txt and token[0] == token[-1] == KILO_POSTFIX:
+            emit(((token.strip(KILO_POSTFIX).ljust(4, '0'), num), s[1], s[2], s[3]))
+        else:
+            emit(s)
+
+    return push, None
+
+
+def _stopwords_filter(emit: _Emit) -> _Stage:
+    """Этап `pipe_stopwords`"""
+
+    def push(s):
+        if s[1] not in _stopwords:
+            emit(s)
+
+    return push, None
+
+
+def _merge_ccn(emit: _Emit) -> _Stage:
+    """Этап `pipe_merge_ccn`"""
+    _buffer = []
+    buffer_len = 0
+    append = _buffer.append
+    num_token_type, card_token_type = TokenType.NUM, TokenType.CARDNUM
+
+    def buffer():
+        if buffer_len == 16:
+            emit(((''.join(_s[0][0] for _s in _buffer), card_token_type), '', None, True))
+        else:
+            for _s in _buffer:
+                emit(_s)
+
+        _buffer.clear()
+
+    def push(s):
+        nonlocal buffer_len
+        token = s[0]
+
+        if buffer_len < 16 and token[1] == num_token_type:
+            append(s)
+            buffer_len += len(token[0])
+            return
+
+        if _buffer:
+            buffer()
+            buffer_len = 0
+
+        emit(s)
+
+    def flush():
+        nonlocal buffer_len
+
+        if _buffer:
+            buffer()
+
+        buffer_len = 0
+
+    return push, flush
+
+
+# фабрики этапов для функций пайплайна
+_stages = {
+    pipe_word2num: _word2num,
+    pipe_makedate: _makedate,
+    pipe_ord_unfold: _ord_unfold,
+    pipe_kilo_postfix: _kilo_postfix,
+    pipe_stopwords: _stopwords_filter,
+    pipe_merge_ccn: _merge_ccn,
+}
+
+
+class CompiledPipeline:
+    """
+    Пайплайн обработки результатов морфологического анализа, собранный в один проход (см. `compile_pipeline`).
+
+    Вместо цепочки генераторов, через каждый из которых проходит каждый токен, токены передаются от этапа
+    к этапу вызовом функции, а результат предложения собирается в список.
+    Этапы, для которых нет однопроходной реализации (например, пользовательские функции или `pipe_word2num`
+    с другой функцией конвертации), и все следующие за ними выполняются цепочкой генераторов.
+    """
+
+    def __init__(self, pipe: Sequence[Callable[[Iterable[iStemTuple]], Iterable[iStemTuple]]] = ()):
+        """
+        :param pipe: функции пайплайна в порядке выполнения (см. `pipeline`)
+        """
+        self.pipe = tuple(pipe)
+        self._factories = tuple(_stages[p] for p in takewhile(lambda p: p in _stages, self.pipe))
+        self._rest = self.pipe[len(self._factories):]
+        # собранные цепочки этапов, готовые к обработке следующего предложения
+        self._chains = []
+
+    def __call__(self, analysis_result: Iterable[dict], lazy: bool = False) -> List[iStemTuple]:
+        """
+        :param analysis_result: результ морфологического разбора MyStem
+        :param lazy: откладывать разбор граммем до первого обращения (см. `stems_gen`)
+        """
+        return self.process(stems_gen(analysis_result, lazy))
+
+    def process(self, stems: Iterable[iStemTuple]) -> List[iStemTuple]:
+        """
+        Выполнить пайплайн для уже полученных токенов (e.g. результата предыдущего пайплайна)
+
+        :param stems: токены результата анализа (см. `stems_gen`)
+        """
+        # цепочка используется одним потоком: list.pop и list.append атомарны
+        try:
+            chain = self._chains.pop()
+        except IndexError:
+            chain = self._chain()
+
+        output, push, flushes = chain
+        # токены передаются первому этапу без цикла интерпретатора
+        _consume(map(push, stems))
+
+        for flush in flushes:
+            flush()
+
+        result = output.copy()
+        output.clear()
+        # после ошибки этапа цепочка не возвращается: ее буферы могут быть не пусты
+        self._chains.append(chain)
+
+        if self._rest:
+            result = list(_pipeline(iter(result), *self._rest))
+
+        return result
+
+    def stream(self, analysis_result: Iterable[dict], lazy: bool = False) -> Iterator[iStemTuple]:
+        """
+        Выполнить пайплайн, выдавая результаты по мере поступления результатов анализа (см. `analyze_iter`).
+        Токен выдается, как только этапы передали его дальше, без ожидания конца предложения.
+
+        :param analysis_result: результ морфологического разбора MyStem
+        :param lazy: откладывать разбор граммем до первого обращения (см. `stems_gen`)
+        """
+        stems = self._stream(stems_gen(analysis_result, lazy))
+
+        return _pipeline(stems, *self._rest) if self._rest else stems
+
+    def _stream(self, stems: Iterable[iStemTuple]) -> Iterator[iStemTuple]:
+        try:
+            chain = self._chains.pop()
+        except IndexError:
+            chain = self._chain()
+
+        output, push, flushes = chain
+
+        for stem in stems:
+            push(stem)
+
+            if output:
+                yield from output
+                output.clear()
+
+        for flush in flushes:
+            flush()
+
+        yield from output
+        output.clear()
+        # цепочка не возвращается, если выдача результата не была завершена
+        self._chains.append(chain)
+
+    def _chain(self) -> Tuple[List[iStemTuple], _Emit, List[Callable[[], None]]]:
+        output = []
+        push, flushes = output.append, []
+
+        for factory in reversed(self._factories):
+            push, flush = factory(push)
+
+            if flush is not None:
+                flushes.append(flush)
+
+        # буферы этапов освобождаются в порядке выполнения этапов
+        flushes.reverse()
+
+        return output, push, flushes
+
+    def __reduce__(self):
+        return CompiledPipeline, (self.pipe,)
+
+
+def compile_pipeline(
+        pipe: Sequence[Callable[[Iterable[iStemTuple]], Iterable[iStemTuple]]] = ()) -> CompiledPipeline:
+    """
+    Собрать функции пайплайна в один проход по результатам анализа. Результат совпадает с результатом `pipeline`::
+
+        pl = compile_pipeline(compose_pipeline(*Pipeline))
+
+        for stem in pl(analysis_result):
+            # do smth with result
+
+    :param pipe: функции пайплайна в порядке выполнения (см. `pipeline`)
+    """
+    return CompiledPipeline(pipe)
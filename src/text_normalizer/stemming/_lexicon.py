@@ -0,0 +1,252 @@
+"""
+Модуль для морфологического анализа токенов по скомпилированному словарю (лексикону) без обращения к MyStem.
+
+Лексикон строится заранее: словоформы (например, из `fixlist.txt` и частотного словаря) анализируются `mystem`
+в контекстно-независимом режиме, а результаты сохраняются в компактный файл::
+
+    python -m text_normalizer.stemming._lexicon lexicon.gz words.txt
+
+"""
+
+import gzip
+import logging
+import os
+import re
+import sys
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Tuple, Optional
+
+from ._mystem import iStemmer, jstem_ctx, _stem_conf
+from ..settings import DATA_PATH
+
+__all__ = ['Lexicon', 'LexiconStemmer', 'build_lexicon', 'fixlist_forms']
+
+logger = logging.getLogger('rtn')
+
+_LEXICON_HEADER = '#text_normalizer lexicon v1'
+_fixlist_regex = re.compile(r'^\[(\w+)\](\w*)\s')
+
+
+class Lexicon:
+    """
+    Скомпилированный словарь результатов морфологического анализа: словоформа -> лемма и граммемы.
+
+    Словоформы хранятся в хэш-таблице с учетом регистра: разбор `mystem` зависит от регистра словоформы
+    (e.g. имена собственные). Строки граммем хранятся в общей таблице без повторов.
+    Результат поиска совпадает с первым вариантом разбора `mystem` без снятия омонимии.
+    """
+
+    def __init__(self, entries: Dict[str, Tuple[str, int, bool]] = None, grammems: List[str] = None):
+        """
+        :param entries:  словоформа -> (лемма, номер строки граммем, признак словарного слова)
+        :param grammems: таблица строк граммем
+        """
+        self._entries = entries or {}
+        self._grammems = grammems or []
+        self._grammem_ids = {gr: idx for idx, gr in enumerate(self._grammems)}
+
+    def add(self, word: str, analysis: dict):
+        """
+        Добавить в лексикон результат разбора словоформы
+
+        :param word:     словоформа
+        :param analysis: вариант разбора mystem (e.g. {"lex": "мама", "gr": "S,жен,од=им,ед"})
+        """
+        gr = analysis['gr']
+        gr_id = self._grammem_ids.get(gr)
+
+        if gr_id is None:
+            gr_id = self._grammem_ids[gr] = len(self._grammems)
+            self._grammems.append(gr)
+
+        self._entries[word] = (analysis['lex'], gr_id, 'qual' not in analysis)
+
+    def lookup(self, token: str) -> Optional[dict]:
+        """Получить вариант разбора словоформы в формате mystem или None, если словоформы нет в лексиконе"""
+        entry = self._entries.get(token)
+
+        if entry is None:
+            return None
+
+        lemma, gr_id, qual = entry
+        analysis = {'lex': lemma, 'gr': self._grammems[gr_id]}
+
+        if not qual:
+            analysis['qual'] = 'bastard'
+
+        return analysis
+
+    def save(self, path: str):
+        """
+        Сохранить лексикон в файл.
+
+        Формат файла (gzip, utf-8): заголовок, количество строк граммем, строки граммем,
+        затем словоформы в виде `словоформа<TAB>лемма<TAB>номер граммем<TAB>признак словарного слова`
+        """
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(f'{_LEXICON_HEADER}\n{len(self._grammems)}\n')
+            f.writelines(f'{gr}\n' for gr in self._grammems)
+            f.writelines(f'{word}\t{lemma}\t{gr_id}\t{int(qual)}\n'
+                         for word, (lemma, gr_id, qual) in sorted(self._entries.items()))
+
+    @classmethod
+    def load(cls, path: str) -> 'Lexicon':
+        """Загрузить лексикон из файла"""
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            if f.readline().rstrip('\n') != _LEXICON_HEADER:
+                raise ValueError(f'Invalid lexicon file {path}')
+
+            grammems = [f.readline().rstrip('\n') for _ in range(int(f.readline()))]
+            entries = {}
+
+            for line in f:
+                word, lemma, gr_id, qual = line.rstrip('\n').split('\t')
+                entries[word] = (lemma, int(gr_id), qual == '1')
+
+        logger.debug(f'Lexicon {path} loaded: {len(entries)} words, {len(grammems)} grammems')
+
+        return cls(entries, grammems)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LexiconStemmer(iStemmer):
+    """
+    Морфологический анализатор, использующий лексикон в памяти процесса.
+
+    Списки токенов, все токены которых найдены в лексиконе, анализируются без обращения к `mystem`.
+    Остальные списки передаются резервному анализатору целиком одним запросом, чтобы `mystem` снимал
+    омонимию с учетом контекста::
+
+        lexicon = Lexicon.load('lexicon.gz')
+
+        with jstem_ctx() as mystem:
+            stem = LexiconStemmer(lexicon, fallback=mystem)
+            result = stem.analyze(['мама', 'мыла', 'раму'])
+
+    Результат для списков, найденных в лексиконе, не зависит от контекста (см. `CachedJsonStemmer`).
+    """
+
+    def __init__(self, lexicon: Lexicon, fallback: iStemmer = None):
+        """
+        :param lexicon:  лексикон
+        :param fallback: анализатор для токенов, которых нет в лексиконе.
+                         Если не передан, такие токены возвращаются без разбора
+        """
+        self.lexicon = lexicon
+        self.fallback = fallback
+
+    def start(self):
+        if self.fallback is not None:
+            self.fallback.start()
+
+    def stop(self):
+        if self.fallback is not None:
+            self.fallback.stop()
+
+    def analyze(self, tokens: Iterator[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов"""
+        return self.analyze_many([tokens])[0]
+
+    def analyze_many(self, token_lists: Iterable[Iterable[str]]) -> List[List[dict]]:
+        """
+        Получить результат морфологического разбора нескольких списков токенов.
+        Списки, в которых есть отсутствующие в лексиконе токены, передаются резервному анализатору целиком
+        одним запросом (см. `iStemmer.analyze_many`).
+        """
+        lookup = self.lexicon.lookup
+        result = []
+        missed = []     # (номер списка, токены списка)
+
+        for idx, tokens in enumerate(token_lists):
+            tokens = list(tokens)
+            items = [{'analysis': [a] if a else [], 'text': t} for t, a in zip(tokens, map(lookup, tokens))]
+
+            if self.fallback is not None and not all(d['analysis'] for d in items):
+                missed.append((idx, tokens))
+
+            result.append(items)
+
+        if missed:
+            for (idx, _), analyzed in zip(missed, self.fallback.analyze_many([tokens for _, tokens in missed])):
+                result[idx] = analyzed
+
+        return result
+
+
+def fixlist_forms(path: str = os.path.join(DATA_PATH, _stem_conf['fixlist_file'])) -> Iterator[str]:
+    """
+    Словоформы из пользовательского словаря mystem (fixlist)::
+
+        [лям]а S,m,gen,sg,inan -> ляма
+
+    Словоформа выдается один раз, даже если для нее в словаре задано несколько разборов.
+
+    :param path: путь к файлу fixlist
+    """
+    seen = set()
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            match = _fixlist_regex.match(line)
+
+            if match:
+                word = ''.join(match.groups())
+
+                if word not in seen:
+                    seen.add(word)
+                    yield word
+
+
+def build_lexicon(stemmer: iStemmer, words: Iterable[str], chunk_size: int = 1000) -> Lexicon:
+    """
+    Построить лексикон из результатов анализа словоформ.
+
+    Повторяющиеся словоформы анализируются один раз. Анализатор должен работать без снятия омонимии,
+    чтобы результат не зависел от соседних словоформ::
+
+        with jstem_ctx(disambiguation=False) as stemmer:
+            lexicon = build_lexicon(stemmer, fixlist_forms())
+
+    :param stemmer:    морфологический анализатор
+    :param words:      словоформы
+    :param chunk_size: количество словоформ в одном запросе к анализатору
+    """
+    lexicon = Lexicon()
+    words = iter(dict.fromkeys(words))
+
+    while True:
+        chunk = list(islice(words, chunk_size))
+
+        if not chunk:
+            break
+
+        for d in stemmer.analyze(chunk):
+            if d.get('analysis'):
+                lexicon.add(d['text'], d['analysis'][0])
+
+    return lexicon
+
+
+if __name__ == '__main__':
+    output_path, *word_files = sys.argv[1:] or [None]
+
+    if not output_path:
+        sys.exit(f'Usage: python -m {__spec__.name} OUTPUT [WORDS_FILE ...]')
+
+    def _words():
+        yield from fixlist_forms()
+
+        for word_file in word_files:
+            with open(word_file, encoding='utf-8') as f:
+                yield from (w for line in f for w in line.split())
+
+    with jstem_ctx(disambiguation=False) as _stemmer:
+        _lexicon = build_lexicon(_stemmer, _words())
+
+    _lexicon.save(output_path)
+    print(f'{len(_lexicon)} words saved to {output_path}')
@@ -1,18 +1,31 @@
 """Модуль для лемматизации и морфологического анализа токенов с помощью MyStem"""
 
 import errno
+import io
 import json
 import logging
 import os
+import re
+import select
+from abc import ABC, abstractmethod
+from codecs import getincrementaldecoder
+from collections import deque
+from concurrent.futures import Future
 from contextlib import contextmanager
 from enum import Enum
-from functools import lru_cache
+from functools import lru_cache, partial
 from itertools import chain
-from typing import Iterator, Tuple, Mapping, List, Dict, Any
+from multiprocessing import cpu_count
+from queue import Queue
+from threading import Event, Lock, Semaphore, Thread
+from time import monotonic
+from typing import Iterator, Iterable, Tuple, Mapping, List, Dict, Any, Callable, Optional, Sequence
 
 from pymystem3 import Mystem
 
+from ._cache import AnalysisCache, PersistentAnalysisCache, MYSTEM_CACHE_PATH, MYSTEM_CACHE_READONLY
 from ..config import PipelineConfigType, load_conf
+from ..convert._numeral import _cardinals
 from ..settings import DATA_PATH
 from ..tokenization import TokenType, token_type, iTokenTuple
 
@@ -20,18 +33,55 @@ __all__ = [
     'stems_gen',
     'jstem_inst',
     'jstem_ctx',
+    'jstem_shared_ctx',
+    'jstem_shared_factory',
     'to_dict',
     'to_tuple',
     'iStemTuple',
+    'FrozenGrammem',
+    'LazyGrammem',
+    'STEM_FIELDS',
+    'stem_converter',
+    'grammem_mask',
+    'mask_grammem',
+    'mask_value',
+    'has_grammem',
+    'is_num',
+    'is_numeral',
     'POS',
+    'iStemmer',
+    'MystemTimeoutError',
     'JsonStemmer',
+    'CachedJsonStemmer',
+    'PipelinedJsonStemmer',
+    'MystemPool',
+    'mystem_pool_ctx',
 ]
 
 logger = logging.getLogger('rtn')
 
-_numerics = load_conf(PipelineConfigType.NUMERICS)
 _stem_conf = load_conf(PipelineConfigType.MYSTEM)
 
+MYSTEM_POOL_SIZE = int(os.environ.get('MYSTEM_POOL_SIZE', cpu_count()))
+
+# Максимальное время ожидания ответа mystem на один запрос, секунды (0 - без ограничения)
+MYSTEM_TIMEOUT = float(os.environ.get('MYSTEM_TIMEOUT', 30))
+
+# Максимальное количество разобранных строк граммем mystem в кэше
+MYSTEM_GRAMMEM_CACHE_SIZE = int(os.environ.get('MYSTEM_GRAMMEM_CACHE_SIZE', 2 ** 14))
+
+# Разделитель предложений при пакетном анализе.
+# Токенизатор разбивает строку по пробельным символам, поэтому токен с таким значением не может
+# встретиться в предложении
+SENTENCE_BOUNDARY = '\n'
+
+# Токены пробного запроса, выполняемого после запуска mystem
+WARMUP_TOKENS = ('мама', 'мыла', 'раму', 'сто', 'двадцать', 'три')
+
+_json_decoder = json.JSONDecoder()
+# начало массива, разделители элементов и пробельные символы между объектами в ответе mystem
+_skip_separators = re.compile(r'[\s,\[]*').match
+
 """
 Граммемная информация
 см. https://yandex.ru/dev/mystem/doc/grammemes-values.html
@@ -152,6 +202,100 @@ class Ambiguous(Enum):
     AMBIGOUS = ""
 
 
+class FrozenGrammem(dict):
+    """
+    Неизменяемый словарь граммем.
+
+    Строк граммем, которые выдает mystem, всего несколько тысяч, поэтому `stems_gen` разбирает каждую строку
+    один раз и возвращает один и тот же объект для всех токенов с такой строкой граммем. Изменение общего
+    объекта повлияло бы на все токены, поэтому методы изменения словаря вызывают `TypeError`.
+    Для получения измененной копии используйте `replace`.
+
+    Атрибут `mask` содержит битовую маску граммем словаря, которую этапы пайплайна могут сравнивать
+    вместо поиска значений по ключам-перечислениям (см. `grammem_mask`).
+    """
+    __slots__ = ('mask',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # целочисленная маска граммем (см. `grammem_mask`)
+        self.mask = _encode_grammem(self)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is immutable')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _immutable
+
+    def replace(self, key, value) -> 'FrozenGrammem':
+        """Получить копию словаря с измененным значением граммемы"""
+        grammem = dict(self)
+        grammem[key] = value
+
+        return FrozenGrammem(grammem)
+
+    def __reduce__(self):
+        return FrozenGrammem, (dict(self),)
+
+
+class LazyGrammem(Mapping):
+    """
+    Словарь граммем, строка граммем mystem которого разбирается при первом обращении к данным.
+
+    `stems_gen` в режиме `lazy` не разбирает строки граммем: если ни один этап пайплайна и ни одно поле
+    результата (см. `stem_converter`) не обращаются к граммемам токена, разбор не выполняется.
+    При обращении к данным словарь ведет себя так же, как `FrozenGrammem`.
+    """
+    __slots__ = ('_gr', '_numeral', '_grammem')
+
+    def __init__(self, mystem_grammem_str: str, numeral: bool = False):
+        """
+        :param mystem_grammem_str: строка граммем mystem
+        :param numeral:            лемма токена является числительным (см. `stems_gen`)
+        """
+        self._gr = mystem_grammem_str
+        self._numeral = numeral
+        self._grammem = None
+
+    def decode(self) -> FrozenGrammem:
+        """Получить разобранную строку граммем"""
+        grammem = self._grammem
+
+        if grammem is None:
+            grammem = _grammem(self._gr)
+
+            # уточнение части речи для некоторых числительных (см. `stems_gen`)
+            if self._numeral and grammem.get(POS) != POS.NUM:
+                grammem = _numeral_grammem(self._gr)
+
+            self._grammem = grammem
+
+        return grammem
+
+    @property
+    def mask(self) -> int:
+        """Битовая маска граммем (см. `grammem_mask`)"""
+        return self.decode().mask
+
+    def __getitem__(self, key):
+        return self.decode()[key]
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __len__(self) -> int:
+        return len(self.decode())
+
+    def __bool__(self) -> bool:
+        # непустая строка граммем всегда содержит хотя бы часть речи
+        return bool(self._gr)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self._gr!r})'
+
+    def __reduce__(self):
+        return LazyGrammem, (self._gr, self._numeral)
+
+
 class iStemTuple(Tuple):
     """
     Интерфейс для построения пайплайна обработки результата морфологического анализа
@@ -167,6 +311,43 @@ class iStemTuple(Tuple):
     _qual:       bool
 
 
+class MystemTimeoutError(TimeoutError):
+    """Процесс `mystem` не ответил на запрос за отведенное время"""
+
+
+class iStemmer(ABC):
+    """
+    Интерфейс морфологического анализатора (бэкенда морфологии) для работы со списком токенов.
+
+    Реализация должна возвращать результат разбора в формате `mystem`, который принимает `stems_gen`::
+
+        [{"analysis": [{"lex": "мама", "gr": "S,жен,од=им,ед"}], "text": "мама"}, ...]
+
+    """
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def warmup(self):
+        """Выполнить пробный запрос, чтобы первый настоящий запрос не ожидал загрузки словарей"""
+        self.analyze(WARMUP_TOKENS)
+
+    @abstractmethod
+    def analyze(self, tokens: Iterator[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов"""
+
+    def analyze_many(self, token_lists: Iterable[Iterable[str]]) -> List[List[dict]]:
+        """Получить результат морфологического разбора нескольких списков токенов"""
+        return [self.analyze(tokens) for tokens in token_lists]
+
+    def analyze_iter(self, tokens: Iterator[str]) -> Iterator[dict]:
+        """Получить результат морфологического разбора списка токенов в виде итератора"""
+        return iter(self.analyze(tokens))
+
+
 class Stemmer(Mystem):
     """Интерфейс для работы с морфологическим анализатором Mystem"""
 
@@ -194,31 +375,511 @@ class Stemmer(Mystem):
         logger.debug('MyStem stopped')
 
 
-class JsonStemmer(Stemmer):
-    """Реализация морфологического анализатора для работы со списком токенов"""
-    def __init__(self, **kwargs):
+class JsonStemmer(Stemmer, iStemmer):
+    """
+    Реализация морфологического анализатора для работы со списком токенов.
+
+    Ожидание ответа `mystem` на каждый запрос ограничено таймаутом стеммера. Процесс, не ответивший
+    за отведенное время (например, зависший на некорректных входных данных), принудительно завершается
+    и запускается заново, а запрос завершается ошибкой `MystemTimeoutError`. Количество таймаутов и
+    перезапусков процесса доступно в атрибутах `timeouts` и `restarts`.
+    """
+    def __init__(self, timeout: float = MYSTEM_TIMEOUT, **kwargs):
+        """
+        :param timeout: максимальное время ожидания ответа `mystem` на один запрос, секунды.
+                        0 или None - ожидать без ограничения
+        """
         super().__init__(**kwargs)
         self._mystemargs.append("--input-format")
         self._mystemargs.append("json")
+        self.timeout = timeout
+        self.timeouts = 0
+        self.restarts = 0
+        self._request_no = 0    # номер последнего переданного запроса
+        self._unread = False    # ответ на последний запрос прочитан не полностью
 
     def analyze(self, tokens: Iterator[str]) -> List[dict]:
         """Получить результат морфологического разбора списка токенов"""
 
+        return self._analyze_impl(json.dumps([{"analysis": [], "text": t} for t in tokens]).encode("utf-8"))
+
+    def analyze_iter(self, tokens: Iterator[str]) -> Iterator[dict]:
+        """
+        Получить результат морфологического разбора списка токенов в виде итератора.
+
+        Запрос передается в `mystem` сразу, а ответ разбирается по мере поступления: первые результаты
+        доступны до того, как `mystem` закончит анализ всего списка, и ответ не хранится в памяти целиком::
+
+            for stem in pipeline(stem.analyze_iter(tokens), pipe):
+                ...
+
+        Итератор нужно прочитать до конца до следующего обращения к стеммеру. Следующий запрос отбрасывает
+        непрочитанный остаток ответа, а итератор после этого завершается ошибкой.
+        """
+        deadline = self._send(json.dumps([{"analysis": [], "text": t} for t in tokens]).encode("utf-8"))
+
+        return self._iter_response(deadline, self._request_no)
+
+    def warmup(self):
+        # запрос передается в mystem напрямую, минуя кэш результатов анализа подклассов
+        self._analyze_impl(json.dumps([{"analysis": [], "text": t} for t in WARMUP_TOKENS]).encode("utf-8"))
+
+    def restart(self):
+        """Принудительно завершить процесс `mystem` и запустить новый"""
+        logger.warning('Restarting Mystem...')
+
+        if self._proc is not None:
+            # зависший процесс может не реагировать на SIGTERM, который отправляет `close`
+            self._proc.kill()
+
+        self.close()
+        self._start_mystem()
+        self.restarts += 1
+        # ответы на переданные ранее запросы больше не будут получены
+        self._request_no += 1
+        self._unread = False
+
+    def _analyze_impl(self, text) -> List[dict]:
+        # заменяет реализацию pymystem3, которая ожидает первый ответ mystem без ограничения по времени
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+
+        return json.loads(self._analyze_raw(text))
+
+    def _analyze_raw(self, data: bytes) -> bytes:
+        """Передать запрос в `mystem` и получить строку ответа без разбора json"""
+
+        deadline = self._send(data)
+        out = bytearray()
+
+        while True:
+            chunk = self._read_chunk(deadline, out)
+
+            if chunk is None:
+                continue
+
+            out += chunk
+
+            # mystem выдает ответ на каждую строку запроса отдельной строкой
+            if out.endswith(b'\n'):
+                self._unread = False
+                return bytes(out)
+
+    def _iter_response(self, deadline: Optional[float], request_no: int) -> Iterator[dict]:
+        """Разбирать ответ `mystem` на запрос `request_no` по мере поступления"""
+
+        decoder = getincrementaldecoder('utf-8')()
+        raw_decode = _json_decoder.raw_decode
+        skip = _skip_separators
+        buf, pos = '', 0
+
+        while True:
+            if request_no != self._request_no:
+                raise RuntimeError('Mystem response was discarded by the next request')
+
+            chunk = self._read_chunk(deadline, buf[pos:pos + 100].encode('utf-8'))
+
+            if chunk is None:
+                continue
+
+            if chunk.endswith(b'\n'):
+                self._unread = False
+
+            buf = buf[pos:] + decoder.decode(chunk)
+            pos = 0
+
+            while True:
+                pos = skip(buf, pos).end()
+
+                if pos == len(buf):
+                    break
+
+                if buf[pos] == ']':
+                    return
+
+                try:
+                    item, pos = raw_decode(buf, pos)
+                except ValueError:
+                    # объект еще не получен целиком
+                    if not self._unread:
+                        raise RuntimeError(f'Invalid Mystem output: {buf[pos:pos + 100]!r}')
+                    break
+
+                if request_no != self._request_no:
+                    raise RuntimeError('Mystem response was discarded by the next request')
+
+                yield item
+
+    def _send(self, data: bytes) -> Optional[float]:
+        """Передать запрос в `mystem`. Возвращает срок ответа на запрос"""
+
+        if self._proc is None:
+            self._start_mystem()
+
+        if self._unread:
+            self._drain()
+
+        timeout = self.timeout
+        deadline = monotonic() + timeout if timeout else None
+
+        try:
+            self._procin.write(data)
+            self._procin.write(b'\n')
+            self._procin.flush()
+        except OSError as e:
+            self.restart()
+            raise RuntimeError(f'Could not write to Mystem: {e}') from e
+
+        self._request_no += 1
+        self._unread = True
+
+        return deadline
+
+    def _read_chunk(self, deadline: Optional[float], out: bytes) -> Optional[bytes]:
+        """Прочитать доступную часть ответа `mystem` до истечения срока ответа"""
+
+        wait = None if deadline is None else max(deadline - monotonic(), 0)
+        rd, _, _ = select.select([self._procout_no], [], [], wait)
+
+        if self._procout_no not in rd:
+            self.timeouts += 1
+            logger.error(f'Mystem did not respond in {self.timeout}s. Current output: {bytes(out[:100])!r}')
+            self.restart()
+            raise MystemTimeoutError(f'Mystem did not respond in {self.timeout}s')
+
+        chunk = self._procout.read()
+
+        if chunk is not None and not chunk:
+            self.restart()
+            raise RuntimeError(f'Mystem process exited. Current output: {bytes(out[:100])!r}')
+
+        return chunk
+
+    def _drain(self):
+        # остаток ответа на предыдущий запрос, если итератор `analyze_iter` не был прочитан до конца
+        timeout = self.timeout
+        deadline = monotonic() + timeout if timeout else None
+
+        while self._unread:
+            chunk = self._read_chunk(deadline, b'')
+
+            if chunk and chunk.endswith(b'\n'):
+                self._unread = False
+
+    def analyze_many(self, token_lists: Iterable[Iterable[str]]) -> List[List[dict]]:
+        """
+        Получить результат морфологического разбора нескольких списков токенов за одно обращение к `mystem`.
+
+        Списки токенов объединяются в один запрос через токен-разделитель `SENTENCE_BOUNDARY`,
+        а результат разбора разделяется обратно по этому же токену::
+
+            stem.analyze_many([['мама', 'мыла', 'раму'], ['папа', 'красил', 'окно']])
+            # [[{...}, {...}, {...}], [{...}, {...}, {...}]]
+
+        :param token_lists: последовательность списков токенов
+        :raises RuntimeError: если результат разбора не удалось разделить на исходные списки
+        """
+
+        boundary = {"analysis": [], "text": SENTENCE_BOUNDARY}
+        items = []
+        count = 0
+
+        for tokens in token_lists:
+            if count:
+                items.append(boundary)
+            items.extend({"analysis": [], "text": t} for t in tokens)
+            count += 1
+
+        if not count:
+            return []
+
+        result = [[]]
+
+        for d in self._analyze_impl(json.dumps(items).encode("utf-8")):
+            if d.get('text') == SENTENCE_BOUNDARY:
+                result.append([])
+            else:
+                result[-1].append(d)
+
+        if len(result) != count:
+            raise RuntimeError(f'Expected {count} sentences in Mystem output, got {len(result)}')
+
+        return result
+
+
+class CachedJsonStemmer(JsonStemmer):
+    """
+    Морфологический анализатор с кэшем результатов разбора токенов.
+
+    В `mystem` отправляются только токены, которых нет в кэше. Результат разбора токена кэшируется
+    по его исходному написанию, поэтому анализатор работает в контекстно-независимом режиме:
+    снятие омонимии (`disambiguation`) по-умолчанию отключено, и результат разбора токена
+    не зависит от соседних токенов и порядка запросов. При отключенном снятии омонимии `mystem`
+    выбирает первым наиболее частотный разбор, поэтому лемма отдельных слов может отличаться от
+    результата `JsonStemmer`.
+
+    Кэш можно разделять между несколькими стеммерами (например, в `MystemPool`)::
+
+        cache = AnalysisCache(10000)
+        pool = MystemPool(4, factory=partial(jstem_inst, CachedJsonStemmer, cache=cache))
+
+    """
+
+    def __init__(self, cache: AnalysisCache = None, **kwargs):
+        """
+        :param cache: кэш результатов анализа. Если не передан, создается новый кэш размера по-умолчанию
+        """
+        kwargs.setdefault('disambiguation', False)
+        super().__init__(**kwargs)
+        self.cache = AnalysisCache() if cache is None else cache
+
+    def analyze(self, tokens: Iterator[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов"""
+        return self.analyze_many([tokens])[0]
+
+    analyze_iter = iStemmer.analyze_iter
+
+    def analyze_many(self, token_lists: Iterable[Iterable[str]]) -> List[List[dict]]:
+        """
+        Получить результат морфологического разбора нескольких списков токенов.
+        Все отсутствующие в кэше токены отправляются в `mystem` одним запросом.
+        """
+        cache = self.cache
+        token_lists = [list(tokens) for tokens in token_lists]
+        found = {}
+        missed = []
+
+        for tokens in token_lists:
+            for t in tokens:
+                if t in found:
+                    continue
+
+                analysis = cache.get(t)
+
+                if analysis is None:
+                    missed.append(t)
+                    found[t] = None
+                else:
+                    found[t] = analysis
+
+        if missed:
+            result = super().analyze(missed)
+
+            if len(result) != len(missed) or any(d.get('text') != t for d, t in zip(result, missed)):
+                # mystem изменил разбиение на токены. Такой результат нельзя сопоставить
+                # с отдельными токенами, поэтому он не кэшируется
+                logger.warning('Mystem output does not match input tokens, cache bypassed')
+                return [super(CachedJsonStemmer, self).analyze(tokens) for tokens in token_lists]
+
+            found.update(zip(missed, result))
+            cache.update(zip(missed, result))
+
+        return [[found[t] for t in tokens] for tokens in token_lists]
+
+
+class PipelinedJsonStemmer(JsonStemmer):
+    """
+    Морфологический анализатор, передающий запросы в `mystem` не дожидаясь ответов на предыдущие.
+
+    Для каждого процесса `mystem` запускаются отдельные потоки записи и чтения. Метод `submit` ставит
+    запрос в очередь и сразу возвращает `Future` с результатом, поэтому пока `mystem` анализирует одно
+    предложение, вызывающий поток может токенизировать следующее и обрабатывать результат предыдущего.
+    Результаты приходят в порядке передачи запросов::
+
+        with jstem_ctx(PipelinedJsonStemmer) as stem:
+            futures = [stem.submit(tokens) for tokens in token_lists]
+            results = [f.result() for f in futures]
+
+    Сторожевой поток следит за сроком ответа на самый старый запрос и за состоянием процесса: если ответ
+    не получен за `timeout` секунд или процесс завершился, процесс перезапускается, а все переданные в него
+    запросы завершаются ошибкой (`MystemTimeoutError` - для запроса, не получившего ответ вовремя).
+    """
+
+    def __init__(self, max_in_flight: int = 16, **kwargs):
+        """
+        :param max_in_flight: максимальное количество запросов, ожидающих результата.
+                              `submit` блокируется, пока количество таких запросов не уменьшится
+        """
+        super().__init__(**kwargs)
+        self._slots = Semaphore(max_in_flight)
+        self._requests = Queue()
+        self._in_flight = deque()       # (срок ответа, Future)
+        self._io_lock = Lock()
+        self._result_lock = Lock()
+        self._stopped = Event()
+        self._writer = None
+        self._reader = None
+        self._watchdog = None
+
+    def start(self):
+        super().start()
+        self._stopped.clear()
+        self._start_reader()
+
+        self._writer = Thread(target=self._write, daemon=True, name='mystem-writer')
+        self._watchdog = Thread(target=self._watch, daemon=True, name='mystem-watchdog')
+        self._writer.start()
+        self._watchdog.start()
+
+    def stop(self):
+        if self._writer is not None:
+            self._requests.put(None)
+            self._writer.join()
+            self._stopped.set()
+            self._watchdog.join()
+            # закрытие stdin завершает mystem после обработки всех переданных запросов
+            self._procin.close()
+            self._reader.join()
+            self._writer = self._reader = self._watchdog = None
+
+        super().stop()
+
+    def restart(self):
+        """Принудительно завершить процесс `mystem` и запустить новый"""
+
+        if self._proc is not None:
+            # процесс завершается до захвата блокировки: поток записи может ожидать записи в зависший процесс
+            self._proc.kill()
+
+        with self._io_lock:
+            self._reader.join()
+            self._fail_in_flight(RuntimeError('Mystem process restarted'))
+            super().restart()
+            self._start_reader()
+
+    def submit(self, tokens: Iterator[str]) -> Future:
+        """Поставить список токенов в очередь на морфологический разбор"""
+
+        if self._writer is None:
+            raise RuntimeError('Mystem is not running')
+
         tokens_json = json.dumps([{"analysis": [], "text": t} for t in tokens]).encode("utf-8")
+        result = Future()
 
-        return self._analyze_impl(tokens_json)
+        self._slots.acquire()
+        result.add_done_callback(lambda _: self._slots.release())
+        self._requests.put((tokens_json, result))
 
+        return result
 
-def jstem_inst() -> JsonStemmer:
-    """Получить экземпляр json-стеммера"""
-    return JsonStemmer(
-        fixlist_file=os.path.join(DATA_PATH, _stem_conf['fixlist_file']),
-        weight=False
-    )
+    def analyze(self, tokens: Iterator[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов"""
+        return self.submit(tokens).result()
+
+    def warmup(self):
+        self.submit(WARMUP_TOKENS).result()
+
+    def analyze_many(self, token_lists: Iterable[Iterable[str]]) -> List[List[dict]]:
+        """Получить результат морфологического разбора нескольких списков токенов"""
+        return [f.result() for f in [self.submit(tokens) for tokens in token_lists]]
+
+    analyze_iter = iStemmer.analyze_iter
+
+    def _start_reader(self):
+        # поток чтения использует блокирующий буферизованный ввод вместо опроса неблокирующего канала
+        os.set_blocking(self._procout_no, True)
+        procout = io.open(self._procout_no, 'rb', closefd=False)
+
+        self._reader = Thread(target=self._read, args=(procout,), daemon=True, name='mystem-reader')
+        self._reader.start()
+
+    def _write(self):
+        in_flight = self._in_flight
+
+        while True:
+            request = self._requests.get()
+
+            if request is None:
+                break
+
+            tokens_json, result = request
+            timeout = self.timeout
+
+            with self._io_lock:
+                # запрос попадает в очередь ожидающих до записи, чтобы поток чтения
+                # получал запросы в том же порядке, в котором они переданы в mystem
+                in_flight.append((monotonic() + timeout if timeout else None, result))
+
+                try:
+                    self._procin.write(tokens_json + b'\n')
+                    self._procin.flush()
+                except OSError as e:
+                    # запрос завершится ошибкой при перезапуске процесса сторожевым потоком
+                    logger.error(f'Could not write to Mystem: {e}')
+
+        while not self._requests.empty():
+            request = self._requests.get_nowait()
+
+            if request:
+                self._resolve(request[1], error=RuntimeError('Mystem is stopped'))
+
+    def _read(self, procout):
+        in_flight = self._in_flight
+
+        for line in procout:
+            try:
+                _, result = in_flight.popleft()
+            except IndexError:
+                logger.error(f'Unexpected Mystem output: {line[:100]!r}')
+                continue
+
+            try:
+                self._resolve(result, json.loads(line))
+            except ValueError as e:
+                self._resolve(result, error=RuntimeError(f'Invalid Mystem output: {e}'))
+
+        self._fail_in_flight(RuntimeError('Mystem process exited'))
+
+    def _watch(self):
+        while not self._stopped.wait(min(self.timeout / 10, 1) if self.timeout else 1):
+            try:
+                deadline, result = self._in_flight[0]
+            except IndexError:
+                deadline = result = None
+
+            if deadline is not None and monotonic() > deadline and not result.done():
+                self.timeouts += 1
+                logger.error(f'Mystem did not respond in {self.timeout}s')
+                self._resolve(result, error=MystemTimeoutError(f'Mystem did not respond in {self.timeout}s'))
+                self.restart()
+            elif self._proc.poll() is not None:
+                logger.error(f'Mystem process exited with code {self._proc.returncode}')
+                self.restart()
+
+    def _fail_in_flight(self, error: Exception):
+        in_flight = self._in_flight
+
+        while in_flight:
+            self._resolve(in_flight.popleft()[1], error=error)
+
+    def _resolve(self, result: Future, value: Any = None, error: Exception = None):
+        # результат запроса может одновременно устанавливать поток чтения и сторожевой поток
+        with self._result_lock:
+            if result.done():
+                return
+
+            if error is None:
+                result.set_result(value)
+            else:
+                result.set_exception(error)
+
+
+def jstem_inst(cls=JsonStemmer, **kwargs) -> JsonStemmer:
+    """
+    Получить экземпляр json-стеммера
+
+    :param cls:     класс стеммера
+    :param kwargs:  дополнительные параметры стеммера
+    """
+    return cls(**{
+        'fixlist_file': os.path.join(DATA_PATH, _stem_conf['fixlist_file']),
+        'weight': False,
+        **kwargs
+    })
 
 
 @contextmanager
-def jstem_ctx() -> JsonStemmer:
+def jstem_ctx(cls=JsonStemmer, **kwargs) -> JsonStemmer:
     """
     Контекстный менеджер для работы с JsonStemmer.
 
@@ -229,8 +890,14 @@ def jstem_ctx() -> JsonStemmer:
             result = stem.analize(tokens)
             # do smth with result
 
+        # стеммер с кэшем результатов анализа
+        with jstem_ctx(CachedJsonStemmer, cache=AnalysisCache(10000)) as stem:
+            ...
+
+    :param cls:     класс стеммера
+    :param kwargs:  дополнительные параметры стеммера
     """
-    stem = jstem_inst()
+    stem = jstem_inst(cls, **kwargs)
     logger.debug('Starting Mystem...')
     stem.start()
     logger.debug('MyStem Ready')
@@ -240,7 +907,217 @@ def jstem_ctx() -> JsonStemmer:
         stem.stop()
 
 
-def stems_gen(analysis_result: Iterator[dict]) -> Iterator[iStemTuple]:
+@contextmanager
+def jstem_shared_ctx(path: str = MYSTEM_CACHE_PATH, readonly: bool = MYSTEM_CACHE_READONLY) -> JsonStemmer:
+    """
+    Контекстный менеджер для работы со стеммером, использующим общий файловый кэш результатов анализа.
+
+    Файл кэша могут одновременно открыть все воркеры RTN и вызовы CLI: результаты, полученные
+    одним процессом, сразу доступны остальным и сохраняются между перезапусками.
+    Стеммер с кэшем работает в контекстно-независимом режиме (см. `CachedJsonStemmer`).
+    Если путь к файлу кэша не задан (переменная окружения `MYSTEM_CACHE_PATH`),
+    используется `JsonStemmer` без кэша::
+
+        with jstem_shared_ctx('/var/cache/tn/analysis.cache') as stem:
+            result = stem.analyze(tokens)
+
+    :param path:     путь к файлу кэша
+    :param readonly: открыть кэш только для чтения
+    """
+    if not path:
+        with jstem_ctx() as stem:
+            yield stem
+        return
+
+    cache = PersistentAnalysisCache(path, readonly=readonly)
+    logger.debug(f'Analysis cache {path} opened with {len(cache)} tokens')
+
+    try:
+        with jstem_ctx(CachedJsonStemmer, cache=cache) as stem:
+            yield stem
+    finally:
+        cache.close()
+
+
+def jstem_shared_factory(
+        path: str = MYSTEM_CACHE_PATH, readonly: bool = MYSTEM_CACHE_READONLY) -> Callable[[], JsonStemmer]:
+    """
+    Получить функцию для создания стеммеров, использующих общий файловый кэш результатов анализа
+    (см. `jstem_shared_ctx`). Файл кэша открывается один раз и используется всеми созданными стеммерами.
+
+    :param path:     путь к файлу кэша. Если не задан, создаются стеммеры без кэша
+    :param readonly: открыть кэш только для чтения
+    """
+    if not path:
+        return jstem_inst
+
+    return partial(jstem_inst, CachedJsonStemmer, cache=PersistentAnalysisCache(path, readonly=readonly))
+
+
+class MystemPool(iStemmer):
+    """
+    Пул постоянно запущенных процессов `mystem` для совместного использования несколькими потоками.
+
+    Каждый вызов `analyze` передается наименее загруженному стеммеру пула. Один стеммер в каждый момент
+    времени обрабатывает только один запрос, поэтому потоки, получившие разные стеммеры, работают параллельно.
+    Завершившийся, сломанный или не ответивший вовремя (см. `JsonStemmer`) процесс `mystem`
+    перезапускается автоматически::
+
+        with mystem_pool_ctx(4) as pool:
+            with ThreadPoolExecutor() as executor:
+                results = executor.map(pool.analyze, token_lists)
+
+    Пул поддерживает интерфейс `JsonStemmer.analyze` и может быть передан везде, где ожидается стеммер.
+    """
+
+    def __init__(self, size: int = MYSTEM_POOL_SIZE, factory: Callable[[], JsonStemmer] = jstem_inst):
+        """
+        :param size:    количество процессов `mystem` в пуле
+        :param factory: функция для создания нового стеммера
+        """
+        if size < 1:
+            raise ValueError(f'Invalid pool size {size}')
+
+        self._size = size
+        self._factory = factory
+        self._stemmers = []             # type: List[JsonStemmer]
+        self._locks = []                # type: List[Lock]
+        self._load = []                 # количество запросов, ожидающих или обрабатываемых каждым стеммером
+        self._lock = Lock()
+        self._restarts = 0              # перезапуски пула и замененных пулом стеммеров
+        self.timeouts = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def restarts(self) -> int:
+        """Количество перезапусков процессов `mystem`, в том числе выполненных самими стеммерами пула"""
+        return self._restarts + sum(getattr(stem, 'restarts', 0) for stem in self._stemmers)
+
+    def start(self):
+        with self._lock:
+            if self._stemmers:
+                return
+
+            logger.debug(f'Starting Mystem pool of {self._size}...')
+
+            for _ in range(self._size):
+                stem = self._factory()
+                stem.start()
+                self._stemmers.append(stem)
+                self._locks.append(Lock())
+                self._load.append(0)
+
+            logger.debug('Mystem pool ready')
+
+    def stop(self):
+        with self._lock:
+            stemmers, locks = self._stemmers, self._locks
+            self._restarts += sum(getattr(stem, 'restarts', 0) for stem in stemmers)
+            # запросы, начатые до остановки, завершаются на списках остановленного пула (см. `_acquire`)
+            self._stemmers, self._locks, self._load = [], [], []
+
+        for stem, lock in zip(stemmers, locks):
+            with lock:
+                stem.stop()
+
+        logger.debug('Mystem pool stopped')
+
+    def analyze(self, tokens: Iterator[str]) -> List[dict]:
+        """Получить результат морфологического разбора списка токенов на свободном стеммере пула"""
+        return self._run('analyze', tokens)
+
+    def analyze_many(self, token_lists: Iterable[Iterable[str]]) -> List[List[dict]]:
+        """Получить результат морфологического разбора нескольких списков токенов на свободном стеммере пула"""
+        return self._run('analyze_many', token_lists)
+
+    def _run(self, method: str, *args):
+        if not self._stemmers:
+            self.start()
+
+        idx, stemmers, locks, load = self._acquire()
+
+        try:
+            with locks[idx]:
+                stem = stemmers[idx]
+
+                if stemmers is not self._stemmers:
+                    raise RuntimeError('Mystem pool stopped')
+
+                if not _is_alive(stem):
+                    stem = self._restart(idx, stemmers)
+
+                try:
+                    return getattr(stem, method)(*args)
+                except MystemTimeoutError:
+                    # стеммер уже перезапустил зависший процесс
+                    self.timeouts += 1
+                    raise
+                except Exception:
+                    # стеммер сам перезапускает процесс, с которым потерял связь, а непрочитанный остаток ответа
+                    # отбрасывается следующим запросом. Пул заменяет только завершившийся процесс
+                    if stemmers is self._stemmers and not _is_alive(stem):
+                        self._restart(idx, stemmers)
+
+                    raise
+        finally:
+            self._release(idx, load)
+
+    def _acquire(self) -> Tuple[int, List[JsonStemmer], List[Lock], List[int]]:
+        with self._lock:
+            load = self._load
+
+            if not load:
+                raise RuntimeError('Mystem pool stopped')
+
+            idx = min(range(len(load)), key=load.__getitem__)
+            load[idx] += 1
+
+            return idx, self._stemmers, self._locks, load
+
+    def _release(self, idx: int, load: List[int]):
+        # после остановки пула счетчики запросов заменены, а счетчик остановленного пула больше не используется
+        with self._lock:
+            load[idx] -= 1
+
+    def _restart(self, idx: int, stemmers: List[JsonStemmer]) -> JsonStemmer:
+        logger.warning(f'Restarting Mystem #{idx} of the pool')
+        old = stemmers[idx]
+        old.close()
+
+        stem = self._factory()
+        stem.start()
+        stemmers[idx] = stem
+        self._restarts += getattr(old, 'restarts', 0) + 1
+
+        return stem
+
+
+@contextmanager
+def mystem_pool_ctx(size: int = MYSTEM_POOL_SIZE) -> MystemPool:
+    """
+    Контекстный менеджер для работы с пулом стеммеров::
+
+        with mystem_pool_ctx(4) as pool:
+            result = pool.analyze(tokens)
+
+    :param size: количество процессов `mystem` в пуле
+    """
+    pool = MystemPool(size)
+    pool.start()
+    try:
+        yield pool
+    finally:
+        pool.stop()
+
+
+def _is_alive(stem: JsonStemmer) -> bool:
+    return stem._proc is not None and stem._proc.poll() is None
+
+
+def stems_gen(analysis_result: Iterator[dict], lazy: bool = False) -> Iterator[iStemTuple]:
     """
     Преобразует результ морфологического разбора MyStem в итератор картежей.
 
@@ -248,7 +1125,12 @@ def stems_gen(analysis_result: Iterator[dict]) -> Iterator[iStemTuple]:
     вроде списков или словарей. Рекомендуется использовать картежи при построении
     пайплайна обработки результатов анализа и конвертировать в другие структуры данных как можно позднее.
 
+    Словари граммем общие для всех токенов с одинаковой строкой граммем mystem и не могут быть изменены
+    (см. `FrozenGrammem`). В режиме `lazy` строки граммем разбираются только при обращении к данным
+    словаря граммем (см. `LazyGrammem`).
+
     :param analysis_result: результ морфологического разбора MyStem
+    :param lazy:            откладывать разбор граммем до первого обращения
 
     """
 
@@ -257,24 +1139,53 @@ def stems_gen(analysis_result: Iterator[dict]) -> Iterator[iStemTuple]:
             analysis, text = d['analysis'], d['text']
 
             if not analysis:
-                # Анализ не будет проведен если семантика токена неопределена
-                t = (text, token_type(text))
+                # Анализ не будет проведен если семантика токена неопределена.
+                # Тип токена, не передававшегося в mystem, определен заранее (см. `normalization.analyze`)
+                t = (text, d['type'] if 'type' in d else token_type(text))
 
                 yield t, '', None, True
             else:
                 t = (text, TokenType.TXT)
                 lemma = analysis[0]['lex']
-                grammem = dict(_parse_mystem_grammem(analysis[0]['gr']))
+                gr = analysis[0]['gr']
+
+                if lazy:
+                    grammem = LazyGrammem(gr, lemma in _cardinals)
+                else:
+                    grammem = _grammem(gr)
 
-                # уточнение части речи для некоторых числительных (e.g. единица, сотня, тысяча)
-                if grammem[POS] != POS.NUM and lemma in _numerics:
-                    grammem[POS] = POS.NUM
+                    # уточнение части речи для некоторых числительных (e.g. единица, сотня, тысяча)
+                    if grammem[POS] != POS.NUM and lemma in _cardinals:
+                        grammem = _numeral_grammem(gr)
 
                 qual = False if 'qual' in analysis[0] else True
 
                 yield t, lemma, grammem, qual
 
 
+# Поля результата нормализации (см. `to_dict`, `to_tuple`, `stem_converter`)
+STEM_FIELDS = ('token', 'lemma', 'grammem', 'qual')
+
+# ключ граммемы в результате нормализации -> категория граммем
+_grammem_keys_types = (
+    ('pos', POS),
+    ('gender', Gender),
+    ('animacy', Animacy),
+    ('case', Case),
+    ('number', Number),
+    ('verb_tence', VerbTence),
+    ('verb_mood', VerbMood),
+    ('verb_person', VerbPerson),
+    ('verb_aspect', VerbAspect),
+    ('verb_voice', VerbVoice),
+    ('verb_transit', VerbTransit),
+    ('comp_degree', CompDegree),
+    ('adj_form', AdjForm),
+    ('other_grammem', OtherGrammem),
+    ('ambiguous', Ambiguous)
+)
+
+
 def to_dict(stem_tuple: iStemTuple) -> Dict[str, Any]:
     """
     Конвертирует картеж с данными морф.анализа в словарь.
@@ -284,30 +1195,10 @@ def to_dict(stem_tuple: iStemTuple) -> Dict[str, Any]:
     можно значительно быстрее создавать и получать доступ к ее данным.
 
     """
-    grammem_data = stem_tuple[2] or {}
-    grammem_keys_types = (
-        ('pos', POS),
-        ('gender', Gender),
-        ('animacy', Animacy),
-        ('case', Case),
-        ('number', Number),
-        ('verb_tence', VerbTence),
-        ('verb_mood', VerbMood),
-        ('verb_person', VerbPerson),
-        ('verb_aspect', VerbAspect),
-        ('verb_voice', VerbVoice),
-        ('verb_transit', VerbTransit),
-        ('comp_degree', CompDegree),
-        ('adj_form', AdjForm),
-        ('other_grammem', OtherGrammem),
-        ('ambiguous', Ambiguous)
-    )
-
     return {
         'token': f'{stem_tuple[0][0]}',
         'lemma': f'{stem_tuple[1]}',
-        'grammem': {k: getattr(grammem_data[v], 'value', grammem_data[v])
-                    for k, v in grammem_keys_types if v in grammem_data},
+        'grammem': _grammem_dict(stem_tuple),
         'qual': stem_tuple[3]
     }
 
@@ -319,39 +1210,275 @@ def to_tuple(stem_tuple: iStemTuple) -> tuple:
     можно значительно быстрее создавать и получать доступ к ее данным.
 
     """
-    grammem_data = stem_tuple[2] or {}
-    grammem_keys_types = (
-        ('pos', POS),
-        ('gender', Gender),
-        ('animacy', Animacy),
-        ('case', Case),
-        ('number', Number),
-        ('verb_tence', VerbTence),
-        ('verb_mood', VerbMood),
-        ('verb_person', VerbPerson),
-        ('verb_aspect', VerbAspect),
-        ('verb_voice', VerbVoice),
-        ('verb_transit', VerbTransit),
-        ('comp_degree', CompDegree),
-        ('adj_form', AdjForm),
-        ('other_grammem', OtherGrammem),
-        ('ambiguous', Ambiguous)
-    )
-
     return (
         f'{stem_tuple[0][0]}',
         f'{stem_tuple[1]}',
-        tuple((k, getattr(grammem_data[v], 'value', grammem_data[v]))
-              for k, v in grammem_keys_types if v in grammem_data),
+        _grammem_tuple(stem_tuple),
         stem_tuple[3]
     )
 
 
+def stem_converter(fmt: str = 'tuple', fields: Sequence[str] = STEM_FIELDS) -> Callable[[iStemTuple], Any]:
+    """
+    Получить функцию конвертации картежа с данными морф.анализа, которая оставляет в результате
+    только поля `fields` в переданном порядке::
+
+        converter = stem_converter('dict', ('token', 'lemma'))
+        converter(stem) # {'token': 'раму', 'lemma': 'рама'}
+
+    Граммемы токена конвертируются, только если поле 'grammem' входит в `fields`, поэтому вместе с
+    отложенным разбором граммем (см. `stems_gen`) проекция без граммем не требует их разбора.
+
+    :param fmt:    формат результата: 'tuple' (см. `to_tuple`) или 'dict' (см. `to_dict`)
+    :param fields: поля результата из `STEM_FIELDS`
+    """
+    fields = tuple(fields)
+    unknown = set(fields).difference(STEM_FIELDS)
+
+    if unknown:
+        raise ValueError(f'Unknown stem fields {sorted(unknown)}')
+
+    if fmt not in ('tuple', 'dict'):
+        raise ValueError(f'Unknown stem format {fmt}')
+
+    if fields == STEM_FIELDS:
+        return to_tuple if fmt == 'tuple' else to_dict
+
+    getters = {
+        'token': lambda s: f'{s[0][0]}',
+        'lemma': lambda s: f'{s[1]}',
+        'grammem': _grammem_tuple if fmt == 'tuple' else _grammem_dict,
+        'qual': lambda s: s[3],
+    }
+
+    if fmt == 'dict':
+        items = tuple((f, getters[f]) for f in fields)
+        return lambda s: {f: get(s) for f, get in items}
+
+    if len(fields) == 1:
+        get = getters[fields[0]]
+        return lambda s: (get(s),)
+
+    field_getters = tuple(getters[f] for f in fields)
+
+    return lambda s: tuple([get(s) for get in field_getters])
+
+
+def _grammem_dict(stem_tuple: iStemTuple) -> Dict[str, Any]:
+    grammem_data = stem_tuple[2] or {}
+
+    return {k: getattr(grammem_data[v], 'value', grammem_data[v])
+            for k, v in _grammem_keys_types if v in grammem_data}
+
+
+def _grammem_tuple(stem_tuple: iStemTuple) -> tuple:
+    grammem_data = stem_tuple[2] or {}
+
+    return tuple((k, getattr(grammem_data[v], 'value', grammem_data[v]))
+                 for k, v in _grammem_keys_types if v in grammem_data)
+
+
 _grammems = (
     Case, POS, VerbTence, Gender, Animacy, Number, VerbMood, VerbPerson, VerbAspect, VerbVoice, VerbTransit, AdjForm,
     CompDegree, OtherGrammem)
 gramm_rev_dict = dict(chain(*map(lambda e: ((attr.value, attr) for attr in e), _grammems)))
 
+"""
+Битовая маска граммем
+
+Каждой категории граммем отводится поле из нескольких бит, в котором хранится порядковый номер значения
+в перечислении, начиная с 1 (0 - значение категории не задано). За полями категорий следует признак
+неоднозначного разбора, а в старших битах хранится номер исходной строки граммем mystem в таблице строк процесса.
+Маска умещается в 63 бита, поэтому маски можно хранить в массивах int64, а предикаты (`is_num`, `has_grammem`)
+применять к таким массивам поэлементно.
+"""
+
+# Порядок полей категорий граммем в маске, начиная с младших бит
+_mask_categories = (
+    POS, Gender, Animacy, Case, Number, VerbTence, VerbMood, VerbPerson, VerbAspect, VerbVoice, VerbTransit,
+    CompDegree, AdjForm, OtherGrammem)
+
+
+def _mask_layout() -> Tuple[Dict[type, Tuple[int, int]], int]:
+    fields, shift = {}, 0
+
+    for category in _mask_categories:
+        width = len(category).bit_length()
+        fields[category] = (shift, ((1 << width) - 1) << shift)
+        shift += width
+
+    return fields, shift
+
+
+# категория граммем -> (сдвиг поля, маска поля)
+_mask_fields, _AMBIGUOUS_SHIFT = _mask_layout()
+_AMBIGUOUS_BIT = 1 << _AMBIGUOUS_SHIFT
+_GRAMMEM_ID_SHIFT = _AMBIGUOUS_SHIFT + 1
+# граммема -> значение поля категории в маске
+_grammem_bits = {
+    attr: (idx << _mask_fields[category][0])
+    for category in _mask_categories for idx, attr in enumerate(category, 1)
+}
+# категория граммем -> значения категории в порядке номеров в маске
+_mask_members = {category: tuple(category) for category in _mask_categories}
+_POS_FIELD = _mask_fields[POS][1]
+_NUM_BITS, _ANUM_BITS = _grammem_bits[POS.NUM], _grammem_bits[POS.ANUM]
+
+# Максимальный номер строки граммем, при котором маска помещается в int64 (e.g. `StemBatch.masks`)
+_GRAMMEM_ID_MAX = (1 << (63 - _GRAMMEM_ID_SHIFT)) - 1
+# Максимальное количество строк граммем в таблице строк граммем (см. `MYSTEM_GRAMMEM_CACHE_SIZE`)
+_GRAMMEM_STRINGS_SIZE = min(MYSTEM_GRAMMEM_CACHE_SIZE, _GRAMMEM_ID_MAX)
+
+if MYSTEM_GRAMMEM_CACHE_SIZE > _GRAMMEM_ID_MAX:
+    logger.warning(f'MYSTEM_GRAMMEM_CACHE_SIZE exceeds grammem mask capacity, grammem string table limited '
+                   f'to {_GRAMMEM_ID_MAX} strings')
+
+# таблица строк граммем mystem, номера которых хранятся в масках (0 - строка не задана).
+# Размер таблицы ограничен `_GRAMMEM_STRINGS_SIZE`. Строки из таблицы не удаляются, так как их номера
+# могут храниться в ранее полученных масках: после заполнения таблицы новые строки не получают номеров.
+# Номера строк действительны только в процессе, где они получены
+_grammem_strings = ['']
+_grammem_string_ids = {'': 0}
+_grammem_strings_lock = Lock()
+
+
+def _grammem_string_id(mystem_grammem_str: str) -> int:
+    gr_id = _grammem_string_ids.get(mystem_grammem_str)
+
+    if gr_id is None:
+        with _grammem_strings_lock:
+            gr_id = _grammem_string_ids.get(mystem_grammem_str)
+
+            if gr_id is None:
+                if len(_grammem_strings) > _GRAMMEM_STRINGS_SIZE:
+                    return 0
+
+                gr_id = _grammem_string_ids[mystem_grammem_str] = len(_grammem_strings)
+                _grammem_strings.append(mystem_grammem_str)
+
+                if len(_grammem_strings) > _GRAMMEM_STRINGS_SIZE:
+                    logger.warning('Grammem string table is full, new masks keep grammem categories only')
+
+    return gr_id
+
+
+def _encode_grammem(grammem: Mapping) -> int:
+    mask = 0
+
+    for value in grammem.values():
+        mask |= _grammem_bits.get(value, 0)
+
+    if Ambiguous in grammem:
+        mask |= _AMBIGUOUS_BIT
+
+    raw = grammem.get('raw')
+
+    if raw:
+        mask |= _grammem_string_id(raw) << _GRAMMEM_ID_SHIFT
+
+    return mask
+
+
+def grammem_mask(grammem: Optional[Mapping]) -> int:
+    """
+    Получить битовую маску словаря граммем.
+
+    Маска словарей, которые возвращает `stems_gen`, вычисляется один раз и хранится в атрибуте `mask`
+    (см. `FrozenGrammem`). Отсутствию граммем (`None`) соответствует маска 0.
+
+    NB! Маска содержит номер строки граммем в таблице процесса, поэтому маски нельзя сохранять
+    или передавать в другие процессы: там тот же номер соответствует другой строке граммем.
+
+    :param grammem: словарь граммем
+    """
+    if not grammem:
+        return 0
+
+    if type(grammem) is FrozenGrammem or type(grammem) is LazyGrammem:
+        return grammem.mask
+
+    return _encode_grammem(grammem)
+
+
+def mask_grammem(mask: int) -> Optional[FrozenGrammem]:
+    """
+    Восстановить словарь граммем по битовой маске (см. `grammem_mask`)::
+
+        mask_grammem(grammem_mask(grammem)) == grammem
+
+    Номер строки граммем в маске действителен только в том процессе, где маска была получена.
+    После заполнения таблицы строк граммем (`MYSTEM_GRAMMEM_CACHE_SIZE` строк, не более 2^27 - 1) маски новых строк
+    граммем не содержат номера строки, и по ним восстанавливаются только категории граммем, хранящиеся в маске.
+    Строка неоднозначного разбора восстанавливается только из маски словаря, содержащего строку граммем 'raw'.
+
+    :param mask: битовая маска граммем
+    """
+    if not mask:
+        return None
+
+    gr_id = mask >> _GRAMMEM_ID_SHIFT
+
+    if not gr_id:
+        grammem = dict(_decode_mask(mask))
+
+        if mask & _AMBIGUOUS_BIT:
+            grammem[Ambiguous] = ''
+
+        return FrozenGrammem(grammem)
+
+    if gr_id >= len(_grammem_strings):
+        raise ValueError(f'Unknown grammem string id {gr_id} in mask {mask}')
+
+    mystem_grammem_str = _grammem_strings[gr_id]
+
+    for grammem in (_grammem(mystem_grammem_str), _numeral_grammem(mystem_grammem_str)):
+        if grammem.mask == mask:
+            return grammem
+
+    # значения категорий изменены после разбора строки граммем (см. `FrozenGrammem.replace`)
+    grammem = {k: v for k, v in _grammem(mystem_grammem_str).items() if k not in _mask_fields}
+    grammem.update(_decode_mask(mask))
+
+    return FrozenGrammem(grammem)
+
+
+def _decode_mask(mask: int) -> Iterator[Tuple[type, Enum]]:
+    for category, (shift, field) in _mask_fields.items():
+        idx = (mask & field) >> shift
+
+        if idx:
+            yield category, _mask_members[category][idx - 1]
+
+
+def mask_value(mask: int, category: type) -> Optional[Enum]:
+    """
+    Получить значение категории граммем из битовой маски (e.g. `mask_value(mask, Case) -> Case.NOM`)
+
+    :param mask:     битовая маска граммем
+    :param category: категория граммем (перечисление)
+    """
+    shift, field = _mask_fields[category]
+    idx = (mask & field) >> shift
+
+    return _mask_members[category][idx - 1] if idx else None
+
+
+def has_grammem(mask: int, grammem: Enum) -> bool:
+    """Содержит ли маска значение граммемы (e.g. `has_grammem(mask, Case.NOM)`)"""
+    return (mask & _mask_fields[type(grammem)][1]) == _grammem_bits[grammem]
+
+
+def is_num(mask: int) -> bool:
+    """Является ли часть речи маски числительным (`POS.NUM`)"""
+    return (mask & _POS_FIELD) == _NUM_BITS
+
+
+def is_numeral(mask: int) -> bool:
+    """Является ли часть речи маски числительным или порядковым числительным (`POS.NUM`, `POS.ANUM`)"""
+    pos = mask & _POS_FIELD
+
+    return (pos == _NUM_BITS) | (pos == _ANUM_BITS)
+
 
 def init_cache():
     list(map(_decode_grammem_part, gramm_rev_dict))
@@ -360,6 +1487,8 @@ def init_cache():
 
 def cache_clear():
     _decode_grammem_part.cache_clear()
+    _grammem.cache_clear()
+    _numeral_grammem.cache_clear()
     logger.debug('Cache cleared')
 
 
@@ -383,6 +1512,18 @@ def _parse_mystem_grammem(mystem_grammem_str: str) -> Iterator[tuple]:
     yield 'raw', mystem_grammem_str
 
 
+@lru_cache(maxsize=MYSTEM_GRAMMEM_CACHE_SIZE)
+def _grammem(mystem_grammem_str: str) -> FrozenGrammem:
+    """Разобранная строка граммем mystem. Результат общий для всех токенов с такой строкой граммем"""
+    return FrozenGrammem(_parse_mystem_grammem(mystem_grammem_str))
+
+
+@lru_cache(maxsize=MYSTEM_GRAMMEM_CACHE_SIZE)
+def _numeral_grammem(mystem_grammem_str: str) -> FrozenGrammem:
+    """Разобранная строка граммем mystem с частью речи `POS.NUM`"""
+    return _grammem(mystem_grammem_str).replace(POS, POS.NUM)
+
+
 @lru_cache(maxsize=len(gramm_rev_dict))
 def _decode_grammem_part(grammem_part: str):
     grammem = gramm_rev_dict.get(grammem_part, None)
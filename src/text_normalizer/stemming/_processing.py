@@ -2,16 +2,15 @@
 Модуль для обработки результатов лемматизации и морфологического анализа
 
 ## ВАЖНО!
-При добавлении новых функций пайплайна в модуль важно придерживать следующего паттерна именования функций:
-    PIPE_PREFIX[имя_функции]
+Новые функции пайплайна необходимо зарегистрировать в реестре этапов (см. `register_stage`).
+Функции пайплайна модуля именуются по шаблону PIPE_PREFIX[имя_функции]
 """
 from enum import Enum
 from functools import reduce
 from typing import Iterator, Callable, Sequence
 
-from ._mystem import iStemTuple, stems_gen, POS
-from ..config import PipelineConfigType, load_conf
-from ..convert import text2int, MONTHS_SET, month2num, is_ordfold, ord_unfold, DIGITS
+from ._mystem import iStemTuple, stems_gen, POS, grammem_mask, is_numeral
+from ..convert import text2int, MONTHS_SET, month2num, is_ordfold, ord_unfold, NUMERALS, NumeralAutomaton
 from ..tokenization import TokenType, russian_stopwords, KILO_POSTFIX
 
 __all__ = [
@@ -28,10 +27,7 @@ __all__ = [
 
 PIPE_PREFIX = 'pipe_'
 
-# функция возвращает изменяемый объект, который могут использовать другие части приложения
-# поэтому используется копия объекта, а не ссылка
-_numerics = load_conf(PipelineConfigType.NUMERICS).copy()
-_numerics.update(load_conf(PipelineConfigType.ORDINALS))
+_stopwords = frozenset(russian_stopwords)
 
 
 class Pipeline(Enum):
@@ -39,11 +35,8 @@ class Pipeline(Enum):
     Перечень наименований функций пайплайна обработки результатов морфологического анализа.
     Объект используется для динамического построения пайплайнов на основе функций данного модуля.
 
-    NB! При добавлени новой функции-пайплайна в модуль необходимо также добавить ее наименование в этот объект
-    иначе она не будет учавствовать в процедурах построения пайплайна.
-
-    Значение атрибутов должно соответствовать части имени фунции после 'pipe_'::
-        'pipe_word2num' -> 'word2num'
+    Значение атрибута - наименование этапа в реестре этапов пайплайна (см. `register_stage`).
+    Этапы, зарегистрированные другими пакетами, указываются наименованием без добавления в этот объект.
 
     """
     WORD2NUM = 'word2num'
@@ -56,7 +49,8 @@ class Pipeline(Enum):
 
 def pipeline(
         analysis_result: Iterator[dict],
-        pipe: Sequence[Callable[[Iterator[iStemTuple]], Iterator[iStemTuple]]] = ()
+        pipe: Sequence[Callable[[Iterator[iStemTuple]], Iterator[iStemTuple]]] = (),
+        lazy: bool = False
 ) -> Iterator[iStemTuple]:
     """
     Создание пайплайна для обработки результатов морфологического анализа Mystem.
@@ -82,8 +76,9 @@ def pipeline(
 
     :param analysis_result: результ морфологического разбора MyStem
     :param pipe: список callable-объектов с указанным интерфейсом
+    :param lazy: откладывать разбор граммем до первого обращения (см. `stems_gen`)
     """
-    yield from _pipeline(stems_gen(analysis_result), *pipe)
+    yield from _pipeline(stems_gen(analysis_result, lazy), *pipe)
 
 
 def pipe_word2num(
@@ -98,62 +93,31 @@ def pipe_word2num(
     :param convert: функция для конверации строки в число
     """
 
-    num_pos = {POS.NUM, POS.ANUM}  # numerical part of speech
-    # данные числа находятся на одном уровне с цифрами и требуют исключительного определения
-    ambigous_level_nums = {11, 12, 13, 14, 15, 16, 17, 18, 19}
-    last_level = 1
-    _num_buffer = []
-    append = _num_buffer.append  # небольшая оптимизация, для ускорения вызова метода в цикле
-
-    def num_buffer():
-        _num = convert(*(_s[1] for _s in _num_buffer))
-        yield (f'{_num}', TokenType.NUM), _num, grammem, qual
+    # числа собираются автоматом по таблице числительных (см. `NumeralAutomaton`)
+    automaton = NumeralAutomaton(None if convert is text2int else convert)
+    feed, flush, numeral_of = automaton.feed, automaton.flush, NUMERALS.get
+    num_token_type = TokenType.NUM
 
     for s in stems:
         token, lemma, grammem, qual = s
-        pos = grammem[POS] if grammem else None  # part of speech
-
-        if pos in num_pos and lemma in _numerics:
-            num_value, current_level, is_mult = _numerics[lemma]
-
-            if _num_buffer:
-
-                if token[0] in DIGITS:
-                    yield from num_buffer()
-                    _num_buffer.clear()
-
-                elif lemma in DIGITS:
-                    # Если лемма - это цифра
-                    # нужно выдать строку - последовательность лемм
-                    # длиной равную последнему добавленному в буфер числу
-                    last_added = _num_buffer.pop()
+        numeral = numeral_of(lemma)
 
-                    if _num_buffer:
-                        yield from num_buffer()
-                        _num_buffer.clear()
+        # числительное (POS.NUM, POS.ANUM) определяется по маске граммем без поиска в словаре
+        if numeral is not None and grammem and is_numeral(grammem_mask(grammem)):
+            for num in feed(token[0], lemma, numeral):
+                yield (f'{num}', num_token_type), num, grammem, qual
 
-                    length = convert(last_added[1])
-                    num = f'{convert(s[1])}' * length  # "3" * 3 -> "333"
-
-                    yield (num, TokenType.NUM), num, grammem, qual
-                    continue
+            continue
 
-                elif (current_level >= last_level
-                      or (last_level == 2 and num_value in ambigous_level_nums)) and not is_mult:
-                    yield from num_buffer()
-                    _num_buffer.clear()
+        if automaton.count:
+            for num in flush():
+                yield (f'{num}', num_token_type), num, grammem, qual
 
-            append(s)
-            last_level = current_level
-            continue
-        else:
-            if _num_buffer:
-                yield from num_buffer()
-                _num_buffer.clear()
         yield s
 
-    if _num_buffer:
-        yield from num_buffer()
+    # граммемы и признак словарного слова последнего числа берутся из последнего токена
+    for num in flush():
+        yield (f'{num}', num_token_type), num, grammem, qual
 
 
 def pipe_makedate(stems: Iterator[iStemTuple]) -> Iterator[iStemTuple]:
@@ -243,7 +207,7 @@ def pipe_kilo_postfix(stems: Iterator[iStemTuple]) -> Iterator[iStemTuple]:
 
 def pipe_stopwords(stems: Iterator[iStemTuple]) -> Iterator[iStemTuple]:
     """Фильтрация токенов со стоп-словами"""
-    yield from filter(lambda stem: stem[1] not in russian_stopwords, stems)
+    yield from filter(lambda stem: stem[1] not in _stopwords, stems)
 
 
 def pipe_merge_ccn(stems: Iterator[iStemTuple]) -> Iterator[iStemTuple]:
@@ -0,0 +1,404 @@
+"""Модуль реестра этапов пайплайна обработки результатов морфологического анализа"""
+
+import logging
+import os
+from functools import lru_cache
+from threading import Lock
+from typing import (
+    AbstractSet, Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple, Union)
+
+from ._mystem import iStemTuple, stems_gen
+from ._processing import (
+    Pipeline, pipe_word2num, pipe_ord_unfold, pipe_makedate, pipe_kilo_postfix, pipe_merge_ccn, pipe_stopwords)
+from ._fused import CompiledPipeline, compile_pipeline
+from ._batch import (
+    StemBatch, batch_word2num, batch_ord_unfold, batch_makedate, batch_kilo_postfix, batch_merge_ccn, batch_stopwords)
+from ..tokenization import TokenType
+
+__all__ = ['Stage', 'PipelinePlan', 'PipelineVariants', 'register_stage', 'unregister_stage', 'get_stage',
+           'pipeline_plan', 'pipeline_variants', 'plan_cache_clear', 'MYSTEM_PLAN_CACHE_SIZE']
+
+logger = logging.getLogger('rtn')
+
+# Максимальное количество планов выполнения пайплайна в кэше (см. `pipeline_plan`)
+MYSTEM_PLAN_CACHE_SIZE = int(os.environ.get('MYSTEM_PLAN_CACHE_SIZE', 256))
+
+StageFunc = Callable[[Iterator[iStemTuple]], Iterator[iStemTuple]]
+BatchStageFunc = Callable[[StemBatch], StemBatch]
+StageName = Union[str, Pipeline]
+
+
+class Stage(NamedTuple):
+    """Описание этапа пайплайна"""
+    name: str                           # наименование этапа
+    func: StageFunc                     # функция этапа (см. `pipeline`)
+    after: FrozenSet[str]               # этапы, которые выполняются раньше этого этапа, если входят в пайплайн
+    before: FrozenSet[str]              # этапы, которые выполняются позже этого этапа, если входят в пайплайн
+    token_types: FrozenSet[TokenType]   # типы токенов, которые этап изменяет, объединяет или удаляет
+    output_types: FrozenSet[TokenType]  # типы токенов, которые этап может создать из токенов других типов
+    batch: Optional[BatchStageFunc]     # функция этапа для пачки предложений (см. `StemBatch`)
+
+
+class PipelinePlan(NamedTuple):
+    """
+    План выполнения пайплайна: этапы в порядке выполнения и собранный в один проход пайплайн.
+
+    Вызов плана выполняет пайплайн (см. `CompiledPipeline`). Этапы, которые не обрабатывают токены ни одного
+    из типов токенов предложения (с учетом типов, созданных предыдущими этапами), пропускаются (см. `active`)
+    """
+    stages: Tuple[Stage, ...]
+    compiled: CompiledPipeline
+    # пайплайны без пропускаемых этапов {типы токенов предложения: пайплайн}
+    by_types: Dict[FrozenSet[TokenType], CompiledPipeline]
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """Наименования этапов в порядке выполнения"""
+        return tuple(s.name for s in self.stages)
+
+    @property
+    def pipe(self) -> Tuple[StageFunc, ...]:
+        """Функции этапов в порядке выполнения (см. `pipeline`)"""
+        return tuple(s.func for s in self.stages)
+
+    @property
+    def batch_pipe(self) -> Optional[Tuple[BatchStageFunc, ...]]:
+        """Функции этапов для пачки предложений в порядке выполнения или None, если их нет у части этапов"""
+        if all(s.batch is not None for s in self.stages):
+            return tuple(s.batch for s in self.stages)
+
+        return None
+
+    def batch(self, batch: StemBatch) -> StemBatch:
+        """
+        Выполнить пайплайн для пачки предложений (см. `batch_pipe`)
+
+        :raises ValueError: если у части этапов нет функции для пачки предложений
+        """
+        missing = [s.name for s in self.stages if s.batch is None]
+
+        if missing:
+            raise ValueError(f'Pipeline stages without batch version: {", ".join(missing)}')
+
+        for stage in self.stages:
+            batch = stage.batch(batch)
+
+        return batch
+
+    def active(self, token_types: Iterable[TokenType]) -> Tuple[Stage, ...]:
+        """
+        Этапы плана, которые могут изменить предложение с токенами переданных типов
+
+        :param token_types: типы токенов предложения
+        """
+        present, active = set(token_types), []
+
+        for stage in self.stages:
+            if not stage.token_types.isdisjoint(present):
+                active.append(stage)
+                present |= stage.output_types
+
+        return tuple(active)
+
+    def __call__(self, analysis_result: Iterable[dict], lazy: bool = False) -> List[iStemTuple]:
+        stems = list(stems_gen(analysis_result, lazy))
+        token_types = frozenset({s[0][1] for s in stems})
+
+        try:
+            compiled = self.by_types[token_types]
+        except KeyError:
+            # наборов типов токенов в предложениях немного, поэтому пайплайны собираются один раз
+            stages = self.active(token_types)
+            compiled = self.by_types[token_types] = (
+                self.compiled if len(stages) == len(self.stages) else _compiled(stages))
+
+        return compiled.process(stems)
+
+    def stream(self, analysis_result: Iterable[dict], lazy: bool = False) -> Iterator[iStemTuple]:
+        """
+        Выполнить пайплайн, выдавая результаты по мере поступления (см. `CompiledPipeline.stream`).
+        Типы токенов предложения заранее не известны, поэтому выполняются все этапы плана
+        """
+        return self.compiled.stream(analysis_result, lazy)
+
+
+class _Branch(NamedTuple):
+    """Узел дерева вариантов пайплайна"""
+    segment: CompiledPipeline           # этапы, общие для всех вариантов узла
+    variants: Tuple[str, ...]           # варианты, которые заканчиваются этим узлом
+    children: Tuple['_Branch', ...]     # продолжения вариантов узла
+
+
+class PipelineVariants:
+    """
+    Несколько вариантов пайплайна, выполняемых для одного результата анализа (см. `pipeline_variants`).
+
+    Планы вариантов собираются в дерево: общие начальные этапы вариантов выполняются один раз, а их результат
+    передается этапам каждого из продолжений.
+    """
+
+    def __init__(self, plans: Mapping[str, PipelinePlan]):
+        """
+        :param plans: планы выполнения вариантов пайплайна {наименование варианта: план}
+        """
+        self.plans = dict(plans)
+        self._root = self._branch([(name, plan.stages) for name, plan in self.plans.items()])
+
+    @classmethod
+    def _branch(cls, variants: List[Tuple[str, Tuple[Stage, ...]]], depth: int = 0) -> _Branch:
+        end = depth
+
+        # общие этапы всех вариантов узла
+        while all(len(stages) > end for _, stages in variants) and len({stages[end] for _, stages in variants}) == 1:
+            end += 1
+
+        segment = compile_pipeline([s.func for s in variants[0][1][depth:end]] if variants else ())
+        children = {}  # type: Dict[Stage, List[Tuple[str, Tuple[Stage, ...]]]]
+
+        for name, stages in variants:
+            if len(stages) > end:
+                children.setdefault(stages[end], []).append((name, stages))
+
+        return _Branch(
+            segment,
+            tuple(name for name, stages in variants if len(stages) == end),
+            tuple(cls._branch(v, end) for v in children.values()))
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        """Наименования вариантов"""
+        return tuple(self.plans)
+
+    def __call__(self, analysis_result: Iterable[dict], lazy: bool = False) -> Dict[str, List[iStemTuple]]:
+        """
+        :param analysis_result: результ морфологического разбора MyStem
+        :param lazy: откладывать разбор граммем до первого обращения (см. `stems_gen`)
+        :return: результаты вариантов {наименование варианта: результат} в порядке передачи вариантов
+        """
+        result = dict.fromkeys(self.plans)
+        # этапы не изменяют полученные токены, поэтому продолжения узла получают один и тот же список
+        pending = [(self._root, stems_gen(analysis_result, lazy))]
+
+        while pending:
+            branch, stems = pending.pop()
+            stems = branch.segment.process(stems)
+
+            for name in branch.variants:
+                result[name] = stems.copy()
+
+            pending.extend((child, stems) for child in branch.children)
+
+        return result
+
+
+_registry = {}  # type: Dict[str, Stage]
+_registry_lock = Lock()
+
+
+def _stage_name(name: StageName) -> str:
+    return name.value if isinstance(name, Pipeline) else name
+
+
+def register_stage(
+        name: StageName,
+        func: StageFunc = None,
+        after: Iterable[StageName] = (),
+        before: Iterable[StageName] = (),
+        token_types: Iterable[TokenType] = TokenType,
+        output_types: Iterable[TokenType] = TokenType,
+        batch: BatchStageFunc = None):
+    """
+    Зарегистрировать этап пайплайна. Функция этапа может иметь любое имя. Без параметра `func` возвращает
+    декоратор::
+
+        @register_stage('currency', after=[Pipeline.WORD2NUM], token_types=[TokenType.NUM], output_types=[])
+        def currency(stems):
+            ...
+
+        with jstem_ctx() as stemmer:
+            print(list(normalize('сто рублей', stemmer, pipeline=[Pipeline.WORD2NUM, 'currency'])))
+
+    Ограничения порядка `after` и `before` действуют, только если оба этапа входят в пайплайн,
+    поэтому в них можно указывать этапы, которые еще не зарегистрированы.
+
+    Этап пропускается для предложений без токенов типов `token_types`, поэтому по-умолчанию этап обрабатывает
+    токены всех типов и может создать токены любого типа.
+
+    :param name:        наименование этапа
+    :param func:        функция этапа (см. `pipeline`)
+    :param after:       этапы, которые должны выполняться раньше этого этапа
+    :param before:      этапы, которые должны выполняться позже этого этапа
+    :param token_types: типы токенов, которые этап изменяет, объединяет или удаляет
+    :param output_types: типы токенов, которые этап может создать из токенов других типов
+    :param batch:       функция этапа для пачки предложений (см. `StemBatch`), результат которой совпадает
+                        с результатом `func` для каждого предложения пачки
+    :raises ValueError: если этап с таким наименованием уже зарегистрирован
+    """
+    if func is None:
+        def decorator(f: StageFunc) -> StageFunc:
+            register_stage(name, f, after, before, token_types, output_types, batch)
+            return f
+
+        return decorator
+
+    stage = Stage(
+        _stage_name(name), func, frozenset(map(_stage_name, after)), frozenset(map(_stage_name, before)),
+        frozenset(token_types), frozenset(output_types), batch)
+
+    with _registry_lock:
+        if stage.name in _registry:
+            raise ValueError(f'Pipeline stage "{stage.name}" is already registered')
+
+        _registry[stage.name] = stage
+        plan_cache_clear()
+
+    logger.debug(f'Pipeline stage "{stage.name}" registered')
+
+
+def unregister_stage(name: StageName):
+    """
+    Удалить этап пайплайна из реестра
+
+    :raises KeyError: если этап не зарегистрирован
+    """
+    with _registry_lock:
+        del _registry[_stage_name(name)]
+        plan_cache_clear()
+
+
+def get_stage(name: StageName) -> Stage:
+    """
+    Получить описание этапа пайплайна по наименованию
+
+    :raises KeyError: если этап не зарегистрирован
+    """
+    return _registry[_stage_name(name)]
+
+
+def pipeline_plan(*stages: StageName) -> PipelinePlan:
+    """
+    Получить план выполнения пайплайна из переданных этапов::
+
+        plan = pipeline_plan(Pipeline.WORD2NUM, Pipeline.STOPWORDS)
+        plan.names  # ('word2num', 'stopwords')
+
+        for stem in plan(analysis_result):
+            # do smth with result
+
+    Этапы выполняются в порядке передачи. Если порядок не соответствует ограничениям порядка этапов
+    (см. `register_stage`), в лог выводится предупреждение. План кэшируется (размер кэша задается переменной
+    окружения `MYSTEM_PLAN_CACHE_SIZE`).
+
+    :param stages: наименования этапов в порядке выполнения
+    :raises ValueError: если этап не зарегистрирован
+    """
+    return _plan(tuple(dict.fromkeys(map(_stage_name, stages))))
+
+
+def pipeline_variants(variants: Mapping[str, Iterable[StageName]]) -> PipelineVariants:
+    """
+    Получить несколько вариантов пайплайна для одного результата анализа::
+
+        variants = pipeline_variants({'full': Pipeline, 'no_stopwords': set(Pipeline) - {Pipeline.STOPWORDS}})
+
+        for name, stems in variants(analysis_result).items():
+            # do smth with result
+
+    Этапы каждого варианта выполняются в порядке передачи (см. `pipeline_plan`). Этапы варианта, переданные
+    множеством, выполняются в порядке ограничений порядка этапов, а этапы без ограничений - в порядке регистрации.
+    Общие начальные этапы вариантов выполняются один раз для всех вариантов. Варианты кэшируются вместе с планами.
+
+    :param variants: этапы вариантов пайплайна {наименование варианта: наименования этапов}
+    :raises ValueError: если этап не зарегистрирован или ограничения порядка этапов множества противоречат друг другу
+    """
+    return _variants(tuple(
+        (name, frozenset(map(_stage_name, stages)) if isinstance(stages, AbstractSet)
+         else tuple(dict.fromkeys(map(_stage_name, stages))))
+        for name, stages in variants.items()))
+
+
+def plan_cache_clear():
+    """Очистить кэш планов и вариантов пайплайна (см. `pipeline_plan`, `pipeline_variants`)"""
+    _plan.cache_clear()
+    _variants.cache_clear()
+    _compiled.cache_clear()
+
+
+@lru_cache(maxsize=MYSTEM_PLAN_CACHE_SIZE)
+def _variants(variants: Tuple[Tuple[str, Union[Tuple[str, ...], FrozenSet[str]]], ...]) -> PipelineVariants:
+    return PipelineVariants({name: _plan(names) for name, names in variants})
+
+
+@lru_cache(maxsize=MYSTEM_PLAN_CACHE_SIZE)
+def _plan(names: Union[Tuple[str, ...], FrozenSet[str]]) -> PipelinePlan:
+    """План этапов в переданном порядке или, для множества этапов, в порядке ограничений порядка этапов"""
+    with _registry_lock:
+        registry = {s.name: s for s in _registry.values()}
+
+    unknown = set(names).difference(registry)
+
+    if unknown:
+        raise ValueError(f'Unknown pipeline stages: {", ".join(sorted(unknown))}')
+
+    if isinstance(names, tuple):
+        ordered = [registry[name] for name in names]
+
+        for idx, stage in enumerate(ordered):
+            # этапы, которые должны выполняться раньше, но переданы позже
+            late = stage.after.intersection(names[idx + 1:]) | stage.before.intersection(names[:idx])
+
+            if late:
+                logger.warning(
+                    f'Pipeline stage "{stage.name}" violates ordering constraints with: {", ".join(sorted(late))}')
+
+        return PipelinePlan(tuple(ordered), _compiled(tuple(ordered)), {})
+
+    pending = [s for s in registry.values() if s.name in names]
+    required = {s.name: s.after & names for s in pending}
+
+    for s in pending:
+        for name in s.before & names:
+            required[name] = required[name] | {s.name}
+
+    ordered, done = [], set()
+
+    while pending:
+        # первый в порядке регистрации этап, все предшественники которого уже выполнены
+        stage = next((s for s in pending if required[s.name] <= done), None)
+
+        if stage is None:
+            raise ValueError(f'Pipeline stages ordering constraints conflict: {", ".join(s.name for s in pending)}')
+
+        pending.remove(stage)
+        ordered.append(stage)
+        done.add(stage.name)
+
+    return PipelinePlan(tuple(ordered), _compiled(tuple(ordered)), {})
+
+
+@lru_cache(maxsize=MYSTEM_PLAN_CACHE_SIZE)
+def _compiled(stages: Tuple[Stage, ...]) -> CompiledPipeline:
+    return compile_pipeline([s.func for s in stages])
+
+
+# Этапы пайплайна модуля `_processing`. Числа и даты собираются из уже преобразованных токенов,
+# а стоп-слова удаляются после замены числительных: часть числительных входит в список стоп-слов
+# Леммы есть только у текстовых токенов, поэтому этапы, проверяющие леммы, обрабатывают только `TokenType.TXT`
+register_stage(
+    Pipeline.WORD2NUM, pipe_word2num, token_types=[TokenType.TXT], output_types=[TokenType.NUM], batch=batch_word2num)
+register_stage(
+    Pipeline.ORD_UNFOLD, pipe_ord_unfold, token_types=[TokenType.TXT], output_types=[], batch=batch_ord_unfold)
+register_stage(
+    Pipeline.MAKE_DATE, pipe_makedate,
+    after=[Pipeline.WORD2NUM, Pipeline.ORD_UNFOLD], token_types=[TokenType.TXT, TokenType.NUM, TokenType.DATE],
+    output_types=[TokenType.DATE], batch=batch_makedate)
+register_stage(
+    Pipeline.KILO, pipe_kilo_postfix, token_types=[TokenType.TXT], output_types=[TokenType.NUM],
+    batch=batch_kilo_postfix)
+register_stage(
+    Pipeline.CCN, pipe_merge_ccn,
+    after=[Pipeline.WORD2NUM, Pipeline.ORD_UNFOLD, Pipeline.KILO], token_types=[TokenType.NUM],
+    output_types=[TokenType.CARDNUM], batch=batch_merge_ccn)
+register_stage(
+    Pipeline.STOPWORDS, pipe_stopwords,
+    after=[Pipeline.WORD2NUM], token_types=[TokenType.TXT], output_types=[], batch=batch_stopwords)
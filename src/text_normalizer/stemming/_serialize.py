@@ -0,0 +1,114 @@
+"""Модуль для сериализации результатов нормализации в JSON без промежуточных структур данных"""
+
+import json
+from json.encoder import encode_basestring
+from typing import Callable, Iterable, Sequence
+
+from ._mystem import (
+    iStemTuple, FrozenGrammem, LazyGrammem, STEM_FIELDS, MYSTEM_GRAMMEM_CACHE_SIZE, stem_converter, _grammem_dict,
+    _grammem_tuple, _GRAMMEM_ID_SHIFT)
+
+__all__ = ['StemSerializer']
+
+
+class StemSerializer:
+    """
+    Сериализатор результатов нормализации в JSON.
+
+    Результат совпадает с `json.dumps(..., ensure_ascii=False)` для картежей или словарей, которые возвращает
+    `stem_converter(fmt, fields)`, но записывается сразу в байтовый буфер, без создания картежей и словарей
+    для каждого токена. Строки JSON граммем вычисляются один раз для каждого словаря граммем (см. `FrozenGrammem`)::
+
+        serializer = StemSerializer('tuple', ('token', 'lemma'))
+
+        for sentence in sentences:
+            sys.stdout.buffer.write(serializer.lines(pipeline(analyze(sentence, stemmer))))
+
+    Методы возвращают внутренний буфер сериализатора, содержимое которого действительно до следующего вызова.
+    """
+
+    def __init__(self, fmt: str = 'tuple', fields: Sequence[str] = STEM_FIELDS):
+        """
+        :param fmt:    формат результата: 'tuple' или 'dict' (см. `stem_converter`)
+        :param fields: поля результата из `STEM_FIELDS`
+        """
+        # проверка формата и полей
+        stem_converter(fmt, fields)
+
+        self.fmt = fmt
+        self.fields = tuple(fields)
+        self._buffer = bytearray()
+        self._grammems = {}     # маска граммем -> JSON граммем
+        self._stem = self._stem_func()
+
+    def array(self, stems: Iterable[iStemTuple]) -> bytearray:
+        """Сериализовать результат нормализации строки в JSON-массив"""
+        buffer = self._buffer
+        del buffer[:]
+        buffer += b'['
+        separator = b''
+
+        for item in map(self._stem, stems):
+            buffer += separator
+            buffer += item.encode()
+            separator = b', '
+
+        buffer += b']'
+
+        return buffer
+
+    def lines(self, stems: Iterable[iStemTuple]) -> bytearray:
+        """Сериализовать результат нормализации строки в NDJSON: один токен на строку"""
+        buffer = self._buffer
+        del buffer[:]
+
+        for line in map(self._stem, stems):
+            buffer += line.encode()
+            buffer += b'\n'
+
+        return buffer
+
+    def _stem_func(self) -> Callable[[iStemTuple], str]:
+        grammem = self._grammem_json
+        getters = {
+            'token': lambda s: encode_basestring(f'{s[0][0]}'),
+            'lemma': lambda s: encode_basestring(f'{s[1]}'),
+            'grammem': lambda s: grammem(s[2]),
+            'qual': lambda s: 'true' if s[3] else 'false',
+        }
+
+        if self.fmt == 'dict':
+            items = tuple((f'{encode_basestring(f)}: ', getters[f]) for f in self.fields)
+            return lambda s: f'{{{", ".join([key + get(s) for key, get in items])}}}'
+
+        if self.fields == STEM_FIELDS:
+            token, lemma, qual = getters['token'], getters['lemma'], getters['qual']
+            return lambda s: f'[{token(s)}, {lemma(s)}, {grammem(s[2])}, {qual(s)}]'
+
+        field_getters = tuple(getters[f] for f in self.fields)
+
+        return lambda s: f'[{", ".join([get(s) for get in field_getters])}]'
+
+    def _grammem_json(self, grammem) -> str:
+        # маска словаря граммем, полученного из строки граммем mystem, однозначно определяет его содержимое
+        cached = (type(grammem) is FrozenGrammem or type(grammem) is LazyGrammem) and grammem.mask >> _GRAMMEM_ID_SHIFT
+
+        if cached:
+            result = self._grammems.get(grammem.mask)
+
+            if result is not None:
+                return result
+
+        stem = (None, None, grammem, None)
+        result = json.dumps(_grammem_tuple(stem) if self.fmt == 'tuple' else _grammem_dict(stem), ensure_ascii=False)
+
+        if cached:
+            if len(self._grammems) >= MYSTEM_GRAMMEM_CACHE_SIZE:
+                self._grammems.clear()
+
+            self._grammems[grammem.mask] = result
+
+        return result
+
+    def __reduce__(self):
+        return StemSerializer, (self.fmt, self.fields)
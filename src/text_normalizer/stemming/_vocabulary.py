@@ -0,0 +1,109 @@
+"""Модуль общего словаря строк процесса с целочисленными номерами словоформ и лемм"""
+
+import logging
+import os
+from threading import Lock
+from typing import Iterable, List, Dict, FrozenSet, Optional
+
+from ..convert._numeral import _numerics
+from ..convert import MONTHS_SET
+from ..tokenization import russian_stopwords
+
+__all__ = ['Vocabulary', 'get_vocabulary', 'MYSTEM_VOCABULARY_SIZE']
+
+logger = logging.getLogger('rtn')
+
+# Максимальное количество строк в общем словаре процесса, после которого создается новый словарь
+MYSTEM_VOCABULARY_SIZE = int(os.environ.get('MYSTEM_VOCABULARY_SIZE', 2 ** 20))
+
+
+class Vocabulary:
+    """
+    Словарь строк (словоформ и лемм) с плотными целочисленными номерами.
+
+    Каждая строка хранится в словаре один раз, поэтому результаты анализа, использующие номера строк
+    (см. `StemBatch`), не хранят повторяющиеся строки. Номера стоп-слов, числительных и месяцев
+    вычисляются при создании словаря, и этапы обработки проверяют принадлежность к этим множествам по номеру::
+
+        vocabulary = get_vocabulary()
+        lemma_id = vocabulary.id('тысяча')
+        lemma_id in vocabulary.numeral_ids  # True
+
+    Строка '' всегда имеет номер 0.
+    """
+
+    def __init__(self):
+        self.words = []     # type: List[str]
+        self._ids = {}      # type: Dict[str, int]
+        self._lock = Lock()
+        self.id('')
+        # номера стоп-слов (см. `pipe_stopwords`)
+        self.stopword_ids = frozenset(map(self.id, russian_stopwords))
+        # номера лемм числительных (см. `pipe_word2num`)
+        self.numeral_ids = frozenset(map(self.id, _numerics))
+        # номера названий месяцев (см. `pipe_makedate`)
+        self.month_ids = frozenset(map(self.id, MONTHS_SET))
+
+    def id(self, word: str) -> int:
+        """Номер строки в словаре. Отсутствующая строка добавляется в словарь"""
+        word_id = self._ids.get(word)
+
+        if word_id is None:
+            with self._lock:
+                word_id = self._ids.get(word)
+
+                if word_id is None:
+                    word_id = self._ids[word] = len(self.words)
+                    self.words.append(word)
+
+        return word_id
+
+    def get(self, word: str) -> Optional[int]:
+        """Номер строки в словаре или None, если строки нет в словаре"""
+        return self._ids.get(word)
+
+    def ids(self, words: Iterable[str]) -> FrozenSet[int]:
+        """Номера строк словаря, которые входят в `words`"""
+        ids = self._ids
+        return frozenset(ids[w] for w in words if w in ids)
+
+    def intern(self, word: str) -> str:
+        """Получить хранящийся в словаре экземпляр строки"""
+        return self.words[self.id(word)]
+
+    def __getitem__(self, word_id: int) -> str:
+        return self.words[word_id]
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ids
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+_vocabulary = None      # type: Optional[Vocabulary]
+_vocabulary_lock = Lock()
+
+
+def get_vocabulary() -> Vocabulary:
+    """
+    Получить общий словарь строк процесса.
+
+    Если словарь содержит больше `MYSTEM_VOCABULARY_SIZE` строк, создается новый словарь. Объекты, созданные
+    с предыдущим словарем (см. `StemBatch`), продолжают использовать его.
+    """
+    global _vocabulary
+
+    vocabulary = _vocabulary
+
+    if vocabulary is None or len(vocabulary) > MYSTEM_VOCABULARY_SIZE:
+        with _vocabulary_lock:
+            if _vocabulary is vocabulary:
+                if vocabulary is not None:
+                    logger.debug(f'Vocabulary size limit exceeded ({len(vocabulary)}), new vocabulary created')
+
+                _vocabulary = Vocabulary()
+
+            vocabulary = _vocabulary
+
+    return vocabulary
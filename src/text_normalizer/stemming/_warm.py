@@ -0,0 +1,157 @@
+"""Модуль для быстрого получения заранее запущенных стеммеров"""
+
+import logging
+import os
+from contextlib import contextmanager
+from queue import Queue, Empty
+from threading import Event, Semaphore, Thread
+from typing import Callable
+
+from ._mystem import JsonStemmer, jstem_inst, _is_alive
+
+__all__ = ['WarmStemmerFactory', 'warm_jstem_ctx', 'MYSTEM_SPARES', 'MYSTEM_SPARE_WAIT']
+
+logger = logging.getLogger('rtn')
+
+# Количество запущенных стеммеров, которые фабрика держит наготове
+MYSTEM_SPARES = int(os.environ.get('MYSTEM_SPARES', 1))
+
+# Время ожидания запускаемого в фоне стеммера, если готовых стеммеров нет, секунды (см. `WarmStemmerFactory.get`)
+MYSTEM_SPARE_WAIT = float(os.environ.get('MYSTEM_SPARE_WAIT', 0.1))
+
+
+class WarmStemmerFactory:
+    """
+    Фабрика заранее запущенных и прогретых стеммеров.
+
+    Запуск `mystem` занимает заметное время: процесс загружает словари и пользовательский словарь (fixlist)
+    до ответа на первый запрос. Фабрика держит наготове `spares` запущенных стеммеров, уже выполнивших
+    пробный запрос (см. `JsonStemmer.warmup`), и в фоновом потоке запускает новый стеммер взамен каждого
+    выданного, поэтому получение стеммера не требует ожидания запуска процесса::
+
+        factory = WarmStemmerFactory(2)
+        factory.start()
+
+        with warm_jstem_ctx(factory) as stem:
+            result = stem.analyze(tokens)
+
+        factory.stop()
+
+    Выданный стеммер принадлежит получателю и должен быть им остановлен (см. `warm_jstem_ctx`).
+    """
+
+    def __init__(self, spares: int = MYSTEM_SPARES, factory: Callable[[], JsonStemmer] = jstem_inst):
+        """
+        :param spares:  количество запущенных стеммеров, ожидающих выдачи
+        :param factory: функция для создания нового стеммера
+        """
+        if spares < 1:
+            raise ValueError(f'Invalid spares count {spares}')
+
+        self._factory = factory
+        self._spares = Queue()
+        self._slots = Semaphore(spares)
+        self._stopped = Event()
+        self._filler = None
+        self.created = 0
+
+    @property
+    def ready(self) -> int:
+        """Количество запущенных стеммеров, ожидающих выдачи"""
+        return self._spares.qsize()
+
+    def start(self):
+        if self._filler is not None:
+            return
+
+        self._stopped.clear()
+        self._filler = Thread(target=self._fill, daemon=True, name='mystem-spares')
+        self._filler.start()
+
+    def stop(self):
+        if self._filler is None:
+            return
+
+        self._stopped.set()
+        # поток заполнения может ожидать освобождения места для нового стеммера
+        self._slots.release()
+        self._filler.join()
+        self._filler = None
+
+        while not self._spares.empty():
+            self._spares.get_nowait().stop()
+
+    def get(self, timeout: float = MYSTEM_SPARE_WAIT) -> JsonStemmer:
+        """
+        Получить запущенный стеммер.
+
+        Если готовых стеммеров нет, ожидает запуска стеммера фоновым потоком не дольше `timeout` секунд
+        (0 - не ожидать), после чего запускает новый стеммер в вызывающем потоке. Если фабрика не запущена,
+        стеммер всегда запускается в вызывающем потоке.
+        """
+        while self._filler is not None:
+            try:
+                stem = self._spares.get(timeout=timeout)
+            except Empty:
+                break
+
+            self._slots.release()
+
+            if _is_alive(stem):
+                return stem
+
+            # процесс завершился, пока стеммер ожидал выдачи
+            logger.warning('Spare Mystem process exited')
+            stem.stop()
+
+        logger.warning('No warm Mystem available, starting a new one')
+
+        return self._warm()
+
+    def _warm(self) -> JsonStemmer:
+        stem = self._factory()
+        stem.start()
+        stem.warmup()
+        self.created += 1
+
+        return stem
+
+    def _fill(self):
+        while True:
+            self._slots.acquire()
+
+            if self._stopped.is_set():
+                break
+
+            try:
+                stem = self._warm()
+            except Exception:
+                logger.exception('Could not start Mystem')
+                self._slots.release()
+                self._stopped.wait(1)
+                continue
+
+            if self._stopped.is_set():
+                stem.stop()
+                break
+
+            self._spares.put(stem)
+
+
+@contextmanager
+def warm_jstem_ctx(factory: WarmStemmerFactory) -> JsonStemmer:
+    """
+    Контекстный менеджер для работы со стеммером, полученным из фабрики прогретых стеммеров.
+    Стеммер останавливается по завершении работы, фабрика запускает новый взамен::
+
+        with warm_jstem_ctx(factory) as stem:
+            result = stem.analyze(tokens)
+
+    :param factory: фабрика прогретых стеммеров
+    """
+    stem = factory.get()
+
+    try:
+        yield stem
+    finally:
+        stem.stop()
@@ -4,7 +4,7 @@ import re
 import string
 from enum import IntEnum
 from functools import lru_cache
-from typing import Tuple, Iterator
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from nltk.corpus import stopwords
 from nltk.tokenize import ToktokTokenizer
@@ -21,6 +21,9 @@ __all__ = [
     'iTokenTuple',
     'russian_stopwords',
     'replace_bigrams',
+    'replace_synonyms',
+    'SynonymMatcher',
+    'get_synonym_matcher',
     'KILO_POSTFIX',
     'init_cache',
     'cache_clear',
@@ -36,7 +39,6 @@ russian_stopwords = stopwords.words("russian")
 _spaces = string.whitespace
 _punct = set(f'{string.punctuation}{"«»…=#-——–``"}{string.whitespace}')
 _isolating_punct = {'"', "'", '{', '}', '[', ']', '(', ')', '«', '»'}
-_synonyms = load_conf(PipelineConfigType.SYNONIMS)
 _regex_time = load_regex_conf(RegexConfigType.TIME)
 
 
@@ -114,32 +116,113 @@ class RegexTokenType:
         return TokenType.NONE
 
 
+# Проходы токенизатора в дополнение к проходам TokTok: (выражение, замена)
+_SLASHED_LETTERS = re.compile(r"(?<![а-яА-Я])([а-яА-Я]{1})(\/)([а-яА-Я]{1})"), r"\1\3 "
+_NUM_DASH_WORD = re.compile(r"(\d)(-)([а-яА-Я]+)"), r"\1\3 "
+_DASH_QUOTES = re.compile(r"(-«»)"), r" \1 "
+_LEADING_DASH = re.compile(r"\s+(-)(\w+)"), r" \1 \2 "
+_TRAILING_DASH = re.compile(r"(\w+)(-)\s"), r" \1 \2 "
+_SLASH = re.compile(r"(?<=[а-яА-я])([/\\])"), r" \1 "
+_NUMBER = re.compile(r"([=…№\-——'\s]+)(\d+)([=…№\-——'\s]+)"), r" \1 \2 \3"
+# Выделение токенов с "тысячным" префиксом (e.g. 5к, 5 к )
+_KILO = re.compile(r"(\d)\s?[кk]"), rf"{KILO_POSTFIX}\1{KILO_POSTFIX}"
+
+# Обозначение любой цифры (\d) в наборе символов строки
+_DIGIT = r'\d'
+
+_T = ToktokTokenizer
+
+# Символы, без которых выражение прохода не находит совпадений: строка должна содержать хотя бы один символ
+# из каждой группы. Выражения из одного класса символов (e.g. `_T.FUNKY_PUNCT_1`) находят только те символы
+# своей записи, с которыми совпадают. Проходы, которых нет в таблице, выполняются всегда
+_PASS_TRIGGERS = {
+    _regex_time: (':',),
+    _T.URL_FOE_1[0]: (':',),
+    _T.URL_FOE_2[0]: ('?',),
+    _T.URL_FOE_3[0]: (':',),
+    _T.URL_FOE_4[0]: ('/',),
+    _T.AMPERCENT[0]: ('&',),
+    _T.TAB[0]: ('\t',),
+    _T.PIPE[0]: ('|',),
+    _T.MULTI_COMMAS[0]: (',',),
+    _T.COMMA_IN_NUM[0]: (',،',),
+    _T.FINAL_PERIOD_1[0]: ('.',),
+    _T.FINAL_PERIOD_2[0]: ('.',),
+    _T.STUPID_QUOTES_1[0]: ('`',),
+    _T.STUPID_QUOTES_2[0]: ("'",),
+    _T.MULTI_DASHES[0]: ('-',),
+    _T.MULTI_DOTS[0]: ('.',),
+    _T.ONE_SPACE[0]: (' ',),
+    _SLASHED_LETTERS[0]: ('/',),
+    _NUM_DASH_WORD[0]: (_DIGIT, '-'),
+    _DASH_QUOTES[0]: ('-', '«', '»'),
+    _LEADING_DASH[0]: ('-',),
+    _TRAILING_DASH[0]: ('-',),
+    _SLASH[0]: ('/\\',),
+    _NUMBER[0]: (_DIGIT,),
+    _KILO[0]: (_DIGIT, 'кk'),
+    **{
+        regexp: (''.join(c for c in regexp.pattern if regexp.fullmatch(c)),) for regexp, _ in [
+            _T.NON_BREAKING, _T.FUNKY_PUNCT_1, _T.FUNKY_PUNCT_2, _T.EN_EM_DASHES, _T.OPEN_PUNCT_RE,
+            _T.CLOSE_PUNCT_RE, _T.CURRENCY_SYM_RE, _T.PROB_SINGLE_QUOTES]
+    },
+}
+
+
+def _charset(text: str) -> set:
+    """Набор символов строки (цифры дополнительно обозначаются `_DIGIT`)"""
+    chars = set(text)
+
+    if any(map(str.isdecimal, chars)):
+        chars.add(_DIGIT)
+
+    return chars
+
+
 class TokTok(TokenizerI):
     """
     В качестве основы используется набор регулярных выражений и упрощенный алгоритм обработки строки
     из токенизатора `TokTok <https://www.nltk.org/api/nltk.tokenize.html#module-nltk.tokenize.toktok>`_.
 
+    Выражения применяются к строке по очереди, но проходы, выражения которых не могут найти совпадений
+    в строке (в строке нет обязательных символов выражения, см. `_PASS_TRIGGERS`), пропускаются.
+    Результат совпадает с результатом последовательного применения всех выражений.
     """
     def __init__(self):
         self._regexes = ToktokTokenizer.TOKTOK_REGEXES[:]
 
         self._regexes[2] = (_regex_time, r"(\1)")
-        self._regexes.insert(3, (re.compile(r"(?<![а-яА-Я])([а-яА-Я]{1})(\/)([а-яА-Я]{1})"), r"\1\3 "))
-        self._regexes.insert(4, (re.compile(r"(\d)(-)([а-яА-Я]+)"), r"\1\3 "))
-        self._regexes.append((re.compile(r"(-«»)"), r" \1 "))
-        self._regexes.append((re.compile(r"\s+(-)(\w+)"), r" \1 \2 "))
-        self._regexes.append((re.compile(r"(\w+)(-)\s"), r" \1 \2 "))
-        self._regexes.append((re.compile(r"(?<=[а-яА-я])([/\\])"), r" \1 "))
-        self._regexes.append((re.compile(r"([=…№\-——'\s]+)(\d+)([=…№\-——'\s]+)"), r" \1 \2 \3"))
-        # Выделение токенов с "тысячным" префиксом (e.g. 5к, 5 к )
-        self._regexes.append((re.compile(r"(\d)\s?[кk]"), rf"{KILO_POSTFIX}\1{KILO_POSTFIX}"))
+        self._regexes.insert(3, _SLASHED_LETTERS)
+        self._regexes.insert(4, _NUM_DASH_WORD)
+        self._regexes.append(_DASH_QUOTES)
+        self._regexes.append(_LEADING_DASH)
+        self._regexes.append(_TRAILING_DASH)
+        self._regexes.append(_SLASH)
+        self._regexes.append(_NUMBER)
+        self._regexes.append(_KILO)
         self._regexes.append(ToktokTokenizer.FUNKY_PUNCT_2)
 
+        # (замена, строка замены, группы обязательных символов, символы, которые добавляет замена)
+        self._passes = [
+            (regexp.subn, substitution,
+             tuple(frozenset({group} if group == _DIGIT else group) for group in _PASS_TRIGGERS.get(regexp, ())),
+             frozenset(_charset(re.sub(r'\\\d', '', substitution))))
+            for regexp, substitution in self._regexes
+        ]
+
     def tokenize(self, text: str) -> [str]:
-        for regexp, subsitution in self._regexes:
-            text = regexp.sub(subsitution, text)
+        chars = _charset(text)
+
+        for subn, substitution, triggers, inserted in self._passes:
+            for group in triggers:
+                if chars.isdisjoint(group):
+                    break
+            else:
+                text, n = subn(substitution, text)
 
-        text = text.strip()
+                # замены только переносят и удаляют символы строки, а добавляют символы строки замены
+                if n:
+                    chars |= inserted
 
         return text.split()
 
@@ -206,43 +289,131 @@ def to_token(token_string: str) -> iTokenTuple:
     return token_string, token_type(token_string)
 
 
-def replace_bigrams(tokens: Iterator[iTokenTuple]) -> Iterator[iTokenTuple]:
+class SynonymMatcher:
     """
-    Заменить биграммы на токены из словаря.
-    Служит для быстрой замены токенов вроде "когда то" на "когда-то", а также прочих биграмм.
+    Префиксное дерево (trie) фраз словаря синонимов, в котором переходы выполняются по токенам.
 
-    >>> from text_normalizer.tokenization import replace_bigrams
-    >>> replace_bigrams(iter(['окко', TokenType.TXT), ('тв', TokenType.TXT)]))
-    ('окко-тв', TokenType.TXT)
+    Фразы любой длины заменяются за один проход по потоку токенов: из фраз, начинающихся с одного токена,
+    выбирается самая длинная, а токены задерживаются, только пока они могут оказаться частью фразы.
+    Тип токена замены - тип последнего токена фразы::
+
+        matcher = SynonymMatcher({'кэш бэк': 'cashback', 'рублей': 'rur'})
+        list(matcher.replace([('кэш', TokenType.TXT), ('бэк', TokenType.TXT), ('100', TokenType.NUM)]))
+        # [('cashback', TokenType.TXT), ('100', TokenType.NUM)]
+
+    Фразы словаря разбиваются на токены по пробелам, а если передан токенизатор - еще и так, как
+    токенизатор разбивает строку (e.g. "отпуск б/с" -> "отпуск", "бс").
     """
 
-    crnt = None
-    buffer = []
+    def __init__(self, synonyms: Mapping[str, str], tokenizer: Optional[TokenizerI] = None):
+        """
+        :param synonyms:  словарь {фраза: синоним}
+        :param tokenizer: токенизатор для разбиения фраз словаря
+        """
+        self.root = {}  # type: Dict[Optional[str], dict]
+        self.depth = 0  # количество токенов самой длинной фразы
+
+        for phrase, synonym in synonyms.items():
+            self._add(phrase.split(), synonym, True)
 
-    for token, _type in tokens:
-        crnt, prev = token, crnt
+        # разбиение токенизатором не заменяет синонимы фраз, которые так же разбиваются по пробелам
+        for phrase, synonym in synonyms.items() if tokenizer else ():
+            self._add(tokenizer.tokenize(phrase), synonym, False)
 
-        synonym = _synonyms.get(f'{crnt}', crnt)
+    def _add(self, words: List[str], synonym: str, replace: bool):
+        if not words:
+            return
 
-        if prev:
-            bigram = _synonyms.get(f'{prev} {crnt}')
+        node = self.root
 
-            if bigram:
-                buffer[-1] = (bigram, _type)
+        for word in words:
+            node = node.setdefault(word, {})
+
+        # синоним фразы хранится в узле ее последнего токена по ключу None
+        if replace or None not in node:
+            node[None] = synonym
+
+        self.depth = max(self.depth, len(words))
+
+    def replace(self, tokens: Iterable[iTokenTuple]) -> Iterator[iTokenTuple]:
+        """
+        Заменить фразы словаря в потоке токенов
+
+        :param tokens: итератор токенов
+        """
+        root = self.root
+        buffer = []
+
+        for token in tokens:
+            # большая часть токенов не начинает ни одной фразы
+            if not buffer and token[0] not in root:
+                yield token
                 continue
 
-        buffer.append((synonym, _type))
+            buffer.append(token)
+            yield from self._match(buffer, False)
+
+        yield from self._match(buffer, True)
+
+    def _match(self, buffer: List[iTokenTuple], final: bool) -> Iterator[iTokenTuple]:
+        """Заменить самые длинные фразы в начале буфера. Токены, которые могут продолжить фразу, остаются в буфере"""
+        root = self.root
+
+        while buffer:
+            node, length, synonym = root, 0, None
+
+            for i, token in enumerate(buffer):
+                node = node.get(token[0])
+
+                if node is None:
+                    break
+
+                if None in node:
+                    length, synonym = i + 1, node[None]
+            else:
+                # весь буфер - начало фразы, которую могут продолжить следующие токены
+                if not final and len(node) > (None in node):
+                    return
+
+            if length:
+                yield synonym, buffer[length - 1][1]
+                del buffer[:length]
+            else:
+                yield buffer.pop(0)
+
+
+@lru_cache(maxsize=1)
+def get_synonym_matcher() -> SynonymMatcher:
+    """Префиксное дерево словаря синонимов `dict_synonyms.json`"""
+    return SynonymMatcher(load_conf(PipelineConfigType.SYNONIMS), get_tokenizer())
+
+
+def replace_synonyms(tokens: Iterable[iTokenTuple]) -> Iterator[iTokenTuple]:
+    """
+    Заменить фразы любой длины на токены из словаря синонимов (см. `SynonymMatcher`).
+    Служит для быстрой замены токенов вроде "когда то" на "когда-то", а также прочих фраз.
+
+    >>> from text_normalizer.tokenization import replace_synonyms
+    >>> list(replace_synonyms(iter([('окко', TokenType.TXT), ('тв', TokenType.TXT)])))
+    [('окко-тв', TokenType.TXT)]
+    """
+    return get_synonym_matcher().replace(tokens)
+
 
-    yield from buffer
+def replace_bigrams(tokens: Iterable[iTokenTuple]) -> Iterator[iTokenTuple]:
+    """Заменить фразы на токены из словаря синонимов (см. `replace_synonyms`)"""
+    return replace_synonyms(tokens)
 
 
 def init_cache():
     get_regex_type()
     get_tokenizer()
+    get_synonym_matcher()
     logger.debug('Cache initiated')
 
 
 def cache_clear():
     get_regex_type.cache_clear()
     get_tokenizer.cache_clear()
+    get_synonym_matcher.cache_clear()
     logger.debug('Cache cleared')
@@ -23,3 +23,18 @@ def test_inconsistent_cli_args():
     with mock.patch('text_normalizer.api.cli.args.PIPELINE_ARGS', [1] * (len(Pipeline) - 1)):
         with pytest.raises(AssertionError):
             parse_normalization_args()
+
+
+@pytest.mark.parametrize('args, fields', [
+    (['abc'], ('token', 'lemma', 'grammem', 'qual')),
+    (['abc', '--fields', 'token'], ('token',)),
+    (['abc', '--fields', 'lemma, token'], ('lemma', 'token')),
+])
+def test_parse_fields_arg(args, fields):
+    assert parse_normalization_args(args).fields == fields
+
+
+@pytest.mark.parametrize('fields', ['', 'token,text'])
+def test_invalid_fields_arg(fields):
+    with pytest.raises(SystemExit):
+        parse_normalization_args(['abc', '--fields', fields])
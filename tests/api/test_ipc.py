@@ -1,10 +1,12 @@
+import json
+import pickle
 from threading import Thread
 from time import sleep
 
 import mock
 import pytest
 
-from text_normalizer import stemming
+from text_normalizer import stemming, normalization
 from text_normalizer.api import ipc
 
 
@@ -60,6 +62,58 @@ def test_server_recieve(mock_conn):
     assert ' '.join(t[0] for t in result) == s
 
 
+def test_server_recieve_serialized(mock_conn):
+    s = 'мама мыла раму'
+    mock_conn.poll.side_effect = [True, False]
+    mock_conn.recv.side_effect = [s]
+
+    ipc.receive(mock_conn, stemming.pipeline, stemming.StemSerializer('tuple', ('token', 'lemma')))
+
+    result = mock_conn.send.call_args[0][0]
+    assert isinstance(result, bytes)
+    assert json.loads(result) == [[t, t] for t in s.split()]
+
+
+@pytest.mark.parametrize('fmt', ['tuple', 'dict'])
+def test_server_client_round_trip(mock_conn, client, analize, fmt):
+    """Клиент получает тот же результат, что и до сериализации результата в JSON"""
+    s = 'мама мыла 5к рублей 2-го числа'
+    pl_args = list(stemming.Pipeline)
+    converter = stemming.to_tuple if fmt == 'tuple' else stemming.to_dict
+    expected = list(map(converter, stemming.pipeline(analize(s), pipe=normalization.compose_pipeline(*pl_args))))
+
+    plan = stemming.pipeline_plan(*pl_args)
+    convert = stemming.stem_converter(fmt, stemming.STEM_FIELDS)
+    client._conn = mock.MagicMock()
+    client._conn.closed = False
+
+    for pipeline, serializer in [
+        (lambda analysis: map(convert, plan(analysis)), None),
+        (plan, stemming.StemSerializer(fmt)),
+    ]:
+        mock_conn.poll.side_effect = [True, False]
+        mock_conn.recv.side_effect = [s]
+        ipc.receive(mock_conn, pipeline, serializer)
+
+        client._conn.poll.side_effect = [True]
+        client._conn.recv.side_effect = [pickle.loads(pickle.dumps(mock_conn.send.call_args[0][0]))]
+        result = client.normalize(s)
+
+        if serializer is None:
+            assert result == expected
+        else:
+            assert result == json.loads(json.dumps(expected, ensure_ascii=False))
+
+
+def test_rtn_client_serialized_result(client):
+    client._conn = mock.MagicMock()
+    client._conn.closed = False
+    client._conn.poll.side_effect = [True]
+    client._conn.recv.side_effect = ['[["мама", "мама"]]'.encode()]
+
+    assert client.normalize('мама') == [['мама', 'мама']]
+
+
 def test_rtn_client_empty_sentence(client):
     assert not client.normalize('')
 
@@ -1,4 +1,5 @@
 from functools import partial
+from time import sleep
 
 import pytest
 
@@ -10,10 +11,22 @@ from text_normalizer.stemming import (
     pipe_kilo_postfix,
     pipe_merge_ccn,
     Pipeline,
-    pipeline
+    pipeline,
+    compile_pipeline,
+    pipeline_plan,
+    pipeline_variants
 )
 
-from text_normalizer.normalization import compose_pipeline
+from text_normalizer.normalization import compose_pipeline, analyze
+from text_normalizer.stemming import jstem_ctx, warm_jstem_ctx, WarmStemmerFactory
+from text_normalizer.stemming import pipe_stopwords, stems_batch, batch_stopwords, batch_kilo_postfix, batch_ord_unfold
+from text_normalizer.convert import NUMERALS
+from text_normalizer.tokenization import TokenType
+
+
+@pytest.fixture(scope='module')
+def benchmark_tokens(tokenize, benchmark_text):
+    return [t[0] for t in tokenize(benchmark_text)]
 
 
 @pytest.mark.benchmark(group='ivr_stemming')
@@ -26,6 +39,12 @@ def test_benchmark_pipe_word2num(benchmark, stems):
     benchmark(lambda: list(pipe_word2num(stems)))
 
 
+@pytest.mark.benchmark(group='ivr_stemming')
+def test_benchmark_pipe_word2num_dictation(benchmark, stems):
+    dictation = [s for s in stems if s[0][1] == TokenType.TXT and s[1] in NUMERALS] * 10
+    benchmark(lambda: list(pipe_word2num(dictation)))
+
+
 @pytest.mark.benchmark(group='ivr_stemming')
 def test_benchmark_pipe_ord_unfold(benchmark, stems):
     benchmark(lambda: list(pipe_ord_unfold(stems)))
@@ -52,3 +71,113 @@ def test_benchmark_pipe_merge_credit_card_number(benchmark, stems):
 def test_benchmark_full_pipeline(benchmark, sentences_analysis):
     pl = partial(pipeline, pipe=compose_pipeline(*Pipeline))
     benchmark(lambda: list(pl(sentences_analysis)))
+
+
+@pytest.mark.benchmark(group='ivr_stemming')
+def test_benchmark_compiled_pipeline(benchmark, sentences_analysis):
+    pl = compile_pipeline(compose_pipeline(*Pipeline))
+    benchmark(lambda: pl(sentences_analysis))
+
+
+@pytest.mark.benchmark(group='ivr_stemming')
+def test_benchmark_pipeline_variants(benchmark, sentences_analysis):
+    variants = {
+        'full': Pipeline,
+        'no_stopwords': [p for p in Pipeline if p is not Pipeline.STOPWORDS],
+        'numbers': [Pipeline.WORD2NUM],
+    }
+    pl = pipeline_variants(variants)
+    benchmark(lambda: pl(sentences_analysis))
+
+
+@pytest.mark.benchmark(group='ivr_stemming')
+def test_benchmark_pipeline_variants_plans(benchmark, sentences_analysis):
+    variants = {
+        'full': Pipeline,
+        'no_stopwords': [p for p in Pipeline if p is not Pipeline.STOPWORDS],
+        'numbers': [Pipeline.WORD2NUM],
+    }
+    plans = {name: pipeline_plan(*stages) for name, stages in variants.items()}
+    benchmark(lambda: {name: plan(sentences_analysis) for name, plan in plans.items()})
+
+
+@pytest.mark.benchmark(group='ivr_mystem_bypass')
+@pytest.mark.parametrize('bypass', [False, True], ids=['all_tokens', 'text_tokens'])
+def test_benchmark_analyze_card_dictation(benchmark, jstem, bypass):
+    sentence = 'номер карты 4276 3800 1234 5678 , срок действия 12 / 24 , код 123'
+    benchmark(lambda: list(analyze(sentence, jstem, bypass=bypass)))
+
+
+@pytest.fixture(scope='module')
+def long_tokens(benchmark_tokens):
+    return benchmark_tokens * 50
+
+
+@pytest.mark.benchmark(group='ivr_mystem_stream')
+def test_benchmark_first_stem_analyze(benchmark, jstem, long_tokens):
+    benchmark(lambda: next(stems_gen(jstem.analyze(long_tokens))))
+
+
+@pytest.mark.benchmark(group='ivr_mystem_stream')
+def test_benchmark_first_stem_analyze_iter(benchmark, jstem, long_tokens):
+    def first_stem():
+        stream = jstem.analyze_iter(long_tokens)
+        result = next(stems_gen(stream))
+        # остаток ответа отбрасывается следующим запросом, время чтения остатка учитывается в замере
+        stream.close()
+
+        return result
+
+    benchmark(first_stem)
+
+
+@pytest.mark.benchmark(group='ivr_mystem_stream')
+def test_benchmark_stems_analyze_iter(benchmark, jstem, long_tokens):
+    benchmark(lambda: list(stems_gen(jstem.analyze_iter(long_tokens))))
+
+
+def _first_request(stemmer_ctx):
+    with stemmer_ctx as stem:
+        stem.analyze(['мама'])
+
+
+@pytest.mark.benchmark(group='ivr_mystem_startup')
+def test_benchmark_startup_jstem_ctx(benchmark):
+    benchmark.pedantic(lambda: _first_request(jstem_ctx()), rounds=10)
+
+
+@pytest.mark.benchmark(group='ivr_mystem_startup')
+def test_benchmark_startup_warm_factory(benchmark):
+    factory = WarmStemmerFactory(1)
+    factory.start()
+
+    def wait_ready():
+        while not factory.ready:
+            sleep(.01)
+
+    try:
+        benchmark.pedantic(lambda: _first_request(warm_jstem_ctx(factory)), setup=wait_ready, rounds=10)
+    finally:
+        factory.stop()
+
+
+@pytest.fixture(scope='module')
+def batch_analysis(jstem, tokenize):
+    sentences = ['перевести 5к рублей 2-го числа', 'кто этот гражданин и мама мыла раму 1ый раз'] * 500
+    return jstem.analyze_many([[t[0] for t in tokenize(s)] for s in sentences])
+
+
+@pytest.mark.benchmark(group='ivr_stem_batch')
+def test_benchmark_tuple_pipes(benchmark, batch_analysis):
+    pipe = [pipe_stopwords, pipe_kilo_postfix, pipe_ord_unfold]
+    benchmark(lambda: [list(pipeline(analysis, pipe)) for analysis in batch_analysis])
+
+
+@pytest.mark.benchmark(group='ivr_stem_batch')
+def test_benchmark_batch_pipes(benchmark, batch_analysis):
+    def run():
+        batch = batch_ord_unfold(batch_kilo_postfix(batch_stopwords(stems_batch(batch_analysis))))
+        return [list(stems) for stems in batch]
+
+    benchmark(run)
+
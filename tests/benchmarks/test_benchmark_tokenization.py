@@ -4,3 +4,9 @@ import pytest
 @pytest.mark.benchmark(group='ivr_tokenization')
 def test_benchmark_tokenize(benchmark, tokenize, benchmark_text):
     benchmark(lambda: list(tokenize(benchmark_text)))
+
+
+@pytest.mark.benchmark(group='ivr_tokenization')
+def test_benchmark_toktok_short(benchmark, tokenizer):
+    utterances = ['да', 'нет, не надо', 'переведи сто рублей маме', 'баланс карты', 'оператор']
+    benchmark(lambda: [tokenizer.tokenize(u) for u in utterances])
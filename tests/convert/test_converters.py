@@ -4,7 +4,8 @@ from contextlib import contextmanager
 
 import pytest
 
-from text_normalizer.convert import text2int, ord_unfold, is_ordfold, MONTHS, month2num
+from text_normalizer.convert import (
+    text2int, ord_unfold, is_ordfold, MONTHS, month2num, text2int_many, NumeralAutomaton, NUMERALS)
 from text_normalizer.convert._convert import _numerics
 from ..settings import TESTS_PATH
 
@@ -57,6 +58,48 @@ def test_text2int_raises(text, num, expected):
         assert text2int(*nums_list) == num
 
 
+def test_text2int_many():
+    token_lists = [text.split() for text in ['сто двадцать три', 'две сотня', 'пять десяток', '', 'первый', 'полтора']]
+
+    assert text2int_many(token_lists) == [123, 200, 50, 0, 1, 1.5]
+    assert text2int_many(iter([['один']] * 3)) == [1, 1, 1]
+
+    with pytest.raises(ValueError):
+        text2int_many([['сто'], ['сто', 'один', 'двадцать']])
+
+
+@pytest.mark.parametrize('tokens, expected', [
+    # (текст, лемма) -> результаты `feed` и `flush`
+    ([('сто', 'сто'), ('двадцать', 'двадцать'), ('три', 'три')], [(), (), (), (123,)]),
+    ([('пять', 'пять'), ('двадцать', 'двадцать'), ('шесть', 'шесть')], [(), (5,), (), (26,)]),
+    ([('двадцать', 'двадцать'), ('пятнадцать', 'пятнадцать')], [(), (20,), (15,)]),
+    ([('сто', 'сто'), ('три', 'три'), ('тройки', 'тройка')], [(), (), (100, '333'), ()]),
+    ([('три', 'три'), ('тройки', 'тройка'), ('ноль', 'ноль')], [(), ('333',), (), (0,)]),
+    ([('ноль', 'ноль'), ('восьмерка', 'восьмерка')], [(), (0,), (8,)]),
+    ([('две', 'две'), ('тысячи', 'тысячи'), ('двадцатого', 'двадцатый')], [(), (), (), (2020,)]),
+])
+def test_numeral_automaton(tokens, expected):
+    automaton = NumeralAutomaton()
+    custom = NumeralAutomaton(lambda *t: text2int(*t))
+
+    for a in (automaton, custom):
+        result = [a.feed(text, lemma, NUMERALS[lemma]) for text, lemma in tokens]
+        assert result + [a.flush()] == expected
+
+    custom.reset()
+    assert custom.count == 0 and custom.last_level == 1 and custom.flush() == ()
+
+
+def test_numeral_automaton_raises():
+    automaton = NumeralAutomaton()
+    tokens = [('тысяча', 'тысяча'), ('сто', 'сто'), ('тысяч', 'тысяч')]
+
+    assert [automaton.feed(text, lemma, NUMERALS[lemma]) for text, lemma in tokens] == [(), (), ()]
+
+    with pytest.raises(ValueError):
+        automaton.flush()
+
+
 @pytest.mark.parametrize('inp, outp', [
     ('10-ый', True),
     ('10-го', True),
@@ -1,6 +1,8 @@
+import mock
 import pytest
 
 from text_normalizer import normalization, stemming
+from text_normalizer.tokenization import TokenType, token_type
 
 
 @pytest.mark.parametrize('pipe_names, pipeline', [
@@ -21,4 +23,157 @@ def test_compose_pipeline(pipe_names, pipeline):
 
 
 def test_analyze():
-    pass
\ No newline at end of file
+    pass
+
+def test_normalize_many(jstem):
+    sentences = ['мама мыла раму', 'сто двадцать три рубля', 'папа красил окно']
+    result = list(normalization.normalize_many(sentences, jstem, batch_size=2))
+
+    assert result == [list(normalization.normalize(s, jstem)) for s in sentences]
+
+
+def test_normalize_async(jstem):
+    import asyncio
+
+    sentences = ['мама мыла раму', 'сто двадцать три рубля', 'папа красил окно']
+
+    async def run():
+        async with stemming.AsyncMystemPool(2) as pool:
+            return await asyncio.gather(*(normalization.normalize_async(s, pool) for s in sentences))
+
+    assert asyncio.run(run()) == [list(normalization.normalize(s, jstem)) for s in sentences]
+
+
+def test_normalize_pipelined(jstem):
+    sentences = ['мама мыла раму', 'сто двадцать три рубля', 'папа красил окно'] * 3
+
+    with stemming.jstem_ctx(stemming.PipelinedJsonStemmer) as stem:
+        result = list(normalization.normalize_pipelined(sentences, stem, depth=2))
+
+    assert result == [list(normalization.normalize(s, jstem)) for s in sentences]
+
+
+@pytest.mark.parametrize('sentence', [
+    'номер карты 4276 3800 1234 5678, срок 12/24',
+    'перевести 5к рублей на test@gmail.com 22.08.2020 в 12:30',
+    '1 2 3 . , !',
+    'мама мыла раму',
+    '',
+], ids=['card', 'mixed', 'no_text', 'text_only', 'empty'])
+def test_analyze_bypass(jstem, sentence):
+    """В анализатор передаются только текстовые токены, результат нормализации не меняется"""
+    import mock
+
+    with mock.patch.object(jstem, 'analyze', wraps=jstem.analyze) as analyze:
+        result = list(normalization.normalize(sentence, jstem, bypass=True))
+
+        for call in analyze.call_args_list:
+            assert all(token_type(t) == TokenType.TXT for t in call[0][0])
+
+    assert result == list(normalization.normalize(sentence, jstem, bypass=False))
+    assert normalization.analyze_many([sentence], jstem, bypass=True) == \
+        [list(normalization.analyze(sentence, jstem, bypass=True))]
+
+
+def test_normalize_stream(jstem):
+    sentence = 'сто двадцать три рубля, 22.08.2020 дата'
+
+    assert list(normalization.normalize(sentence, jstem, stream=True)) == list(normalization.normalize(sentence, jstem))
+
+
+def test_normalize_stream_first_stem(jstem):
+    """В режиме `stream` первый токен выдается до получения всего ответа анализатора"""
+    sentence = 'мама мыла раму сто двадцать три раза'
+    analysis = jstem.analyze(sentence.split())
+    received = []
+
+    def analyze_iter(tokens):
+        for d in analysis:
+            received.append(d)
+            yield d
+
+    stemmer = mock.MagicMock()
+    stemmer.analyze_iter.side_effect = analyze_iter
+    result = normalization.normalize(sentence, stemmer, stream=True)
+
+    assert next(result)[0] == 'мама'
+    assert len(received) < len(analysis)
+    assert [next(result)[0] for _ in range(2)] == ['мыла', 'раму'] and len(received) < len(analysis)
+    assert [s[0] for s in result] == ['123', 'раза']
+
+
+@pytest.mark.parametrize('fields', [('token',), ('lemma', 'token'), ('token', 'grammem')])
+def test_normalize_fields(jstem, fields):
+    sentence = 'сто двадцать три рубля, второго числа'
+    index = {f: i for i, f in enumerate(stemming.STEM_FIELDS)}
+    expected = [tuple(r[index[f]] for f in fields) for r in normalization.normalize(sentence, jstem)]
+
+    assert list(normalization.normalize(sentence, jstem, fields=fields)) == expected
+
+
+def test_normalize_bulk():
+    sentences = ['мама мыла раму', 'сто двадцать три рубля', 'мама мыла раму', 'папа красил окно'] * 3
+
+    with stemming.jstem_ctx(disambiguation=False) as stem:
+        result = list(normalization.normalize_bulk(sentences, stem, batch_size=5))
+
+        assert result == [list(normalization.normalize(s, stem)) for s in sentences]
+
+
+@pytest.mark.parametrize('pipeline', [
+    list(stemming.Pipeline),
+    [stemming.Pipeline.KILO, stemming.Pipeline.WORD2NUM, stemming.Pipeline.CCN],
+    [],
+])
+def test_normalize_bulk_batch(pipeline):
+    """Пачка обрабатывается этапами для пачки предложений, результат совпадает с обработкой каждого предложения"""
+    sentences = [
+        'мама мыла раму', 'двадцать пятого мая две тысячи первого года', 'номер 4111 1111 1111 1111',
+        'пять шесть тридцать четыре четыре восьмерки ноль один двадцать пять семь четыре пятнадцать',
+        '%5% рублей в 3-й раз', 'сто двадцать три рубля и он', ', - !',
+    ]
+
+    with stemming.jstem_ctx(disambiguation=False) as stem:
+        with mock.patch.object(stemming, 'stems_batch', wraps=stemming.stems_batch) as stems_batch:
+            result = list(normalization.normalize_bulk(sentences, stem, pipeline, batch_size=3))
+
+        assert stems_batch.call_count == 3
+        assert result == [list(normalization.normalize(s, stem, pipeline)) for s in sentences]
+
+
+def test_normalize_registered_stage(jstem):
+    """Зарегистрированный этап выполняется по наименованию в порядке передачи с проверкой ограничений этапов"""
+    stemming.register_stage(
+        'no_numbers', lambda stems: (s for s in stems if s[0][1] != TokenType.NUM), after=[stemming.Pipeline.WORD2NUM])
+
+    try:
+        result = list(normalization.normalize('сто рублей', jstem, pipeline=[stemming.Pipeline.WORD2NUM, 'no_numbers']))
+
+        # нарушение ограничений порядка не мешает выполнить этапы в порядке передачи
+        unordered = list(
+            normalization.normalize('сто рублей', jstem, pipeline=['no_numbers', stemming.Pipeline.WORD2NUM]))
+    finally:
+        stemming.unregister_stage('no_numbers')
+
+    assert [s[0] for s in result] == ['рублей']
+    assert [s[0] for s in unordered] == ['100', 'рублей']
+
+
+def test_cache_clear():
+    """Очистка кэша нормализации очищает кэш планов и вариантов пайплайна"""
+    normalization.init_cache()
+    plan = stemming.pipeline_plan(*stemming.Pipeline)
+    variants = stemming.pipeline_variants({'full': stemming.Pipeline})
+
+    normalization.cache_clear()
+
+    assert stemming.pipeline_plan(*stemming.Pipeline) is not plan
+    assert stemming.pipeline_variants({'full': stemming.Pipeline}) is not variants
+
+
+def test_normalize_variants(jstem):
+    sentence = 'сто двадцать три рубля, второго числа'
+    variants = {'full': stemming.Pipeline, 'numbers': [stemming.Pipeline.WORD2NUM], 'empty': []}
+    result = normalization.normalize_variants(sentence, jstem, variants)
+
+    assert result == {name: list(normalization.normalize(sentence, jstem, pipe)) for name, pipe in variants.items()}
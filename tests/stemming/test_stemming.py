@@ -1,12 +1,19 @@
 import json
+import logging
 import os
+import signal
+from enum import Enum
 from functools import partial
+from itertools import permutations
 from random import shuffle
+from threading import Thread
+from time import sleep
 
 import pytest
 
 from text_normalizer import stemming
 from text_normalizer.stemming import _mystem as ms
+from text_normalizer.convert import text2int
 from text_normalizer.tokenization import KILO_POSTFIX, TokenType
 from ..settings import TESTS_PATH
 
@@ -24,6 +31,15 @@ def test_convert_folded_and_full_numerics_to_numbers(inp, outp, analize):
     assert ' '.join(str(s[0][0]) for s in pl) == outp
 
 
+@pytest.mark.parametrize('inp, outp', word2num_ds.items(), ids=word2num_ds.values())
+def test_word2num_automaton_convert(inp, outp, analize):
+    """Конвертация числительных в числа автоматом с пользовательской функцией конвертации"""
+    convert = partial(stemming.pipe_word2num, convert=lambda *tokens: text2int(*tokens))
+    pl = stemming.pipeline(analize(inp), pipe=[stemming.pipe_ord_unfold, convert])
+
+    assert ' '.join(str(s[0][0]) for s in pl) == outp
+
+
 @pytest.mark.parametrize('inp, outp', [
     ('22 августа 2020', '22.08.2020'),
     ('22 января 2021', '22.01.2021'),
@@ -246,3 +262,817 @@ def test_pipe_integration(benchmark_text, analize):
         pipe=_pipe)
 
     assert list(pl(analize_result))
+
+
+def test_mystem_pool_analyze_in_multiple_threads(tokenize, jstem):
+    """Параллельный анализ в пуле стеммеров совпадает с анализом одним стеммером"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    sentences = ['мама мыла раму', 'папа красил забор', 'бабушка пекла хлеб', 'сто двадцать три рубля'] * 4
+    token_lists = [[t[0] for t in tokenize(s)] for s in sentences]
+
+    with stemming.mystem_pool_ctx(2) as pool:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            result = list(executor.map(pool.analyze, token_lists))
+
+    assert result == [jstem.analyze(tokens) for tokens in token_lists]
+
+
+def test_mystem_pool_restarts_dead_process():
+    with stemming.mystem_pool_ctx(1) as pool:
+        pool._stemmers[0]._proc.kill()
+        pool._stemmers[0]._proc.wait()
+
+        result = pool.analyze(['мама'])
+
+        assert result[0]['text'] == 'мама'
+        assert pool.restarts == 1
+
+
+def test_mystem_pool_stop_in_flight():
+    """Запрос, начатый до остановки пула, завершается без ошибки счетчиков запросов"""
+    pool = stemming.MystemPool(1)
+    pool.start()
+
+    idx, stemmers, locks, load = pool._acquire()
+    pool.stop()
+    pool._release(idx, load)
+
+    try:
+        assert pool.analyze(['мама'])[0]['text'] == 'мама'
+        assert pool._load == [0]
+    finally:
+        pool.stop()
+
+
+def test_mystem_pool_keeps_alive_process():
+    """Ошибка запроса к работающему процессу не приводит к перезапуску"""
+    with stemming.mystem_pool_ctx(1) as pool:
+        stem = pool._stemmers[0]
+
+        with pytest.raises(TypeError):
+            pool.analyze(None)
+
+        assert pool._stemmers[0] is stem and pool.restarts == 0
+        assert pool.analyze(['мама'])[0]['text'] == 'мама'
+
+
+def test_mystem_pool_invalid_size():
+    with pytest.raises(ValueError):
+        stemming.MystemPool(0)
+
+
+def test_analyze_many(tokenize, jstem):
+    """Пакетный анализ нескольких предложений за одно обращение к mystem"""
+
+    sentences = ['мама мыла раму', 'сто двадцать три', '', '22.08.2020 дата']
+    token_lists = [[t[0] for t in tokenize(s)] for s in sentences]
+
+    assert jstem.analyze_many(token_lists) == [jstem.analyze(tokens) for tokens in token_lists]
+    assert jstem.analyze_many([]) == []
+
+
+def test_cached_stemmer():
+    """В mystem отправляются только отсутствующие в кэше токены"""
+    import mock
+
+    cache = stemming.AnalysisCache(3)
+
+    with stemming.jstem_ctx(stemming.CachedJsonStemmer, cache=cache) as stem:
+        first = stem.analyze(['мама', 'мыла', 'раму', 'мама'])
+
+        assert cache.info() == stemming.CacheInfo(hits=0, misses=3, maxsize=3, currsize=3)
+
+        with mock.patch.object(stemming.JsonStemmer, 'analyze') as analyze:
+            assert stem.analyze(['раму', 'мама', 'мыла']) == [first[2], first[0], first[1]]
+            analyze.assert_not_called()
+
+        assert cache.info().hits == 3
+        assert [d['text'] for d in stem.analyze(['папа', 'мама'])] == ['папа', 'мама']
+        # самый давно использованный токен вытеснен из кэша
+        assert 'раму' not in cache and len(cache) == 3
+
+
+def test_analysis_cache_invalid_size():
+    with pytest.raises(ValueError):
+        stemming.AnalysisCache(0)
+
+
+def test_persistent_analysis_cache(tmp_path):
+    """Результаты, сохраненные одним экземпляром файлового кэша, доступны другим экземплярам"""
+    path = str(tmp_path / 'analysis.cache')
+    analysis = {'analysis': [{'lex': 'мама', 'gr': 'S,жен,од=им,ед'}], 'text': 'мама'}
+
+    writer = stemming.PersistentAnalysisCache(path, capacity=8)
+    reader = stemming.PersistentAnalysisCache(path, readonly=True)
+
+    assert reader.get('мама') is None
+    writer.update([('мама', analysis), ('мыла', {'analysis': [], 'text': 'мыла'})])
+    writer.put('мама', {'analysis': [], 'text': 'мама'})
+
+    assert reader.get('мама') == analysis
+    assert 'мыла' in reader and len(reader) == 2
+    assert reader.info() == stemming.CacheInfo(hits=1, misses=1, maxsize=6, currsize=2)
+
+    reader.put('раму', analysis)
+    assert 'раму' not in writer
+
+    # количество записей читается под блокировкой: файл может быть отображен заново другим потоком
+    sizes = []
+    counter = Thread(target=lambda: sizes.append(len(writer)))
+
+    with writer._lock:
+        counter.start()
+        counter.join(0.1)
+        assert not sizes
+
+    counter.join()
+    assert sizes == [2]
+
+    writer.close()
+    reader.close()
+
+
+def test_persistent_analysis_cache_with_stemmer(tmp_path):
+    path = str(tmp_path / 'analysis.cache')
+
+    with stemming.jstem_shared_ctx(path) as stem:
+        first = stem.analyze(['мама', 'мыла', 'раму'])
+
+    with stemming.jstem_shared_ctx(path, readonly=True) as stem:
+        assert stem.analyze(['мама', 'мыла', 'раму']) == first
+        assert stem.cache.info().hits == 3
+
+
+def test_persistent_analysis_cache_invalid_file(tmp_path):
+    path = tmp_path / 'analysis.cache'
+
+    with pytest.raises(FileNotFoundError):
+        stemming.PersistentAnalysisCache(str(path), readonly=True)
+
+    path.write_bytes(b'\0' * 64)
+
+    with pytest.raises(ValueError):
+        stemming.PersistentAnalysisCache(str(path))
+
+
+def test_async_stemmer(tokenize, jstem):
+    """Конкурентный анализ асинхронным стеммером совпадает с анализом JsonStemmer"""
+    import asyncio
+
+    token_lists = [[t[0] for t in tokenize(s)] for s in ['мама мыла раму', 'сто двадцать три', 'папа']] * 10
+
+    async def run():
+        async with stemming.ajstem_inst() as stem:
+            return await asyncio.gather(*(stem.analyze(tokens) for tokens in token_lists))
+
+    assert asyncio.run(run()) == [jstem.analyze(tokens) for tokens in token_lists]
+
+
+def test_async_stemmer_invalid_output():
+    """После ошибки чтения ответа процесс завершается, а следующий запрос запускает новый процесс"""
+    import asyncio
+    import sys
+
+    async def run():
+        stem = stemming.ajstem_inst(timeout=0)
+        cmd, stem._cmd = stem._cmd, [sys.executable, '-c', 'import sys\nfor _ in sys.stdin: print("{", flush=True)']
+
+        async with stem:
+            with pytest.raises(RuntimeError):
+                await asyncio.wait_for(stem.analyze(['мама']), 10)
+
+            await asyncio.wait([stem._reader])
+            alive, stem._cmd = stem.alive, cmd
+            result = await asyncio.wait_for(stem.analyze(['мама']), 10)
+
+            return alive, result, stem.restarts
+
+    alive, result, restarts = asyncio.run(run())
+
+    assert not alive
+    assert result[0]['text'] == 'мама'
+    assert restarts == 1
+
+
+def test_async_mystem_pool_restarts_dead_process():
+    import asyncio
+
+    async def run():
+        async with stemming.AsyncMystemPool(1) as pool:
+            pool._stemmers[0]._proc.kill()
+            await pool._stemmers[0]._proc.wait()
+            result = await pool.analyze(['мама'])
+
+            return result, pool.restarts
+
+    result, restarts = asyncio.run(run())
+
+    assert result[0]['text'] == 'мама'
+    assert restarts == 1
+
+
+def test_pipelined_stemmer(tokenize, jstem):
+    """Результаты конвейерного анализа приходят в порядке передачи запросов"""
+
+    token_lists = [[t[0] for t in tokenize(s)] for s in ['мама мыла раму', 'сто двадцать три', '', 'папа']] * 10
+
+    with stemming.jstem_ctx(stemming.PipelinedJsonStemmer, max_in_flight=4) as stem:
+        futures = [stem.submit(tokens) for tokens in token_lists[:4]]
+
+        assert stem.analyze_many(token_lists[4:]) == [jstem.analyze(tokens) for tokens in token_lists[4:]]
+        assert [f.result() for f in futures] == [jstem.analyze(tokens) for tokens in token_lists[:4]]
+        assert stem.analyze(['мама']) == jstem.analyze(['мама'])
+
+    with pytest.raises(RuntimeError):
+        stem.submit(['мама'])
+
+
+def test_stemmer_timeout_restarts_hung_process():
+    """Зависший процесс mystem перезапускается после истечения таймаута запроса"""
+
+    with stemming.jstem_ctx(timeout=0.2) as stem:
+        os.kill(stem._proc.pid, signal.SIGSTOP)
+
+        with pytest.raises(stemming.MystemTimeoutError):
+            stem.analyze(['мама'])
+
+        assert (stem.timeouts, stem.restarts) == (1, 1)
+        assert stem.analyze(['мама'])[0]['text'] == 'мама'
+
+
+def test_mystem_pool_timeout():
+    pool = stemming.MystemPool(1, factory=partial(stemming.jstem_inst, timeout=0.2))
+    pool.start()
+
+    try:
+        os.kill(pool._stemmers[0]._proc.pid, signal.SIGSTOP)
+
+        with pytest.raises(stemming.MystemTimeoutError):
+            pool.analyze(['мама'])
+
+        assert pool.timeouts == 1
+        # процесс перезапущен стеммером, а не пулом
+        assert pool.restarts == 1
+        assert pool.analyze(['мама'])[0]['text'] == 'мама'
+        assert pool.restarts == 1
+    finally:
+        pool.stop()
+
+
+def test_pipelined_stemmer_watchdog():
+    """Сторожевой поток перезапускает процесс, не ответивший вовремя, и завершившийся процесс"""
+
+    with stemming.jstem_ctx(stemming.PipelinedJsonStemmer, timeout=0.2) as stem:
+        os.kill(stem._proc.pid, signal.SIGSTOP)
+        futures = [stem.submit(['мама']), stem.submit(['папа'])]
+
+        with pytest.raises(stemming.MystemTimeoutError):
+            futures[0].result(timeout=5)
+
+        with pytest.raises(RuntimeError):
+            futures[1].result(timeout=5)
+
+        assert stem.analyze(['мама'])[0]['text'] == 'мама'
+
+        stem._proc.kill()
+        stem._proc.wait()
+
+        while stem.restarts < 2:
+            sleep(.01)
+
+        assert stem.analyze(['папа'])[0]['text'] == 'папа'
+        assert (stem.timeouts, stem.restarts) == (1, 2)
+
+
+def test_async_stemmer_timeout():
+    import asyncio
+
+    async def run():
+        async with stemming.ajstem_inst(timeout=0.2) as stem:
+            os.kill(stem._proc.pid, signal.SIGSTOP)
+
+            with pytest.raises(stemming.MystemTimeoutError):
+                await stem.analyze(['мама'])
+
+            result = await stem.analyze(['мама'])
+
+            return result, stem.timeouts, stem.restarts
+
+    result, timeouts, restarts = asyncio.run(run())
+
+    assert result[0]['text'] == 'мама'
+    assert (timeouts, restarts) == (1, 1)
+
+
+def test_analyze_iter(tokenize, jstem, benchmark_text):
+    """Ответ mystem разбирается по мере поступления, результат совпадает с `analyze`"""
+    tokens = [t[0] for t in tokenize(benchmark_text)]
+
+    assert list(jstem.analyze_iter(tokens)) == jstem.analyze(tokens)
+    assert list(jstem.analyze_iter([])) == []
+    assert list(jstem.analyze_iter(['"', '\\', '{}', ']'])) == jstem.analyze(['"', '\\', '{}', ']'])
+
+
+def test_analyze_iter_not_exhausted(jstem):
+    """Непрочитанный остаток ответа отбрасывается следующим запросом"""
+    stream = jstem.analyze_iter(['мама', 'мыла', 'раму'])
+
+    assert next(stream)['text'] == 'мама'
+    assert jstem.analyze(['папа'])[0]['text'] == 'папа'
+
+    with pytest.raises(RuntimeError):
+        list(stream)
+
+    jstem.analyze_iter(['мама'])
+
+    assert jstem.analyze(['папа'])[0]['text'] == 'папа'
+
+
+def test_analyze_iter_interface():
+    stem = stemming.LexiconStemmer(stemming.Lexicon())
+
+    assert list(stem.analyze_iter(['мама'])) == stem.analyze(['мама'])
+
+
+def test_analyze_unique(tokenize):
+    """Каждая словоформа анализируется один раз, результат совпадает с анализом каждого списка"""
+    import mock
+
+    sentences = ['мама мыла раму', 'папа мыл раму', 'мама', '', 'сто двадцать три, сто двадцать']
+    token_lists = [[t[0] for t in tokenize(s)] for s in sentences]
+
+    with stemming.jstem_ctx(disambiguation=False) as stem:
+        with mock.patch.object(stem, 'analyze', wraps=stem.analyze) as analyze:
+            result, info = stemming.analyze_unique(token_lists, stem, chunk_size=4)
+
+            assert sum(len(call[0][0]) for call in analyze.call_args_list) == info.unique
+
+        assert result == [stem.analyze(tokens) for tokens in token_lists]
+
+    assert info == stemming.DedupInfo(tokens=13, unique=9)
+    assert info.ratio == pytest.approx(13 / 9)
+    assert stemming.analyze_unique([], stem) == ([], stemming.DedupInfo(0, 0))
+
+
+def test_analyze_unique_disambiguation(tokenize, jstem):
+    """Анализатор со снятием омонимии анализирует каждый список целиком"""
+    token_lists = [[t[0] for t in tokenize(s)] for s in ['мама мыла раму', 'мама', '']]
+    result, info = stemming.analyze_unique(iter(token_lists), jstem)
+
+    assert result == jstem.analyze_many(token_lists)
+    assert info == stemming.DedupInfo(tokens=4, unique=4)
+
+
+def _wait_ready(factory, count):
+    for _ in range(500):
+        if factory.ready >= count:
+            return
+        sleep(.01)
+
+    raise AssertionError('Spare stemmers were not started')
+
+
+def test_warm_stemmer_factory():
+    """Фабрика выдает запущенные стеммеры и запускает новые взамен выданных"""
+    factory = stemming.WarmStemmerFactory(2)
+    factory.start()
+
+    try:
+        _wait_ready(factory, 2)
+
+        with stemming.warm_jstem_ctx(factory) as stem:
+            assert ms._is_alive(stem)
+            assert stem.analyze(['мама'])[0]['text'] == 'мама'
+
+        _wait_ready(factory, 2)
+
+        # завершившийся процесс не выдается
+        factory._spares.queue[0]._proc.kill()
+        factory._spares.queue[0]._proc.wait()
+
+        with stemming.warm_jstem_ctx(factory) as stem:
+            assert ms._is_alive(stem)
+
+        assert factory.created >= 3
+    finally:
+        factory.stop()
+
+    assert factory.ready == 0
+
+    with stemming.warm_jstem_ctx(factory) as stem:
+        assert stem.analyze(['мама'])[0]['text'] == 'мама'
+
+
+def test_warm_stemmer_factory_no_wait():
+    """Без готовых стеммеров стеммер запускается сразу, не дожидаясь фонового потока"""
+    import mock
+
+    factory = stemming.WarmStemmerFactory(1)
+    factory._filler = mock.MagicMock()
+
+    try:
+        with mock.patch.object(factory._spares, 'get', wraps=factory._spares.get) as get:
+            with stemming.warm_jstem_ctx(factory) as stem:
+                assert stem.analyze(['мама'])[0]['text'] == 'мама'
+
+        get.assert_called_once_with(timeout=stemming.MYSTEM_SPARE_WAIT)
+        assert stemming.MYSTEM_SPARE_WAIT < 1 and factory.created == 1
+    finally:
+        factory._filler = None
+
+
+def test_warm_stemmer_factory_invalid_spares():
+    with pytest.raises(ValueError):
+        stemming.WarmStemmerFactory(0)
+
+
+def test_stems_gen_shared_grammem():
+    """Токены с одинаковой строкой граммем получают общий неизменяемый словарь граммем"""
+    import pickle
+
+    gr = 'S,жен,неод=им,ед'
+    stems = list(stemming.stems_gen([
+        {'analysis': [{'lex': 'мама', 'gr': gr}], 'text': 'мама'},
+        {'analysis': [{'lex': 'тысяча', 'gr': gr}], 'text': 'тысяча'},
+        {'analysis': [{'lex': 'рама', 'gr': gr}], 'text': 'раму'},
+        {'analysis': [{'lex': 'единица', 'gr': gr}], 'text': 'единица'},
+    ]))
+
+    assert stems[0][2] is stems[2][2]
+    assert stems[1][2] is stems[3][2]
+    assert stems[0][2][ms.POS] == ms.POS.S
+    assert stems[1][2][ms.POS] == ms.POS.NUM
+    assert stems[1][2] == {**stems[0][2], ms.POS: ms.POS.NUM}
+
+    with pytest.raises(TypeError):
+        stems[0][2][ms.POS] = ms.POS.NUM
+
+    assert pickle.loads(pickle.dumps(stems[1][2])) == stems[1][2]
+
+
+@pytest.mark.parametrize('gr, lemma, pos, case', [
+    ('S,жен,од=им,ед', 'мама', ms.POS.S, ms.Case.NOM),
+    ('S,жен,неод=им,ед', 'тысяча', ms.POS.NUM, ms.Case.NOM),
+    ('NUM=(вин|им)', 'сто', ms.POS.NUM, None),
+    ('ANUM=им,ед,полн,муж', 'второй', ms.POS.ANUM, ms.Case.NOM),
+    ('V,несов,нп=непрош,ед,изъяв,3-л', 'идти', ms.POS.V, None),
+])
+def test_grammem_mask(gr, lemma, pos, case):
+    """Битовая маска граммем и восстановление словаря граммем по маске"""
+    _, _, grammem, _ = next(stemming.stems_gen([{'analysis': [{'lex': lemma, 'gr': gr}], 'text': lemma}]))
+    mask = stemming.grammem_mask(grammem)
+
+    assert mask == grammem.mask == stemming.grammem_mask(dict(grammem))
+    assert stemming.mask_grammem(mask) == grammem
+    assert stemming.mask_value(mask, ms.POS) is pos
+    assert stemming.mask_value(mask, ms.Case) is case
+    assert stemming.has_grammem(mask, pos)
+    assert stemming.is_num(mask) == (pos is ms.POS.NUM)
+    assert stemming.is_numeral(mask) == (pos in (ms.POS.NUM, ms.POS.ANUM))
+    assert mask < 2 ** 63
+
+    changed = grammem.replace(ms.Case, ms.Case.LOC)
+    assert stemming.mask_grammem(changed.mask) == changed
+
+    parsed = {k: v for k, v in grammem.items() if isinstance(v, Enum)}
+    assert stemming.mask_grammem(stemming.grammem_mask(parsed)) == parsed
+
+    assert stemming.grammem_mask(None) == 0
+    assert stemming.mask_grammem(0) is None
+
+
+def test_grammem_strings_limit(monkeypatch):
+    """Таблица строк граммем не растет больше `MYSTEM_GRAMMEM_CACHE_SIZE` строк, а маска помещается в int64"""
+    assert ms._GRAMMEM_STRINGS_SIZE <= ms._GRAMMEM_ID_MAX
+    assert (ms._GRAMMEM_ID_MAX << ms._GRAMMEM_ID_SHIFT | (1 << ms._GRAMMEM_ID_SHIFT) - 1) < 2 ** 63
+
+    monkeypatch.setattr(ms, '_GRAMMEM_STRINGS_SIZE', len(ms._grammem_strings) - 1)
+    size = len(ms._grammem_strings)
+
+    _, _, grammem, _ = next(stemming.stems_gen([{'analysis': [{'lex': 'мама', 'gr': 'S,жен,од=вин,ед,вводн'}],
+                                                  'text': 'маму'}]))
+    mask = stemming.grammem_mask(grammem)
+
+    assert len(ms._grammem_strings) == size
+    assert mask >> ms._GRAMMEM_ID_SHIFT == 0
+    assert stemming.mask_value(mask, ms.POS) is ms.POS.S
+    assert stemming.mask_value(mask, ms.Case) is ms.Case.ACC
+    assert stemming.mask_grammem(mask) == {k: v for k, v in grammem.items() if k in ms._mask_fields}
+
+
+def test_stems_gen_lazy():
+    """Отложенный разбор граммем совпадает с обычным и не выполняется без обращения к граммемам"""
+    analysis = [
+        {'analysis': [{'lex': 'тысяча', 'gr': 'S,жен,неод=им,ед'}], 'text': 'тысяча'},
+        {'analysis': [{'lex': 'рама', 'gr': 'S,жен,неод=вин,ед'}], 'text': 'раму'},
+        {'analysis': [], 'text': '1'},
+    ]
+    stemming.cache_clear()
+    lazy = list(stemming.stems_gen(analysis, lazy=True))
+
+    assert [s[1] for s in lazy] == ['тысяча', 'рама', '']
+    assert ms._grammem.cache_info().currsize == 0
+
+    eager = list(stemming.stems_gen(analysis))
+
+    assert lazy == eager
+    assert lazy[0][2][ms.POS] is ms.POS.NUM
+    assert stemming.grammem_mask(lazy[0][2]) == eager[0][2].mask
+    assert lazy[0][2].decode() is eager[0][2]
+    assert list(map(stemming.to_tuple, lazy)) == list(map(stemming.to_tuple, eager))
+
+
+@pytest.mark.parametrize('fmt, fields, expected', [
+    ('tuple', ('token',), ('раму',)),
+    ('tuple', ('lemma', 'token'), ('рама', 'раму')),
+    ('dict', ('token', 'qual'), {'token': 'раму', 'qual': True}),
+    ('dict', ('grammem',), {'grammem': {'pos': 'S', 'gender': 'жен', 'animacy': 'неод',
+                                        'case': 'вин', 'number': 'ед'}}),
+])
+def test_stem_converter(fmt, fields, expected):
+    stem = next(stemming.stems_gen([{'analysis': [{'lex': 'рама', 'gr': 'S,жен,неод=вин,ед'}], 'text': 'раму'}]))
+
+    assert stemming.stem_converter(fmt, fields)(stem) == expected
+    assert stemming.stem_converter(fmt) is (stemming.to_tuple if fmt == 'tuple' else stemming.to_dict)
+
+    with pytest.raises(ValueError):
+        stemming.stem_converter(fmt, ('token', 'text'))
+
+    with pytest.raises(ValueError):
+        stemming.stem_converter('json', fields)
+
+
+def test_lexicon_save_load(tmp_path):
+    lexicon = stemming.Lexicon()
+    lexicon.add('Мама', {'lex': 'мама', 'gr': 'S,жен,од=им,ед'})
+    lexicon.add('доширак', {'lex': 'доширак', 'qual': 'bastard', 'gr': 'S,муж,неод=им,ед'})
+    lexicon.add('папа', {'lex': 'папа', 'gr': 'S,жен,од=им,ед'})
+
+    path = str(tmp_path / 'lexicon.gz')
+    lexicon.save(path)
+    loaded = stemming.Lexicon.load(path)
+
+    # словоформы хранятся с учетом регистра
+    assert len(loaded) == 3 and 'Мама' in loaded and 'мама' not in loaded
+    assert loaded.lookup('Мама') == {'lex': 'мама', 'gr': 'S,жен,од=им,ед'}
+    assert loaded.lookup('доширак') == {'lex': 'доширак', 'qual': 'bastard', 'gr': 'S,муж,неод=им,ед'}
+    assert loaded.lookup('раму') is None
+
+
+def test_lexicon_stemmer(jstem):
+    """Списки токенов из лексикона анализируются без обращения к mystem, остальные - mystem целиком"""
+    import mock
+
+    with stemming.jstem_ctx(disambiguation=False) as stem:
+        lexicon = stemming.build_lexicon(stem, ['мама', 'сто', 'двадцать', 'сто'], chunk_size=2)
+        fallback = mock.MagicMock(wraps=stem)
+        lexicon_stem = stemming.LexiconStemmer(lexicon, fallback=fallback)
+        known, tokens = ['мама', 'сто', 'двадцать'], ['Мама', 'мыла', 'раму', 'сто', 'двадцать', '5', '.']
+
+        assert len(lexicon) == 3 and 'Мама' not in lexicon
+        assert lexicon_stem.analyze_many([known, tokens]) == [stem.analyze(known), stem.analyze(tokens)]
+        fallback.analyze_many.assert_called_once_with([tokens])
+
+    assert stemming.LexiconStemmer(lexicon).analyze(['мама', 'раму'])[1] == {'analysis': [], 'text': 'раму'}
+
+
+def test_lexicon_stemmer_resplit():
+    """Результат резервного анализатора для списка токенов не сопоставляется с отдельными токенами"""
+    class Fallback(stemming.iStemmer):
+        def analyze(self, tokens):
+            # анализатор объединяет токены через дефис
+            return [{'analysis': [], 'text': '-'.join(tokens)}]
+
+    lexicon = stemming.Lexicon()
+    lexicon.add('мама', {'lex': 'мама', 'gr': 'S,жен,од=им,ед'})
+    lexicon_stem = stemming.LexiconStemmer(lexicon, fallback=Fallback())
+
+    assert lexicon_stem.analyze_many([['мама', 'кто', 'то'], iter(['где', 'то'])]) == [
+        [{'analysis': [], 'text': 'мама-кто-то'}], [{'analysis': [], 'text': 'где-то'}]]
+
+
+def test_fixlist_forms():
+    forms = list(stemming.fixlist_forms())
+
+    assert {'ип', 'лям', 'ляма'} <= set(forms) and len(forms) == len(set(forms))
+
+
+@pytest.mark.parametrize('pipe, batch_pipe', [
+    ([stemming.pipe_stopwords], [stemming.batch_stopwords]),
+    ([stemming.pipe_kilo_postfix], [stemming.batch_kilo_postfix]),
+    ([stemming.pipe_ord_unfold], [stemming.batch_ord_unfold]),
+    ([stemming.pipe_stopwords, stemming.pipe_kilo_postfix, stemming.pipe_ord_unfold],
+     [stemming.batch_stopwords, stemming.batch_kilo_postfix, stemming.batch_ord_unfold]),
+    ([stemming.pipe_word2num], [stemming.batch_word2num]),
+    ([stemming.pipe_word2num, stemming.pipe_makedate], [stemming.batch_word2num, stemming.batch_makedate]),
+    ([stemming.pipe_merge_ccn], [stemming.batch_merge_ccn]),
+    ([stemming.pipe_word2num, stemming.pipe_merge_ccn], [stemming.batch_word2num, stemming.batch_merge_ccn]),
+])
+def test_stem_batch_pipes(jstem, tokenize, pipe, batch_pipe):
+    """Этапы обработки пачки дают тот же результат, что и этапы пайплайна для каждого предложения"""
+    sentences = ['кто этот гражданин', 'перевести 5к рублей 2-го числа', 'и', 'мама мыла раму 1ый раз', '',
+                 'двадцать второе января две тысячи двадцатого года', 'сто рублей', 'дата 22.08.2020', '22 января 2020',
+                 'карта 4111 1111 1111 1111', 'пять шесть тридцать четыре четыре восьмерки ноль один двадцать пять']
+    analysis = jstem.analyze_many([[t[0] for t in tokenize(s)] for s in sentences])
+    batch = stemming.stems_batch(analysis)
+
+    for func in batch_pipe:
+        batch = func(batch)
+
+    assert len(batch) == len(sentences)
+    assert [list(stems) for stems in batch] == [list(stemming.pipeline(a, pipe)) for a in analysis]
+    assert list(batch.to_tuples()) == [list(map(stemming.to_tuple, stemming.pipeline(a, pipe))) for a in analysis]
+    # числовые леммы хранятся в словаре строками
+    assert all(type(word) is str for word in batch.words)
+
+
+def test_vocabulary(monkeypatch):
+    vocabulary = stemming.Vocabulary()
+    word = ''.join(['ма', 'ма'])
+
+    assert vocabulary.id('') == 0
+    assert vocabulary.get('мама') is None
+    assert vocabulary.intern(word) is vocabulary.intern('мама') is vocabulary[vocabulary.id('мама')]
+    assert vocabulary.id('мама') == len(vocabulary) - 1 and 'мама' in vocabulary
+    assert vocabulary.get('тысяча') in vocabulary.numeral_ids
+    assert vocabulary.get('январь') in vocabulary.month_ids
+    assert vocabulary.get('и') in vocabulary.stopword_ids
+    assert vocabulary.ids(['и', 'мама', 'папа']) == {vocabulary.get('и'), vocabulary.get('мама')}
+
+    shared = stemming.get_vocabulary()
+    assert stemming.get_vocabulary() is shared
+
+    monkeypatch.setattr('text_normalizer.stemming._vocabulary.MYSTEM_VOCABULARY_SIZE', len(shared) - 1)
+    assert stemming.get_vocabulary() is not shared
+
+
+@pytest.mark.parametrize('fmt', ['tuple', 'dict'])
+@pytest.mark.parametrize('fields', [stemming.STEM_FIELDS, ('token',), ('qual', 'grammem', 'lemma')])
+@pytest.mark.parametrize('lazy', [False, True])
+def test_stem_serializer(analize, fmt, fields, lazy):
+    """Сериализация результатов нормализации совпадает с json.dumps результатов конвертации"""
+    analysis = analize('сто двадцать "три" рубля, 22.08.2020 мама мыла раму')
+    pipe = [stemming.pipe_word2num, stemming.pipe_makedate]
+    converter = stemming.stem_converter(fmt, fields)
+    expected = [json.dumps(converter(s), ensure_ascii=False) for s in stemming.pipeline(analysis, pipe)]
+    serializer = stemming.StemSerializer(fmt, fields)
+
+    for _ in range(2):
+        assert serializer.array(stemming.pipeline(analysis, pipe, lazy)).decode() == f'[{", ".join(expected)}]'
+        assert serializer.lines(stemming.pipeline(analysis, pipe, lazy)).decode() == ''.join(
+            f'{line}\n' for line in expected)
+
+    assert serializer.array([]) == b'[]' and serializer.lines([]) == b''
+
+
+def test_compile_pipeline(analize, benchmark_text):
+    """Собранный в один проход пайплайн дает тот же результат, что и цепочка этапов, при любом порядке этапов"""
+    sentences = [
+        benchmark_text,
+        'номер карты 4276 3800 1234 5678 и один один два четыре четыре нуля сто двадцать восемь один пятнадцать',
+        'двадцать второе марта две тысячи двадцатого года 22.08.2020 в 3х отделениях 5к рублей',
+        *word2num_ds,
+    ]
+    analysis = [analize(s) for s in sentences]
+    pipes = [stemming.pipe_word2num, stemming.pipe_makedate, stemming.pipe_ord_unfold,
+             stemming.pipe_kilo_postfix, stemming.pipe_merge_ccn, stemming.pipe_stopwords]
+
+    for pipe in permutations(pipes):
+        pl = stemming.compile_pipeline(pipe)
+
+        for a in analysis:
+            assert pl(a) == list(stemming.pipeline(a, pipe)) == list(pl.stream(a)), pipe
+
+    # этапы без однопроходной реализации выполняются цепочкой генераторов
+    pipe = [stemming.pipe_word2num, partial(stemming.pipe_word2num, convert=lambda *n: 0), stemming.pipe_stopwords]
+    pl = stemming.compile_pipeline(pipe)
+
+    assert pl.pipe[1:] == pl._rest
+    assert pl(analysis[1], lazy=True) == list(stemming.pipeline(analysis[1], pipe, lazy=True))
+    assert list(pl.stream(analysis[1], lazy=True)) == pl(analysis[1], lazy=True)
+    assert stemming.compile_pipeline()(analysis[0]) == list(stemming.stems_gen(analysis[0]))
+
+
+def test_pipeline_plan(caplog):
+    """План выполнения пайплайна сохраняет порядок этапов и предупреждает о нарушении ограничений порядка"""
+    Pipeline = stemming.Pipeline
+    plan = stemming.pipeline_plan(Pipeline.WORD2NUM, Pipeline.STOPWORDS, Pipeline.MAKE_DATE)
+
+    assert plan.names == ('word2num', 'stopwords', 'makedate')
+    assert plan.pipe == (stemming.pipe_word2num, stemming.pipe_stopwords, stemming.pipe_makedate)
+    assert plan is stemming.pipeline_plan('word2num', Pipeline.STOPWORDS, Pipeline.MAKE_DATE, Pipeline.WORD2NUM)
+    assert stemming.pipeline_plan(Pipeline.KILO, Pipeline.WORD2NUM).names == ('kilo_postfix', 'word2num')
+    assert stemming.pipeline_plan(*Pipeline).pipe == tuple(stemming.get_stage(p).func for p in Pipeline)
+    assert stemming.pipeline_plan().names == ()
+
+    with pytest.raises(ValueError):
+        stemming.pipeline_plan(Pipeline.WORD2NUM, 'unknown')
+
+    with caplog.at_level(logging.WARNING, logger='rtn'):
+        assert stemming.pipeline_plan(Pipeline.STOPWORDS, Pipeline.WORD2NUM).names == ('stopwords', 'word2num')
+
+    assert 'stopwords' in caplog.text
+
+    with pytest.raises(ValueError):
+        stemming.register_stage(Pipeline.WORD2NUM, stemming.pipe_word2num)
+
+
+def test_pipeline_plan_token_types(analize):
+    """Этапы, которые не обрабатывают ни один тип токенов предложения, пропускаются"""
+    Pipeline = stemming.Pipeline
+    plan = stemming.pipeline_plan(*Pipeline)
+
+    assert plan.active([TokenType.PUNKT]) == ()
+    assert [s.name for s in plan.active([TokenType.NUM])] == ['makedate', 'merge_ccn']
+    assert plan.active([TokenType.TXT]) == plan.stages
+    assert stemming.get_stage(Pipeline.WORD2NUM).output_types == {TokenType.NUM}
+
+    for text in ('сто двадцать три рубля', '4111 1111 1111 1111', '25.05.2001', ', - !', ''):
+        analysis = analize(text)
+        assert plan(analysis) == list(stemming.pipeline(analysis, plan.pipe)) == list(plan.stream(analysis)), text
+
+    assert plan.by_types[frozenset([TokenType.PUNKT])].pipe == ()
+
+    # по-умолчанию этап обрабатывает токены всех типов
+    stemming.register_stage('any', lambda stems: stems)
+
+    try:
+        assert stemming.get_stage('any').token_types == set(TokenType)
+        assert [s.name for s in stemming.pipeline_plan(Pipeline.WORD2NUM, 'any').active([TokenType.PUNKT])] == ['any']
+    finally:
+        stemming.unregister_stage('any')
+
+
+def test_register_stage(analize, caplog):
+    """Этапы других пакетов регистрируются без соглашения об именовании функций"""
+    Pipeline = stemming.Pipeline
+
+    @stemming.register_stage('upper', after=[Pipeline.WORD2NUM], before=['lower'])
+    def upper(stems):
+        for (text, type_), lemma, grammem, qual in stems:
+            yield (str(text).upper(), type_), lemma, grammem, qual
+
+    stemming.register_stage('lower', lambda stems: stems, before=['upper'])
+
+    try:
+        analysis = analize('сто двадцать три рубля')
+        plan = stemming.pipeline_plan(Pipeline.WORD2NUM, 'upper')
+
+        assert plan.names == ('word2num', 'upper') and stemming.get_stage('upper').func is upper
+        assert plan(analysis) == list(stemming.pipeline(analysis, [stemming.pipe_word2num, upper]))
+        assert [s[0][0] for s in plan(analysis)] == ['123', 'РУБЛЯ']
+        # у этапа нет функции для пачки предложений
+        assert plan.batch_pipe is None and stemming.pipeline_plan(Pipeline.WORD2NUM).batch_pipe == (
+            stemming.batch_word2num,)
+
+        with pytest.raises(ValueError, match='upper'):
+            plan.batch(stemming.stems_batch([analysis]))
+
+        with caplog.at_level(logging.WARNING, logger='rtn'):
+            assert stemming.pipeline_plan('upper', 'lower').names == ('upper', 'lower')
+            assert stemming.pipeline_plan('upper', Pipeline.WORD2NUM).names == ('upper', 'word2num')
+
+        assert caplog.text.count('violates ordering constraints') == 2
+    finally:
+        stemming.unregister_stage('upper')
+        stemming.unregister_stage('lower')
+
+    with pytest.raises(ValueError):
+        stemming.pipeline_plan('upper')
+
+
+def test_pipeline_variants(analize):
+    """Варианты пайплайна совпадают с результатами их планов, а общие начальные этапы выполняются один раз"""
+    Pipeline = stemming.Pipeline
+    analysis = analize('двадцать пятого мая две тысячи первого года и сто рублей')
+    variants = stemming.pipeline_variants({
+        'full': Pipeline,
+        'no_stopwords': set(Pipeline) - {Pipeline.STOPWORDS},
+        'no_date': set(Pipeline) - {Pipeline.MAKE_DATE},
+        'empty': [],
+    })
+    calls = []
+    segment = variants._root.children[0].segment
+    process, segment.process = segment.process, lambda stems: calls.append(1) or process(stems)
+
+    try:
+        result = variants(analysis)
+    finally:
+        del segment.process
+
+    assert calls == [1]
+    assert list(result) == ['full', 'no_stopwords', 'no_date', 'empty'] == list(variants.names)
+    assert all(result[name] == plan(analysis) for name, plan in variants.plans.items())
+    assert result['empty'] == list(stemming.stems_gen(analysis))
+    assert stemming.pipeline_variants({})(analysis) == {}
+
+    with pytest.raises(ValueError):
+        stemming.pipeline_variants({'unknown': ['unknown']})
+
+    # этапы, переданные последовательностью, выполняются в порядке передачи
+    ordered = stemming.pipeline_variants({'kilo': [Pipeline.KILO, Pipeline.WORD2NUM], 'set': {Pipeline.KILO}})
+    assert ordered.plans['kilo'].names == ('kilo_postfix', 'word2num')
+
+    invalid = stemming.pipeline_variants({'invalid': [Pipeline.STOPWORDS, Pipeline.WORD2NUM]})
+    assert invalid.plans['invalid'].names == ('stopwords', 'word2num')
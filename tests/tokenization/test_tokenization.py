@@ -1,15 +1,20 @@
 import json
 import os
+import random
 
 import pytest
 
 from text_normalizer.config import PipelineConfigType, load_conf
-from text_normalizer.tokenization import token_type, to_token, TokenType, replace_bigrams
+from text_normalizer.tokenization import token_type, to_token, TokenType, replace_bigrams, SynonymMatcher, get_tokenizer
 from ..settings import TESTS_PATH
 
 with open(os.path.join(TESTS_PATH, 'tokenization/data/sentences.json'), encoding='utf=8') as f:
     sentences = json.load(f)
 
+# фрагменты строк, на которые реагируют выражения токенизатора
+_fuzz_alphabet = list("аб вг кkд 0123456789 ٣ -–—«»\"'’`.,،:;/\\?!&|\t\xa0%()[]{}“‘„‚‹「『$€=…№\n") + [
+    '  ', ' - ', '10:30', '12:00 PM', '5к', 'http://a.b/c', ' / ', '...', '--', ',,', 'пин-код', 'б/с', '3-ндфл']
+
 
 @pytest.mark.parametrize('inp, outp', [
     ('мама', TokenType.TXT),
@@ -82,3 +87,50 @@ def test_replace_synonyms(inp, outp, tokenize):
     tokens = tokenize(inp)
 
     assert list(replace_bigrams(tokens)) == outp
+
+
+@pytest.mark.parametrize('inp, outp', [
+    ('а б в г', ['абв', 'г']),
+    ('а б г', ['аб', 'г']),
+    ('а в', ['а', 'в']),
+    ('б в а', ['б', 'в', 'а']),
+    ('а б а б в', ['аб', 'абв']),
+    ('а а б', ['а', 'аб']),
+    ('отпуск б/с', ['отпуск без сохранения']),
+])
+def test_synonym_matcher(inp, outp, tokenize):
+    matcher = SynonymMatcher({'а б': 'аб', 'а б в': 'абв', 'отпуск б/с': 'отпуск без сохранения'}, get_tokenizer())
+
+    assert [t[0] for t in matcher.replace(tokenize(inp))] == outp
+
+
+def test_synonym_matcher_streaming():
+    matcher = SynonymMatcher({'а б в': 'абв'})
+    tokens = iter([('х', TokenType.TXT), ('а', TokenType.TXT), ('б', TokenType.TXT), ('в', TokenType.NUM)])
+    replaced = matcher.replace(tokens)
+
+    # токены, которые не могут начинать фразу, выдаются без ожидания следующих токенов
+    assert next(replaced) == ('х', TokenType.TXT)
+    assert next(replaced) == ('абв', TokenType.NUM)
+    assert next(tokens, None) is None
+
+
+def _fuzz_corpus(size, seed=0):
+    rnd = random.Random(seed)
+    return [''.join(rnd.choice(_fuzz_alphabet) for _ in range(rnd.randint(0, 30))) for _ in range(size)]
+
+
+@pytest.mark.parametrize('corpus', [
+    list(sentences),
+    list(load_conf(PipelineConfigType.SYNONIMS)),
+    _fuzz_corpus(10000),
+], ids=['sentences', 'synonyms', 'fuzz'])
+def test_toktok_passes(corpus, tokenizer):
+    """Пропуск проходов токенизатора не меняет результат последовательного применения всех выражений"""
+    def tokenize(text):
+        for regexp, substitution in tokenizer._regexes:
+            text = regexp.sub(substitution, text)
+
+        return text.split()
+
+    assert [tokenizer.tokenize(text) for text in corpus] == [tokenize(text) for text in corpus]